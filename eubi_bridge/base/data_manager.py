@@ -14,8 +14,10 @@ from typing import Union
 
 from eubi_bridge.ngff.multiscales import Pyramid
 from eubi_bridge.ngff.defaults import unit_map, scale_map, default_axes
+from eubi_bridge.utils.storage import get_store_url, write_store_bytes, resolve_store
+from eubi_bridge.utils.metadata_cache import get_metadata_cache
 from eubi_bridge.utils.convenience import sensitive_glob, is_zarr_group, is_zarr_array, take_filepaths, autocompute_chunk_shape
-from eubi_bridge.base.readers import read_metadata_via_bioio_bioformats, read_metadata_via_extension, read_metadata_via_bfio
+from eubi_bridge.base.readers import read_ome_metadata
 
 
 def abbreviate_units(measure: str) -> str:
@@ -255,31 +257,12 @@ class PFFImageMeta:
     def __init__(self,
                  path,
                  series,
-                 meta_reader = "bioio"
+                 meta_reader = "bioio",
+                 omemeta = None
                  ):
-        if path.endswith('ome') or path.endswith('xml'):
-            from ome_types import OME
-            omemeta = OME().from_xml(path)
-        else:
-            if meta_reader == 'bioio':
-                # Try to read the metadata via bioio
-                try:
-                    omemeta = read_metadata_via_extension(path, series = series)
-                except:
-                    # If not found, try to read the metadata via bioformats
-                    omemeta = read_metadata_via_bioio_bioformats(path, series = series)
-            elif meta_reader == 'bfio':
-                try:
-                    omemeta = read_metadata_via_bfio(path) # don't pass series, will be handled afterwards
-                except:
-                    # If not found, try to read the metadata via bioformats
-                    omemeta = read_metadata_via_bioio_bioformats(path, series = series)
-            else:
-                raise ValueError(f"Unsupported metadata reader: {meta_reader}")
-        if series is None:
-            series = 0
-        images = [omemeta.images[series]]
-        omemeta.images = images
+        if omemeta is None:
+            omemeta = read_ome_metadata(path, series, meta_reader)
+        # Otherwise the given metadata, e.g. from the cache, already holds the selected series only.
         self.omemeta = omemeta
         self.pixels = self.omemeta.images[0].pixels
         missing_fields = self.essential_omexml_fields - self.pixels.model_fields_set
@@ -398,6 +381,7 @@ class ArrayManager:
                  path: Union[str, Path] = None,
                  series: int = None,
                  metadata_reader='bfio',  # bfio or aicsimageio
+                 omemeta=None,
                  **kwargs
                  ):
         self.path = path
@@ -418,7 +402,13 @@ class ArrayManager:
             if is_zarr_group(path):
                 self.img = NGFFImageMeta(self.path)
             else:
-                self.img = PFFImageMeta(self.path, self.series, self._meta_reader)
+                cache = get_metadata_cache()
+                cached = None if cache is None else cache.get(self.path, self.series, self._meta_reader)
+                # Metadata read up front, e.g. by the metadata service, is cached like freshly read metadata.
+                self.img = PFFImageMeta(self.path, self.series, self._meta_reader,
+                                        omemeta = cached if cached is not None else omemeta)
+                if cache is not None and cached is None:
+                    cache.put(self.path, self.img.omemeta, self.series, self._meta_reader)
 
         self.axes = self.img.get_axes()
         self.array = None
@@ -640,7 +630,7 @@ class ArrayManager:
             # If OME-XML exists in the pyramid, update it.
             # Otherwise create a new ome-xml only if create_omexml_if_not_exists is True
             # Otherwise do not create a new ome-xml
-            self.save_omexml(self.pyr.gr.store.root, overwrite=True)
+            self.save_omexml(get_store_url(self.pyr.gr), overwrite=True)
         self.pyr.meta.save_changes()
 
     def create_omemeta(self):
@@ -670,13 +660,11 @@ class ArrayManager:
                     overwrite = False
                     ):
         assert self.omemeta is not None, f"No ome-xml exists."
-        gr = zarr.group(base_path)
+        gr = zarr.group(resolve_store(base_path))
         gr.create_group('OME', overwrite = overwrite)
 
-        path = os.path.join(gr.store.root, 'OME/METADATA.ome.xml')
-
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(self.omemeta.to_xml())
+        # Written through the store, which may be local or an object store.
+        write_store_bytes(gr, 'OME/METADATA.ome.xml', self.omemeta.to_xml().encode('utf-8'))
 
         if gr.info._zarr_format == 2:
             gr['OME'].attrs["series"] = [self._seriesattrs]
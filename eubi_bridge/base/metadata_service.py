@@ -0,0 +1,244 @@
+import atexit, itertools, multiprocessing, queue, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from eubi_bridge.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_METADATA_WORKERS = 2
+DEFAULT_METADATA_TIMEOUT = 300
+# Interval at which a waiting request checks whether its worker is still alive.
+_POLL_INTERVAL = 1
+
+
+def _serve(inbox, outbox):
+    """Loop of a worker process: read the metadata of each requested image, keeping the JVM of the process warm."""
+    from ome_types import to_xml
+    from eubi_bridge.base.readers import read_ome_metadata
+    # Announce that the imports are done; the timeouts of the requests start from here.
+    outbox.send(None)
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            return
+        for request_id, input_path, series, meta_reader in batch:
+            try:
+                outbox.send((request_id, True, to_xml(read_ome_metadata(input_path, series, meta_reader))))
+            except Exception as e:
+                # Reader exceptions, e.g. of Java classes, do not always pickle.
+                outbox.send((request_id, False, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.inbox = context.Queue()
+        # Results go through a pipe, which unlike a queue sends synchronously, so that the results of a
+        # worker that crashes afterwards are not lost.
+        self.outbox, outbox = context.Pipe(duplex=False)
+        self.ready = False
+        self.process = context.Process(target=_serve, args=(self.inbox, outbox), daemon=True)
+        self.process.start()
+        outbox.close()
+
+    def receive(self, timeout: float):
+        """Return the next message of the worker. Raise queue.Empty if none arrives in time, EOFError if the worker has exited."""
+        if not self.outbox.poll(timeout):
+            raise queue.Empty
+        return self.outbox.recv()
+
+    def stop(self, timeout: float = 5) -> None:
+        if self.process.is_alive():
+            self.inbox.put(None)
+            self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class MetadataService:
+    """
+    A pool of long-lived processes that read the metadata of images.
+
+    Each process starts its JVM, if the metadata reader needs one, on its first request and keeps
+    it for all later requests, which then skip the startup and class loading. Requests are sent
+    to the processes in batches over local queues, and the parsed OME metadata is returned.
+
+    A request that takes longer than the timeout, or whose process crashes, fails without
+    failing the others. The process is then replaced by a fresh one, which carries on with the
+    rest of the batch.
+
+    Args:
+        n_workers: Number of worker processes
+        timeout: Time in seconds after which a single request fails
+    """
+    def __init__(self,
+                 n_workers: int = DEFAULT_METADATA_WORKERS,
+                 timeout: float = DEFAULT_METADATA_TIMEOUT
+                 ):
+        self.n_workers = max(1, int(n_workers))
+        self.timeout = float(timeout)
+        # Spawned processes do not inherit a JVM or the locks of the parent.
+        self._context = multiprocessing.get_context('spawn')
+        self._workers: List[Optional[_Worker]] = [None] * self.n_workers
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def _get_worker(self, index: int, restart: bool = False) -> _Worker:
+        with self._lock:
+            worker = self._workers[index]
+            if worker is not None and (restart or not worker.process.is_alive()):
+                worker.stop(timeout=0)
+                worker = None
+            if worker is None:
+                worker = self._workers[index] = _Worker(self._context)
+            return worker
+
+    def _run_batch(self, index: int, batch: List[tuple]) -> Dict[int, tuple]:
+        results = {}
+        pending = list(batch)
+        worker = self._get_worker(index)
+        worker.inbox.put(pending)
+        while pending:
+            request_id, input_path = pending[0][:2]
+            deadline = time.monotonic() + self.timeout
+            error = None
+            while error is None:
+                try:
+                    message = worker.receive(_POLL_INTERVAL)
+                    if message is None:
+                        # The worker has started; its startup does not count against the timeout.
+                        worker.ready = True
+                        deadline = time.monotonic() + self.timeout
+                        continue
+                    done_id, ok, payload = message
+                    break
+                except EOFError:
+                    error = f"The metadata worker crashed while reading {input_path}."
+                except queue.Empty:
+                    if not worker.process.is_alive():
+                        error = f"The metadata worker crashed while reading {input_path}."
+                    elif worker.ready and time.monotonic() > deadline:
+                        error = f"Reading the metadata of {input_path} took longer than {self.timeout} s."
+            if error is not None and not worker.ready:
+                # A worker that cannot start, e.g. in a script without a __main__ guard, would fail again.
+                logger.warning(f"The metadata worker exited while starting. Its requests are left to the caller.")
+                for request in pending:
+                    results[request[0]] = (False, "The metadata worker exited while starting.")
+                break
+            if error is not None:
+                logger.warning(f"{error} Restarting the worker.")
+                results[request_id] = (False, error)
+                pending.pop(0)
+                worker = self._get_worker(index, restart=True)
+                if pending:
+                    worker.inbox.put(pending)
+                continue
+            results[done_id] = (ok, payload)
+            pending = [request for request in pending if request[0] != done_id]
+        return results
+
+    def read(self, requests: Iterable[Tuple[str, int, str]]) -> List[object]:
+        """
+        Read the metadata of many images.
+
+        Args:
+            requests: Tuples of (path, series, metadata reader), as taken by `read_ome_metadata`.
+
+        Returns:
+            For each request, in order, the OME metadata holding the selected series, or the
+            exception raised in its place.
+        """
+        from ome_types import from_xml
+        requests = [(next(self._ids), *request) for request in requests]
+        if len(requests) == 0:
+            return []
+        n_batches = min(self.n_workers, len(requests))
+        batches = [requests[index::n_batches] for index in range(n_batches)]
+        with ThreadPoolExecutor(max_workers=n_batches) as pool:
+            results = {}
+            for batch_results in pool.map(self._run_batch, range(n_batches), batches):
+                results.update(batch_results)
+        outputs = []
+        for request in requests:
+            ok, payload = results[request[0]]
+            outputs.append(from_xml(payload) if ok else RuntimeError(payload))
+        return outputs
+
+    def close(self) -> None:
+        """Stop all worker processes."""
+        with self._lock:
+            workers = [worker for worker in self._workers if worker is not None]
+            self._workers = [None] * self.n_workers
+        for worker in workers:
+            worker.stop()
+
+
+_SERVICE: Optional[MetadataService] = None
+_SETTINGS = dict(n_workers=DEFAULT_METADATA_WORKERS, timeout=DEFAULT_METADATA_TIMEOUT)
+
+
+def configure_metadata_service(n_workers: int = DEFAULT_METADATA_WORKERS,
+                               timeout: float = DEFAULT_METADATA_TIMEOUT
+                               ) -> None:
+    """
+    Configure the metadata service returned by `get_metadata_service`, or disable it with n_workers=0.
+
+    A running service is kept, warm, as long as its number of workers stays the same.
+    """
+    global _SERVICE
+    _SETTINGS.update(n_workers=int(n_workers), timeout=float(timeout))
+    if _SERVICE is not None:
+        if _SERVICE.n_workers != _SETTINGS['n_workers']:
+            _SERVICE.close()
+            _SERVICE = None
+        else:
+            _SERVICE.timeout = _SETTINGS['timeout']
+
+
+def get_metadata_service() -> Optional[MetadataService]:
+    """Return the metadata service of this process, starting it if needed, or None if it is disabled."""
+    global _SERVICE
+    if _SETTINGS['n_workers'] <= 0:
+        return None
+    if _SERVICE is None:
+        _SERVICE = MetadataService(**_SETTINGS)
+    return _SERVICE
+
+
+@atexit.register
+def shutdown_metadata_service() -> None:
+    """Stop the worker processes of the metadata service, if it was started."""
+    global _SERVICE
+    if _SERVICE is not None:
+        _SERVICE.close()
+        _SERVICE = None
+
+
+def prefetch_metadata(input_paths: Iterable[str],
+                      series: Optional[int] = None,
+                      meta_reader: str = 'bfio'
+                      ) -> Dict[str, object]:
+    """
+    Read the metadata of the images that are neither NGFF groups nor cached, through the metadata service.
+
+    Returns:
+        The OME metadata per path, for the paths that were read successfully. The others are
+        left to `ArrayManager`, which reads them itself. Empty if the service is disabled.
+    """
+    from eubi_bridge.utils.convenience import is_zarr_group
+    from eubi_bridge.utils.metadata_cache import get_metadata_cache
+    service = get_metadata_service()
+    if service is None:
+        return {}
+    series = 0 if series is None else series
+    cache = get_metadata_cache()
+    paths = [path for path in input_paths
+             if not is_zarr_group(path) and (cache is None or not cache.has(path, series, meta_reader))]
+    omemetas = {}
+    for path, omemeta in zip(paths, service.read([(path, series, meta_reader) for path in paths])):
+        if isinstance(omemeta, Exception):
+            logger.warning(f"The metadata service could not read {path}: {omemeta}")
+        else:
+            omemetas[path] = omemeta
+    return omemetas
@@ -14,7 +14,13 @@ readable_formats = ('.ome.tiff', '.ome.tif', '.czi', '.lif',
                     '.png', '.jpg', '.jpeg')
 
 
-def read_tiff(input_path, **kwargs):
+def read_tiff(input_path, series=0, fast_path=True, chunks_yx=None, **kwargs):
+    if fast_path:
+        # Files that tifffile can map to TCZYX are read with it directly; anything else goes through bioio.
+        from eubi_bridge.base.tiff_reader import read_tiff_native
+        im = read_tiff_native(input_path, series=series, chunks_yx=chunks_yx)
+        if im is not None:
+            return im
     from bioio_tifffile.reader import Reader as reader  # pip install bioio-tifffile --no-deps
     kwargs['chunk_dims'] = 'YX'
     img = reader(input_path, **kwargs)
@@ -53,6 +59,11 @@ def read_single_image_asarray(input_path, **kwargs):
         from bioio_ome_tiff.reader import Reader as reader # pip install bioio-ome-tiff --no-deps
     elif input_path.endswith(('.tif', '.tiff', '.lsm')):
         reader = read_tiff
+        reader_kwargs = dict(
+            series = kwargs.get('scene_index', 0),
+            fast_path = kwargs.get('tiff_fast_path', True),
+            chunks_yx = kwargs.get('chunks_yx', None)
+        )
     elif input_path.endswith('.czi'):
         from eubi_bridge.base.czi_reader import read_czi as reader
         reader_kwargs = dict(
@@ -94,6 +105,111 @@ def read_single_image_asarray(input_path, **kwargs):
         arr = arr[0].transpose((0, 4, 1, 2, 3))
     return arr
 
+DEFAULT_PROBE_WORKERS = 16
+
+
+def probe_header(input_path, **kwargs):
+    """
+    Extract the shape, dtype, dimension order and native block layout of an image without building a reader.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to the image file.
+    **kwargs : dict
+        Reader parameters, such as `scene_index` and `tiff_fast_path`.
+
+    Returns
+    -------
+    header : dict or None
+        A small, picklable description from which `array_from_header` builds the array, or None
+        if the format has no header probe and must be read with `read_single_image_asarray`.
+    """
+    if input_path.endswith(('ome.tiff', 'ome.tif')) or not input_path.endswith(('.tif', '.tiff', '.lsm')):
+        return None
+    if not kwargs.get('tiff_fast_path', True):
+        return None
+    from eubi_bridge.base.tiff_reader import probe_tiff, map_axes_to_tczyx
+    series = kwargs.get('scene_index', 0)
+    try:
+        layout = probe_tiff(input_path, series)
+    except Exception:
+        return None
+    if layout is None or map_axes_to_tczyx(layout['axes']) is None:
+        return None
+    return dict(format='tiff', path=input_path, series=series, layout=layout)
+
+
+def probe_headers(input_paths, max_workers=DEFAULT_PROBE_WORKERS, **kwargs):
+    """
+    Probe the headers of many images concurrently with a bounded thread pool.
+
+    Returns
+    -------
+    headers : list
+        One header or None per path, in the order of the paths.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    if len(input_paths) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(input_paths)))) as pool:
+        return list(pool.map(lambda path: probe_header(path, **kwargs), input_paths))
+
+
+def _header_for_path(header, input_path):
+    # The layout of the probed image stands for the other image; its modification time does not.
+    return dict(header, path=input_path, layout=dict(header['layout'], mtime=None))
+
+
+def probe_homogeneous_headers(input_paths, sample_size=0, max_workers=DEFAULT_PROBE_WORKERS, **kwargs):
+    """
+    Probe a collection of images that are assumed to share one shape and dtype, opening only a few of them.
+
+    The first image is probed and its header is reused for all others. A random sample of the
+    others is probed as well and checked against it. Images outside the sample are checked when
+    they are read, see `TiffSeriesArray`.
+
+    Parameters
+    ----------
+    input_paths : list of str
+        Paths to the image files.
+    sample_size : int
+        Number of further images probed to validate the assumption.
+    max_workers : int
+        Number of threads that probe the sample.
+    **kwargs : dict
+        Reader parameters, as for `probe_header`.
+
+    Returns
+    -------
+    headers : list or None
+        One header per path, in the order of the paths, or None if the first image has no header probe.
+    """
+    import random
+    if len(input_paths) == 0:
+        return []
+    reference = probe_header(input_paths[0], **kwargs)
+    if reference is None:
+        return None
+    others = list(input_paths[1:])
+    sample = random.sample(others, min(int(sample_size), len(others)))
+    expected = tuple(reference['layout'][key] for key in ('axes', 'shape', 'dtype'))
+    for path, header in zip(sample, probe_headers(sample, max_workers=max_workers, **kwargs)):
+        found = None if header is None else tuple(header['layout'][key] for key in ('axes', 'shape', 'dtype'))
+        if found != expected:
+            raise ValueError(f"The images are not homogeneous: {path} has the layout {found}, "
+                             f"but {input_paths[0]} has {expected}. Convert without assume_homogeneous.")
+    return [reference] + [_header_for_path(reference, path) for path in others]
+
+
+def array_from_header(header, chunks_yx=None):
+    """Synthesize the lazy TCZYX dask array of an image from its header, without opening the file."""
+    if header['format'] == 'tiff':
+        from eubi_bridge.base.tiff_reader import tiff_array_from_layout
+        return tiff_array_from_layout(header['path'], header['series'], header['layout'], chunks_yx=chunks_yx)
+    raise ValueError(f"Unknown header format: {header['format']}")
+
+
 def get_metadata_reader_by_path(input_path, **kwargs):
     if input_path.endswith(('ome.tiff', 'ome.tif')):
         from bioio_ome_tiff.reader import Reader as reader # pip install bioio-ome-tiff --no-deps
@@ -133,6 +249,48 @@ def read_metadata_via_bfio(input_path, **kwargs):
             raise RuntimeError("JGO cache may be corrupted. Run `rm -rf ~/.jgo/` and retry.") from e
     return omemeta
 
+def read_ome_metadata(input_path, series=None, meta_reader='bioio'):
+    """
+    Read the OME metadata of one series of an image with the given metadata reader.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to the image file, or to an OME-XML file.
+    series : int, optional
+        Index of the series. Defaults to the first one.
+    meta_reader : str
+        Either 'bioio' or 'bfio'. Both fall back on bioio-bioformats.
+
+    Returns
+    -------
+    omemeta : ome_types.OME
+        The metadata, holding the selected series as its only image.
+    """
+    if input_path.endswith('ome') or input_path.endswith('xml'):
+        from ome_types import OME
+        omemeta = OME().from_xml(input_path)
+    else:
+        if meta_reader == 'bioio':
+            # Try to read the metadata via bioio
+            try:
+                omemeta = read_metadata_via_extension(input_path, series = series)
+            except:
+                # If not found, try to read the metadata via bioformats
+                omemeta = read_metadata_via_bioio_bioformats(input_path, series = series)
+        elif meta_reader == 'bfio':
+            try:
+                omemeta = read_metadata_via_bfio(input_path) # don't pass series, will be handled afterwards
+            except:
+                # If not found, try to read the metadata via bioformats
+                omemeta = read_metadata_via_bioio_bioformats(input_path, series = series)
+        else:
+            raise ValueError(f"Unsupported metadata reader: {meta_reader}")
+    if series is None:
+        series = 0
+    omemeta.images = [omemeta.images[series]]
+    return omemeta
+
 def read_metadata_via_extension(input_path, **kwargs):
     Reader = get_metadata_reader_by_path(input_path)
     series = kwargs.get('series', None)
@@ -1,9 +1,11 @@
-import zarr, dataclasses
+import zarr, dataclasses, warnings
 from pathlib import Path
 import numpy as np, zarr
 import dask.array as da
 from typing import Callable
 
+from eubi_bridge.ngff import defaults
+
 
 def simple_downscale(
                      darr,
@@ -26,54 +28,251 @@ def simple_downscale(
     downscaled_arr = darr[slices]
     return downscaled_arr
 
+def _accumulator_dtype(dtype):
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.signedinteger):
+        return np.int64
+    elif np.issubdtype(dtype, np.unsignedinteger) or np.issubdtype(dtype, np.bool_):
+        return np.uint64
+    return np.float64
+
+def _cast_result(result, dtype):
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer) or np.issubdtype(dtype, np.bool_):
+        result = np.rint(result)
+    return result.astype(dtype, copy = False)
+
+def _pad_block(block, factor, mode = 'edge'):
+    """
+    Pad a block so that every dimension is a multiple of the factor.
+
+    Returns the padded block and a mask of the original voxels, or None as
+    the mask if the block is already aligned with the factor.
+    """
+    pad_width = [(0, -size % f) for size, f in zip(block.shape, factor)]
+    if not any(after for _, after in pad_width):
+        return block, None
+    padded = np.pad(block, pad_width, mode = mode)
+    valid = np.pad(np.ones_like(block, dtype = bool, shape = block.shape), pad_width, mode = 'constant')
+    return padded, valid
+
+def _split_windows(block, factor):
+    """Reshape an aligned block to (n0, f0, n1, f1, ...) and return it with the window axes."""
+    shape = []
+    for size, f in zip(block.shape, factor):
+        shape += [size // f, f]
+    window_axes = tuple(range(1, 2 * block.ndim, 2))
+    return block.reshape(shape), window_axes
+
+def _gather_windows(block, factor):
+    """Reshape an aligned block to (n0, n1, ..., f0 * f1 * ...) so that each window is on the last axis."""
+    split, window_axes = _split_windows(block, factor)
+    outer_axes = tuple(range(0, 2 * block.ndim, 2))
+    windows = split.transpose(outer_axes + window_axes)
+    return windows.reshape(windows.shape[:block.ndim] + (-1,))
+
+def _mean_kernel(block, factor):
+    padded, valid = _pad_block(block, factor, mode = 'constant')
+    split, window_axes = _split_windows(padded, factor)
+    total = split.sum(axis = window_axes, dtype = _accumulator_dtype(block.dtype))
+    if valid is None:
+        count = np.prod(factor)
+    else:
+        count = _split_windows(valid, factor)[0].sum(axis = window_axes)
+    return _cast_result(total / count, block.dtype)
+
+def _max_kernel(block, factor):
+    padded, _ = _pad_block(block, factor, mode = 'edge')
+    split, window_axes = _split_windows(padded, factor)
+    return split.max(axis = window_axes)
+
+def _min_kernel(block, factor):
+    padded, _ = _pad_block(block, factor, mode = 'edge')
+    split, window_axes = _split_windows(padded, factor)
+    return split.min(axis = window_axes)
+
+def _median_kernel(block, factor):
+    padded, valid = _pad_block(block, factor, mode = 'edge')
+    windows = _gather_windows(padded, factor)
+    if valid is None:
+        result = np.median(windows, axis = -1)
+    else:
+        # Only the blocks at the far edges of the array have incomplete windows.
+        windows = windows.astype(np.float64)
+        windows[~_gather_windows(valid, factor)] = np.nan
+        result = np.nanmedian(windows, axis = -1)
+    return _cast_result(result, block.dtype)
+
+def _mode_kernel(block, factor):
+    padded, valid = _pad_block(block, factor, mode = 'edge')
+    windows = _gather_windows(padded, factor)
+    if valid is None:
+        weights = np.ones_like(windows, dtype = np.int64)
+    else:
+        weights = _gather_windows(valid, factor).astype(np.int64)
+    order = np.argsort(windows, axis = -1, kind = 'stable')
+    windows = np.take_along_axis(windows, order, axis = -1)
+    weights = np.take_along_axis(weights, order, axis = -1)
+    # Count the valid voxels seen so far within each run of equal values.
+    positions = np.arange(windows.shape[-1])
+    run_starts = np.ones_like(windows, dtype = bool)
+    run_starts[..., 1:] = windows[..., 1:] != windows[..., :-1]
+    run_starts = np.maximum.accumulate(np.where(run_starts, positions, 0), axis = -1)
+    cumulative = np.cumsum(weights, axis = -1)
+    preceding = np.take_along_axis(cumulative, np.maximum(run_starts - 1, 0), axis = -1)
+    counts = cumulative - np.where(run_starts > 0, preceding, 0)
+    # Ties are resolved in favour of the smallest value.
+    best = np.argmax(counts, axis = -1)[..., None]
+    return np.take_along_axis(windows, best, axis = -1)[..., 0]
+
+def block_reduce(arr: da.Array,
+                 scale_factor: (tuple, list, np.ndarray),
+                 kernel: Callable
+                 ):
+    """
+    Downscale a Dask array by applying a reduction kernel to each block independently.
+
+    The array is rechunked only if its chunk boundaries do not fall on multiples of
+    the scale factor. Windows at the far edges of the array may be incomplete; they
+    are reduced over the voxels they contain, so the output shape is the ceiling of
+    the input shape divided by the scale factor.
+
+    Parameters:
+    arr (dask.array): The input n-dimensional Dask array.
+    scale_factor (tuple): The downsampling factors for each dimension.
+    kernel (Callable): Function reducing a numpy block given the factor.
+
+    Returns:
+    dask.array: The downscaled Dask array.
+    """
+    if len(scale_factor) != arr.ndim:
+        raise ValueError("scale_factors must have the same length as the array's number of dimensions")
+    factor = tuple(int(f) for f in scale_factor)
+    if all(f == 1 for f in factor):
+        return arr
+    misaligned = any(any(size % f for size in chunks[:-1])
+                     for chunks, f in zip(arr.chunks, factor))
+    if misaligned:
+        aligned = tuple(max(f, (size // f) * f) for size, f in zip(arr.chunksize, factor))
+        arr = arr.rechunk(aligned)
+    out_chunks = tuple(tuple(-(-size // f) for size in chunks)
+                       for chunks, f in zip(arr.chunks, factor))
+    return arr.map_blocks(kernel, factor = factor, chunks = out_chunks, dtype = arr.dtype)
+
 def mean_downscale(arr: da.Array,
                    scale_factor: (tuple, list, np.ndarray) = None
                    ):
-    if len(scale_factor) != arr.ndim:
-        raise ValueError("scale_factors must have the same length as the array's number of dimensions")
-    axes = dict({idx: factor for idx, factor in enumerate(scale_factor)})
-    downscaled_arr = da.coarsen(da.mean, arr,
-                                axes = axes, trim_excess = True).astype(arr.dtype)
-    return downscaled_arr
+    return block_reduce(arr, scale_factor, _mean_kernel)
 
 def median_downscale(arr: da.Array,
                    scale_factor: (tuple, list, np.ndarray) = None
                    ):
-    if len(scale_factor) != arr.ndim:
-        raise ValueError("scale_factors must have the same length as the array's number of dimensions")
-    axes = dict({idx: factor for idx, factor in enumerate(scale_factor)})
-    downscaled_arr = da.coarsen(da.median, arr,
-                                axes = axes, trim_excess = True).astype(arr.dtype)
-    return downscaled_arr
+    return block_reduce(arr, scale_factor, _median_kernel)
+
+def max_downscale(arr: da.Array,
+                  scale_factor: (tuple, list, np.ndarray) = None
+                  ):
+    return block_reduce(arr, scale_factor, _max_kernel)
+
+def min_downscale(arr: da.Array,
+                  scale_factor: (tuple, list, np.ndarray) = None
+                  ):
+    return block_reduce(arr, scale_factor, _min_kernel)
+
+def mode_downscale(arr: da.Array,
+                   scale_factor: (tuple, list, np.ndarray) = None
+                   ):
+    return block_reduce(arr, scale_factor, _mode_kernel)
 
 @dataclasses.dataclass
 class DownscaleManager:
     base_shape: (list, tuple)
     scale_factor: (list, tuple)
-    n_layers: (list, tuple)
+    n_layers: (int, str)
     scale: (list, tuple) = None
+    axes: str = None
+    min_dimension_size: int = None
 
     def __post_init__(self):
         ndim = len(self.base_shape)
         assert len(self.scale_factor) == ndim
+        if self.axes is not None:
+            assert len(self.axes) == ndim
+        if self.n_layers != 'auto':
+            self.n_layers = int(self.n_layers)
 
     @property
-    def _scale_ids(self):
-        return np.arange(self.n_layers).reshape(-1, 1)
+    def _lateral_axes(self):
+        if self.axes is None:
+            return [idx for idx, factor in enumerate(self.scale_factor) if factor > 1]
+        return [idx for idx, ax in enumerate(self.axes) if ax in 'yx']
 
     @property
-    def _theoretical_scale_factors(self):
-        return np.power(self.scale_factor, self._scale_ids)
+    def _z_axis(self):
+        if self.axes is None or 'z' not in self.axes:
+            return None
+        return self.axes.index('z')
+
+    def _plan(self):
+        """
+        Plan the per-layer, per-axis scale factors.
+
+        Each new layer applies the requested scale factor to every axis that has
+        more than one pixel left, with the following exceptions:
+            - If the pixel scales are known, z is only downscaled once doing so brings
+              its pixel size closer to the lateral pixel size of that layer.
+            - If min_dimension_size is set, the planning stops as soon as a lateral
+              axis would drop below it, and z is no longer downscaled below it.
+        The planning also stops once no axis can be downscaled any further, so no
+        duplicate layers are created. With n_layers='auto', it continues until one
+        of these conditions is met.
+        """
+        auto = self.n_layers == 'auto'
+        min_size = self.min_dimension_size
+        if min_size is None and auto:
+            min_size = defaults.min_dimension_size
+        lateral = self._lateral_axes
+        zidx = self._z_axis
+        shape = np.array(self.base_shape, dtype = int)
+        pixel = None if self.scale is None else np.array(self.scale, dtype = float)
+
+        factors = [np.ones(len(shape), dtype = int)]
+        while auto or len(factors) < self.n_layers:
+            factor = np.maximum(np.minimum(self.scale_factor, shape), 1).astype(int)
+            next_shape = -(-shape // factor)
+            if min_size is not None:
+                if any(factor[idx] > 1 and next_shape[idx] < min_size for idx in lateral):
+                    break
+                if zidx is not None and next_shape[zidx] < min_size:
+                    factor[zidx] = 1
+            if zidx is not None and pixel is not None and len(lateral) > 0 and factor[zidx] > 1:
+                lateral_size = np.min(pixel[lateral] * factor[lateral])
+                z_size = pixel[zidx]
+                if z_size * z_size * factor[zidx] > lateral_size * lateral_size:
+                    factor[zidx] = 1
+            if np.all(factor == 1):
+                break
+            factors.append(factor)
+            shape = -(-shape // factor)
+            if pixel is not None:
+                pixel = pixel * factor
+        return np.array(factors)
+
+    @property
+    def relative_scale_factors(self):
+        """
+        Scale factors of each layer relative to the layer before it. The first
+        row belongs to the base layer and is therefore all ones.
+        """
+        return self._plan()
 
     @property
     def output_shapes(self):
-        shapes = np.floor_divide(self.base_shape, self._theoretical_scale_factors)
-        shapes[shapes == 0] = 1
-        return shapes
+        return -(-np.array(self.base_shape) // self.scale_factors)
 
     @property
     def scale_factors(self):
-        return np.true_divide(self.output_shapes[0], self.output_shapes)
+        return np.cumprod(self.relative_scale_factors, axis = 0)
 
     @property
     def scales(self):
@@ -89,9 +288,13 @@ class Downscaler:
     output_chunks: (list, tuple) = None
     backend: str = 'numpy'
     downscale_method: str = 'simple'
+    cascade: bool = True
+    axes: str = None
+    min_dimension_size: int = None
 
     def __post_init__(self):
-        self.param_names = ['array', 'scale_factor', 'n_layers', 'scale', 'output_chunks', 'backend', 'downscale_method']
+        self.param_names = ['array', 'scale_factor', 'n_layers', 'scale', 'output_chunks', 'backend', 'downscale_method',
+                            'cascade', 'axes', 'min_dimension_size']
         self.update()
 
     def get_method(self):
@@ -100,9 +303,15 @@ class Downscaler:
         elif self.downscale_method == "mean":
             method = mean_downscale
         elif self.downscale_method == "median":
-            method = mean_downscale
+            method = median_downscale
+        elif self.downscale_method == "max":
+            method = max_downscale
+        elif self.downscale_method == "min":
+            method = min_downscale
+        elif self.downscale_method == "mode":
+            method = mode_downscale
         else:
-            raise NotImplementedError(f"Currently, only 'simple', 'mean' and 'median' methods are implemented.")
+            raise NotImplementedError(f"Currently, only 'simple', 'mean', 'median', 'max', 'min' and 'mode' methods are implemented.")
         return method
 
     def run(self):
@@ -111,18 +320,27 @@ class Downscaler:
         self.dm = DownscaleManager(self.array.shape,
                                    self.scale_factor,
                                    self.n_layers,
-                                   self.scale
+                                   self.scale,
+                                   axes = self.axes,
+                                   min_dimension_size = self.min_dimension_size
                                    )
+        # In cascade mode, each layer is computed from the layer before it so that
+        # deeper layers do not pull every base block through the graph.
+        if self.cascade:
+            scale_factors = self.dm.relative_scale_factors
+        else:
+            scale_factors = self.dm.scale_factors
         if self.output_chunks is None:
-            self.output_chunks = [self.array.chunksize] * self.n_layers
+            self.output_chunks = [self.array.chunksize] * len(scale_factors)
 
         downscaled = []
-        for idx, (scale_factor, chunks) in enumerate(zip(self.dm.scale_factors, self.output_chunks)):
+        for idx, (scale_factor, chunks) in enumerate(zip(scale_factors, self.output_chunks)):
             if idx == 0:
                 downscaled.append(self.array)
             else:
                 factor = tuple(int(x) for x in scale_factor)
-                res1 = self.method(self.array, scale_factor = factor)
+                source = downscaled[-1] if self.cascade else self.array
+                res1 = self.method(source, scale_factor = factor)
                 downscaled.append(res1)
         self.downscaled_arrays = {str(i): arr for i, arr in enumerate(downscaled)}
         return self
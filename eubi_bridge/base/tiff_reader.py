@@ -0,0 +1,207 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+import dask.array as da
+from dask.base import tokenize
+
+from eubi_bridge.utils.logging_config import get_logger
+logger = get_logger(__name__)
+
+TCZYX = 'TCZYX'
+DEFAULT_MAX_TIFF_BLOCK_MB = 64
+
+
+class TiffSeriesArray:
+    """
+    Array-like view of one TIFF series that dask can slice directly.
+
+    Contiguous uncompressed series are memory-mapped, so a block is a view of the file and no data
+    is copied before it is consumed. Other series are opened through tifffile's zarr store, which
+    reads and decodes only the tiles or strips that a block touches. Only the path and the layout
+    are pickled; every process opens the file once, on first access, and checks it against the
+    expected shape and dtype, which may have been probed on another file of the collection.
+
+    Args:
+        path: Path to the TIFF file.
+        series: Index of the series in the file.
+        shape: Shape of the series.
+        dtype: Data type of the series.
+        mode: Either 'memmap' or 'zarr'.
+    """
+    def __init__(self, path: str, series: int, shape: Tuple[int, ...], dtype, mode: str):
+        self.path = path
+        self.series = series
+        self.shape = tuple(int(size) for size in shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+        self.mode = mode
+        self._data = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_data'] = None
+        state.pop('_lock')
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__ = state
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with self._lock:
+            if self._data is None:
+                import tifffile
+                data = None
+                if self.mode == 'memmap':
+                    try:
+                        data = tifffile.memmap(self.path, series=self.series, mode='r')
+                    except ValueError:
+                        # The layout may have been probed on another file of a homogeneous collection,
+                        # stored differently; such files are decoded instead.
+                        data = None
+                if data is None:
+                    import zarr
+                    tif = tifffile.TiffFile(self.path)
+                    # The store keeps the file open; the lock serialises reads on its single file handle.
+                    store = tif.series[self.series].aszarr(level=0, lock=threading.RLock())
+                    data = zarr.open_array(store, mode='r')
+                if tuple(data.shape) != self.shape or np.dtype(data.dtype) != self.dtype:
+                    raise ValueError(f"{self.path} has the shape {tuple(data.shape)} and dtype {data.dtype}, "
+                                     f"but {self.shape} and {self.dtype} were expected. "
+                                     f"The images are not homogeneous; convert without assume_homogeneous.")
+                self._data = data
+            return self._data
+
+    def __getitem__(self, key):
+        return np.asarray(self._open()[key])
+
+
+def probe_tiff(input_path: str, series: int = 0) -> Optional[dict]:
+    """
+    Describe the layout of a TIFF series and decide how to read it.
+
+    Returns:
+        A dict with the axes, shape, dtype, read mode, native block shape in Y and X and modification
+        time of the series, or None if the file has no such series. Memory-mapped series have no
+        block constraint, (1, 1).
+    """
+    import tifffile
+    with tifffile.TiffFile(input_path) as tif:
+        if series >= len(tif.series):
+            return None
+        s = tif.series[series]
+        page = s.keyframe
+        if s.dataoffset is not None:
+            mode, native = 'memmap', (1, 1)
+        elif page.is_tiled:
+            mode, native = 'zarr', (page.tilelength, page.tilewidth)
+        else:
+            mode, native = 'zarr', (page.rowsperstrip, page.imagewidth)
+        return dict(axes=s.axes.upper(), shape=tuple(s.shape), dtype=s.dtype, mode=mode, native_yx=native,
+                    mtime=os.path.getmtime(input_path))
+
+
+def map_axes_to_tczyx(axes: str) -> Optional[str]:
+    """
+    Map tifffile axes to TCZYX letters.
+
+    Samples (S) become channels. Generic or unknown axes (I, Q, ...) take, in order, the
+    trailing letters of TCZ that are not present yet. Returns None if the axes cannot be mapped.
+    """
+    if 'S' in axes:
+        if 'C' in axes:
+            return None
+        axes = axes.replace('S', 'C')
+    unknown = [ax for ax in axes if ax not in TCZYX]
+    free = [ax for ax in 'TCZ' if ax not in axes]
+    if len(unknown) > len(free) or 'Y' not in axes or 'X' not in axes:
+        return None
+    substitutes = iter(free[len(free) - len(unknown):])
+    mapped = ''.join(ax if ax in TCZYX else next(substitutes) for ax in axes)
+    if len(set(mapped)) != len(mapped):
+        return None
+    return mapped
+
+
+def plan_yx_blocks(plane_shape: Tuple[int, int],
+                   native_yx: Tuple[int, int],
+                   itemsize: int,
+                   chunks_yx: Optional[Tuple[int, int]] = None,
+                   max_block_mb: float = DEFAULT_MAX_TIFF_BLOCK_MB
+                   ) -> Tuple[int, int]:
+    """
+    Choose the block size in Y and X: a multiple of the native tile or strip, close to chunks_yx.
+
+    Without chunks_yx, whole planes are used up to max_block_mb; larger planes are split into
+    roughly square blocks of that size, so that a block never holds a huge plane at once.
+    """
+    if chunks_yx is None:
+        if np.prod(plane_shape) * itemsize <= max_block_mb * 1024 ** 2:
+            return tuple(int(size) for size in plane_shape)
+        side = int(np.sqrt(max_block_mb * 1024 ** 2 / itemsize))
+        chunks_yx = (side, side)
+    blocks = []
+    for size, tile, dim in zip(chunks_yx, native_yx, plane_shape):
+        tile = max(1, min(int(tile), int(dim)))
+        blocks.append(int(min(dim, max(1, round(size / tile)) * tile)))
+    return tuple(blocks)
+
+
+def read_tiff_native(input_path: str,
+                     series: int = 0,
+                     chunks_yx: Optional[Tuple[int, int]] = None
+                     ) -> Optional[da.Array]:
+    """
+    Read a TIFF series as a TCZYX dask array with tifffile alone, bypassing bioio.
+
+    Args:
+        input_path: Path to the TIFF file.
+        series: Index of the series in the file.
+        chunks_yx: Output chunk size in Y and X, which the blocks are sized after.
+
+    Returns:
+        dask.array.Array with dimension order TCZYX, or None if the file needs the bioio reader.
+    """
+    try:
+        layout = probe_tiff(input_path, series)
+    except Exception as e:
+        logger.warning(f"Could not probe {input_path} with tifffile: {e}")
+        return None
+    if layout is None or map_axes_to_tczyx(layout['axes']) is None:
+        return None
+    return tiff_array_from_layout(input_path, series, layout, chunks_yx=chunks_yx)
+
+
+def tiff_array_from_layout(input_path: str,
+                           series: int,
+                           layout: dict,
+                           chunks_yx: Optional[Tuple[int, int]] = None
+                           ) -> da.Array:
+    """
+    Build the TCZYX dask array of a TIFF series from its layout, as returned by probe_tiff.
+
+    No file is opened here. Blocks of memory-mapped series point directly at the file; blocks of
+    other series are decoded from their tiles or strips. In Y and X a block spans whole tiles or
+    strips and is sized after chunks_yx, see plan_yx_blocks; along the other axes it holds a
+    single plane.
+    """
+    mapped = map_axes_to_tczyx(layout['axes'])
+    source = TiffSeriesArray(input_path, series, layout['shape'], layout['dtype'], layout['mode'])
+    samples = source.shape[layout['axes'].index('S')] if 'S' in layout['axes'] else 1
+    block_yx = plan_yx_blocks((source.shape[mapped.index('Y')], source.shape[mapped.index('X')]),
+                              layout['native_yx'],
+                              itemsize=source.dtype.itemsize * samples,
+                              chunks_yx=chunks_yx)
+    chunks = tuple(block_yx['YX'.index(ax)] if ax in 'YX' else size if layout['axes'][i] == 'S' else 1
+                   for i, (ax, size) in enumerate(zip(mapped, source.shape)))
+    name = 'read-tiff-' + tokenize(input_path, series, layout.get('mtime'), chunks)
+    arr = da.from_array(source, chunks=chunks, name=name, asarray=False, fancy=False)
+
+    present = sorted(range(len(mapped)), key=lambda i: TCZYX.index(mapped[i]))
+    arr = arr.transpose(present)
+    order = ''.join(mapped[i] for i in present)
+    arr = arr[tuple(slice(None) if ax in order else None for ax in TCZYX)]
+    return arr
@@ -1,9 +1,9 @@
 import copy
-import os, itertools, tempfile, shutil, threading
+import os, itertools, tempfile, shutil, threading, json, time, socket
 import zarr, dask, numcodecs
 from zarr import codecs
-from zarr.storage import LocalStore
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from dask import delayed
 import dask.array as da
 import numpy as np
@@ -11,13 +11,23 @@ from pathlib import Path
 from typing import List, Tuple, Dict, Union, Any, Tuple, Optional
 ### internal imports
 from eubi_bridge.ngff.multiscales import NGFFMetadataHandler  #Multimeta
+from eubi_bridge.base.scale import Downscaler
 from eubi_bridge.utils.convenience import (
     get_chunksize_from_array,
     is_zarr_group,
     autocompute_chunk_shape,
+    autocompute_shard_shape,
     #, retry_decorator
 )
 from eubi_bridge.utils.logging_config import get_logger
+from eubi_bridge.utils.storage import (
+    is_remote_path,
+    get_zarr_store,
+    get_tensorstore_kvstore,
+    open_zip_output,
+    is_zip_output,
+    resolve_store
+)
 
 
 import logging, warnings
@@ -31,6 +41,14 @@ ZARR_V3 = 3
 DEFAULT_DIMENSION_SEPARATOR = "/"
 DEFAULT_COMPRESSION_LEVEL = 5
 DEFAULT_COMPRESSION_ALGORITHM = "zstd"
+DEFAULT_MAX_INFLIGHT_WRITES = 16
+DEFAULT_ACCUMULATOR_BUFFER_MB = 256
+DEFAULT_METADATA_WORKERS = 16
+MANIFEST_DIRNAME = '.eubi_manifest'
+MANIFEST_COMPLETE = 'complete'
+DEFAULT_MIN_COMPRESSION_THROUGHPUT = 100 # MB/s
+DEFAULT_COMPRESSOR_SAMPLE_CHUNKS = 8
+BLOSC_SHUFFLE_NAMES = {0: 'noshuffle', 1: 'shuffle', 2: 'bitshuffle'}
 
 
 @dataclass
@@ -133,6 +151,89 @@ def get_compressor(name,
     compressor = compressor_instance(**params)
     return compressor
 
+def get_compressor_candidates(allow_pcodec: bool = False) -> List[Tuple[str, dict]]:
+    """List the compressors, with parameters in numcodecs convention, that compressor='auto' chooses from."""
+    candidates = []
+    for cname in ('lz4', 'zstd'):
+        for shuffle in (1, 2):
+            for clevel in (1, 5, 9):
+                candidates.append(('blosc', dict(cname=cname, clevel=clevel, shuffle=shuffle)))
+    for level in (1, 3, 9):
+        candidates.append(('zstd', dict(level=level)))
+    if allow_pcodec and hasattr(numcodecs, 'PCodec'):
+        candidates.append(('pcodec', {}))
+    return candidates
+
+def format_compressor_params(name: str,
+                             params: dict,
+                             zarr_format: int = ZARR_V2
+                             ) -> dict:
+    """Convert compressor parameters from numcodecs convention to that of the given zarr format."""
+    params = dict(params)
+    if zarr_format == ZARR_V3 and name == 'blosc' and isinstance(params.get('shuffle'), int):
+        params['shuffle'] = BLOSC_SHUFFLE_NAMES[params['shuffle']]
+    return params
+
+def sample_chunks(arr: da.Array,
+                  chunks: Tuple[int, ...],
+                  n_samples: int = DEFAULT_COMPRESSOR_SAMPLE_CHUNKS,
+                  seed: int = 0
+                  ) -> List[np.ndarray]:
+    """Compute a random selection of output chunks of an array."""
+    grid_shape = [int(np.ceil(size / chunk)) for size, chunk in zip(arr.shape, chunks)]
+    n_total = int(np.prod(grid_shape))
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n_total, size=min(n_samples, n_total), replace=False)
+    regions = []
+    for flat_index in picks:
+        index = np.unravel_index(int(flat_index), grid_shape)
+        regions.append(tuple(slice(i * chunk, min((i + 1) * chunk, size))
+                             for i, chunk, size in zip(index, chunks, arr.shape)))
+    samples = dask.compute(*[arr[region] for region in regions])
+    return [sample.get() if hasattr(sample, "get") else sample for sample in samples]  # CuPy -> NumPy
+
+def tune_compressor(samples: List[np.ndarray],
+                    zarr_format: int = ZARR_V2,
+                    min_throughput: float = DEFAULT_MIN_COMPRESSION_THROUGHPUT,
+                    allow_pcodec: bool = False,
+                    tolerance: float = 0.01
+                    ) -> Tuple[str, dict, float, float]:
+    """
+    Benchmark the candidate compressors on sample chunks and pick one.
+
+    Among the candidates that encode at least min_throughput MB/s, the one with the best compression
+    ratio is chosen, preferring faster candidates whose ratio is within the given tolerance of the best.
+    If no candidate is fast enough, the fastest one is chosen.
+
+    Args:
+        samples: Chunks to benchmark on
+        zarr_format: Zarr format that the parameters are returned for
+        min_throughput: Minimum encoding throughput in MB/s
+        allow_pcodec: Whether pcodec may be chosen (zarr v2 with zarr-python only)
+        tolerance: Relative ratio difference below which faster candidates are preferred
+
+    Returns:
+        Compressor name, compressor parameters, compression ratio and throughput in MB/s
+    """
+    samples = [np.ascontiguousarray(sample) for sample in samples]
+    raw_bytes = sum(sample.nbytes for sample in samples)
+    results = []
+    for name, params in get_compressor_candidates(allow_pcodec):
+        codec = get_compressor(name, zarr_format=ZARR_V2, **params)
+        t0 = time.perf_counter()
+        encoded_bytes = sum(len(codec.encode(sample)) for sample in samples)
+        elapsed = max(time.perf_counter() - t0, 1e-9)
+        results.append((name, params, raw_bytes / max(encoded_bytes, 1), raw_bytes / 1e6 / elapsed))
+
+    eligible = [result for result in results if result[3] >= min_throughput]
+    if len(eligible) == 0:
+        name, params, ratio, throughput = max(results, key=lambda result: result[3])
+    else:
+        best_ratio = max(result[2] for result in eligible)
+        close = [result for result in eligible if result[2] >= best_ratio * (1 - tolerance)]
+        name, params, ratio, throughput = max(close, key=lambda result: result[3])
+    return name, format_compressor_params(name, params, zarr_format), ratio, throughput
+
 def get_default_fill_value(dtype):
     if np.issubdtype(dtype, np.integer):
         return 0
@@ -212,14 +313,14 @@ def _create_zarr_array(
     if shards is not None:
         shards = tuple(np.array(shards).flatten().tolist())
         assert np.allclose(np.mod(shards, chunks), 0), f"Shards {shards} must be a multiple of chunks {chunks}"
-    store = LocalStore(store_path)
+    store = get_zarr_store(store_path)
 
     if zarr_format not in (ZARR_V2, ZARR_V3):
         raise ValueError(f"Unsupported Zarr format: {zarr_format}")
 
     if zarr_format == ZARR_V2:
         return _create_zarr_v2_array(
-            store_path=store_path,
+            store_path=resolve_store(store_path),
             shape=shape,
             chunks=chunks,
             dtype=dtype,
@@ -240,10 +341,320 @@ def _create_zarr_array(
         # **kwargs
     )
 
-def write_chunk_with_zarrpy(chunk: np.ndarray, zarr_array: zarr.Array, block_info: Dict) -> None:
+def is_constant_block(block: np.ndarray,
+                      value: Any,
+                      step: int = 1 << 16) -> bool:
+    """
+    Check whether every element of a block equals the given value.
+
+    The block is scanned in slabs of ``step`` elements and the scan stops at the first slab containing
+    another value, so that blocks with content are usually rejected after looking at a few elements.
+    """
+    flat = block.reshape(-1)
+    if flat.size == 0:
+        return True
+    if value is None:
+        value = get_default_fill_value(block.dtype)
+    if np.issubdtype(block.dtype, np.floating) and np.isnan(value):
+        return all(np.isnan(flat[start:start + step]).all() for start in range(0, flat.size, step))
+    if flat[0] != value:
+        return False
+    for start in range(0, flat.size, step):
+        if np.any(flat[start:start + step] != value):
+            return False
+    return True
+
+def _count_chunks(shape: Tuple[int, ...], chunks: Tuple[int, ...]) -> int:
+    return int(np.prod(np.ceil(np.divide(shape, chunks))))
+
+def _count_empty_chunks(block: np.ndarray,
+                        start: List[int],
+                        chunks: Tuple[int, ...],
+                        value: Any) -> int:
+    """
+    Count the storage chunks of a written block that hold only the fill value. The stores drop such
+    chunks as well (zarr's write_empty_chunks=False, and tensorstore alike), so they count as skipped.
+    """
+    location = [(int(st), int(st) + size) for st, size in zip(start, block.shape)]
+    empty = 0
+    for region in _grid_regions(location, chunks):
+        local = tuple(slice(a - st, b - st) for (a, b), (st, _) in zip(region, location))
+        if is_constant_block(block[local], value):
+            empty += 1
+    return empty
+
+def _skipped_block(ndim: int, count: int) -> np.ndarray:
+    """Per-block result of the writers when empty chunks are skipped: the number of chunks elided."""
+    return np.full((1,) * ndim, count, dtype=np.int64)
+
+def _writer_block_kwargs(arr: da.Array, dtype: Any, skip_empty_chunks: bool) -> dict:
+    if skip_empty_chunks:
+        return dict(chunks=(1,) * arr.ndim, dtype=np.int64)
+    return dict(dtype=dtype)
+
+def report_skipped_chunks(paths: List[str], counts: List[Any]) -> int:
+    """Log the number of empty chunks that were skipped per array, as computed from the writer results."""
+    total = 0
+    for path, count in zip(paths, counts):
+        count = int(np.sum(count))
+        total += count
+        logger.info(f"Skipped {count} empty chunks of {path}")
+    logger.info(f"Skipped {total} empty chunks in total.")
+    return total
+
+_MANIFEST_LOCK = threading.Lock()
+
+class ChunkManifest:
+    """
+    Append-only record of the write cells (chunks, or shards for zarr v3) of an array that have been written.
+
+    Every process appends the indices of the cells it has written to its own log file in the array
+    directory, so that no locking across processes is needed. Only complete lines are read back,
+    so a log cut short by a killed worker remains usable. Once the whole array has been written,
+    the logs are replaced by an empty marker file, with which later runs skip the array entirely.
+    """
+    def __init__(self, store_path: Union[str, Path]):
+        self.store_path = str(store_path)
+        self.directory = os.path.join(self.store_path, MANIFEST_DIRNAME)
+
+    def record(self, cells: List[Tuple[int, ...]]) -> None:
+        if len(cells) == 0:
+            return
+        lines = ''.join(','.join(str(int(idx)) for idx in cell) + '\n' for cell in cells)
+        path = os.path.join(self.directory, f"{socket.gethostname()}-{os.getpid()}.log")
+        with _MANIFEST_LOCK:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'a') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def completed(self) -> set:
+        done = set()
+        if not os.path.isdir(self.directory):
+            return done
+        for name in os.listdir(self.directory):
+            if name == MANIFEST_COMPLETE:
+                continue
+            with open(os.path.join(self.directory, name)) as f:
+                lines = f.read().split('\n')[:-1] # The last item is empty or an incomplete line.
+            for line in lines:
+                try:
+                    done.add(tuple(int(idx) for idx in line.split(',')))
+                except ValueError:
+                    continue
+        return done
+
+    def is_complete(self) -> bool:
+        return os.path.isfile(os.path.join(self.directory, MANIFEST_COMPLETE))
+
+    def mark_complete(self) -> None:
+        with _MANIFEST_LOCK:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, MANIFEST_COMPLETE), 'w') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            for name in os.listdir(self.directory):
+                if name != MANIFEST_COMPLETE:
+                    os.remove(os.path.join(self.directory, name))
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def _skip_if_complete(manifest: Optional[ChunkManifest]) -> bool:
+    """Tell whether an array being resumed has been written completely before, in which case nothing is read."""
+    if manifest is None or not manifest.is_complete():
+        return False
+    logger.info(f"{manifest.store_path} is complete already.")
+    return True
+
+def _cells_of(location: List[Tuple[int, int]], grid: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+    """List the indices of the grid cells that a region, given as (start, stop) per axis, touches."""
+    return list(itertools.product(*[range(start // size, -(-stop // size))
+                                    for (start, stop), size in zip(location, grid)]))
+
+def _open_for_resume(store_path: Union[str, Path],
+                     shape: Tuple[int, ...],
+                     chunks: Tuple[int, ...],
+                     dtype: Any,
+                     zarr_format: int,
+                     shards: Optional[Tuple[int, ...]] = None
+                     ) -> Optional[zarr.Array]:
+    """Open an existing array for resuming, provided that it has the expected layout."""
+    try:
+        zarr_array = zarr.open_array(str(store_path), mode='r+', zarr_format=zarr_format)
+    except Exception:
+        return None
+    chunks = tuple(int(size) for size in np.minimum(shape, chunks))
+    if (tuple(zarr_array.shape) != tuple(shape)
+            or tuple(zarr_array.chunks) != chunks
+            or zarr_array.dtype != np.dtype(dtype)):
+        return None
+    if zarr_format == ZARR_V3 and shards is not None:
+        if tuple(zarr_array.shards or zarr_array.chunks) != tuple(int(size) for size in np.ravel(shards)):
+            return None
+    return zarr_array
+
+def _create_or_resume_zarr_array(store_path: Union[str, Path],
+                                 shape: Tuple[int, ...],
+                                 chunks: Tuple[int, ...],
+                                 dtype: Any,
+                                 zarr_format: int = ZARR_V2,
+                                 overwrite: bool = False,
+                                 shards: Optional[Tuple[int, ...]] = None,
+                                 **kwargs
+                                 ) -> Tuple[zarr.Array, Optional[ChunkManifest]]:
+    """
+    Create the output array. With resume, an existing array with the same layout is reused and
+    returned together with its manifest, otherwise the array is created anew with an empty manifest.
+    """
+    if not kwargs.get('resume', False):
+        return _create_zarr_array(store_path=store_path, shape=shape, chunks=chunks, dtype=dtype,
+                                  zarr_format=zarr_format, overwrite=overwrite, shards=shards, **kwargs), None
+    manifest = ChunkManifest(store_path)
+    zarr_array = _open_for_resume(store_path, shape, chunks, dtype, zarr_format, shards)
+    if zarr_array is None:
+        zarr_array = _create_zarr_array(store_path=store_path, shape=shape, chunks=chunks, dtype=dtype,
+                                        zarr_format=zarr_format, overwrite=True, shards=shards, **kwargs)
+        manifest.clear()
+    return zarr_array, manifest
+
+def write_block_resumable(block: np.ndarray,
+                          location: List[Tuple[int, int]],
+                          write_func: Any,
+                          manifest: ChunkManifest,
+                          cell_grid: Tuple[int, ...],
+                          **kwargs
+                          ) -> int:
+    """Write a block with the given chunk writer and record its cells in the manifest."""
+    skipped = write_func(block, block_info={0: {"array-location": location}}, **kwargs)
+    manifest.record(_cells_of(location, cell_grid))
+    return 0 if skipped is None else int(np.sum(skipped))
+
+def _write_pending_blocks(arr: da.Array,
+                          write_func: Any,
+                          manifest: ChunkManifest,
+                          cell_grid: Tuple[int, ...],
+                          **kwargs):
+    """
+    Build the write tasks for the blocks whose cells are not all recorded in the manifest.
+    The blocks must consist of whole cells of cell_grid. Returns a delayed object that returns the
+    number of chunks skipped as empty.
+    """
+    if _skip_if_complete(manifest):
+        return _complete_manifest([], manifest)
+    done = manifest.completed()
+    bounds = [np.cumsum((0,) + axis_chunks) for axis_chunks in arr.chunks]
+    blocks = arr.to_delayed()
+    skipped = []
+    for block_index in itertools.product(*[range(len(axis_chunks)) for axis_chunks in arr.chunks]):
+        location = [(int(bounds[axis][idx]), int(bounds[axis][idx + 1]))
+                    for axis, idx in enumerate(block_index)]
+        if all(cell in done for cell in _cells_of(location, cell_grid)):
+            continue
+        skipped.append(delayed(write_block_resumable)(blocks[block_index], location, write_func,
+                                                      manifest, cell_grid, **kwargs))
+    logger.info(f"Resuming {len(skipped)} of {blocks.size} blocks.")
+    return _complete_manifest(skipped, manifest)
+
+def write_chunk_with_zarrpy(chunk: np.ndarray,
+                            zarr_array: zarr.Array,
+                            block_info: Dict,
+                            skip_empty_chunks: bool = False) -> None:
     if hasattr(chunk, "get"):
         chunk = chunk.get()  # Convert CuPy -> NumPy
-    zarr_array[tuple(slice(*b) for b in block_info[0]["array-location"])] = chunk
+    if skip_empty_chunks and is_constant_block(chunk, zarr_array.fill_value):
+        return _skipped_block(chunk.ndim, _count_chunks(chunk.shape, zarr_array.chunks))
+    location = block_info[0]["array-location"]
+    zarr_array[tuple(slice(*b) for b in location)] = chunk
+    if skip_empty_chunks:
+        return _skipped_block(chunk.ndim, _count_empty_chunks(chunk, [st for st, _ in location],
+                                                              zarr_array.chunks, zarr_array.fill_value))
+
+def _is_aligned(arr: da.Array, grid: Tuple[int, ...]) -> bool:
+    """Check whether every boundary of the given grid is also a block boundary of the dask array."""
+    for axis_chunks, size in zip(arr.chunks, grid):
+        block_bounds = set(np.cumsum(axis_chunks).tolist())
+        dim = sum(axis_chunks)
+        if any(bound not in block_bounds for bound in range(size, dim, size)):
+            return False
+    return True
+
+def _covers_whole_cells(arr: da.Array, grid: Tuple[int, ...]) -> bool:
+    """Check whether every block of the dask array consists of whole cells of the given grid."""
+    for axis_chunks, size in zip(arr.chunks, grid):
+        if any(bound % size for bound in np.cumsum(axis_chunks)[:-1].tolist()):
+            return False
+    return True
+
+def _grid_regions(location: List[Tuple[int, int]],
+                  grid: Tuple[int, ...]) -> List[Tuple[Tuple[int, int], ...]]:
+    """Split a region, given as (start, stop) per axis, along the boundaries of a chunk grid."""
+    per_axis = []
+    for (start, stop), size in zip(location, grid):
+        edges = [start] + list(range((start // size + 1) * size, stop, size)) + [stop]
+        per_axis.append(list(zip(edges[:-1], edges[1:])))
+    return list(itertools.product(*per_axis))
+
+# Process-wide pools for the chunk writes of zarr-python. All tasks of a worker process share one pool,
+# so that the writes in flight are bounded per process rather than per task.
+_WRITE_POOLS = {}
+_WRITE_POOLS_LOCK = threading.Lock()
+
+def _get_write_pool(max_inflight_writes: int) -> ThreadPoolExecutor:
+    """Return the write pool of this process for the given bound, creating it on first use."""
+    max_inflight_writes = max(1, int(max_inflight_writes))
+    with _WRITE_POOLS_LOCK:
+        if max_inflight_writes not in _WRITE_POOLS:
+            _WRITE_POOLS[max_inflight_writes] = ThreadPoolExecutor(max_workers=max_inflight_writes,
+                                                                   thread_name_prefix='eubi-write')
+        return _WRITE_POOLS[max_inflight_writes]
+
+def _write_regions_bounded(zarr_array: zarr.Array,
+                           block: np.ndarray,
+                           location: List[Tuple[int, int]],
+                           grid: Tuple[int, ...],
+                           max_inflight_writes: int,
+                           skip_empty_chunks: bool = False,
+                           fill_value: Any = None,
+                           inner_chunks: Tuple[int, ...] = None) -> int:
+    offset = [start for start, _ in location]
+
+    def _write(region):
+        local = tuple(slice(a - o, b - o) for (a, b), o in zip(region, offset))
+        if skip_empty_chunks and is_constant_block(block[local], fill_value):
+            return _count_chunks(block[local].shape, inner_chunks)
+        zarr_array[tuple(slice(a, b) for a, b in region)] = block[local]
+        if skip_empty_chunks:
+            return _count_empty_chunks(block[local], [a for a, _ in region], inner_chunks, fill_value)
+        return 0
+
+    # The pool threads only write and never wait on other tasks, so sharing them cannot deadlock.
+    return sum(_get_write_pool(max_inflight_writes).map(_write, _grid_regions(location, grid)))
+
+def write_chunk_with_zarrpy_async(chunk: np.ndarray,
+                                  zarr_array: zarr.Array,
+                                  block_info: Dict,
+                                  max_inflight_writes: int = DEFAULT_MAX_INFLIGHT_WRITES,
+                                  skip_empty_chunks: bool = False) -> None:
+    """
+    Write a block that may span several chunks (or shards) through the write pool of the process,
+    so that compression and file I/O of different chunks overlap. At most max_inflight_writes chunk
+    writes are in flight per process, shared by all tasks that run in it.
+    """
+    if hasattr(chunk, "get"):
+        chunk = chunk.get()  # Convert CuPy -> NumPy
+    grid = getattr(zarr_array, 'shards', None) or zarr_array.chunks
+    skipped = _write_regions_bounded(zarr_array,
+                                     chunk,
+                                     block_info[0]["array-location"],
+                                     grid,
+                                     max_inflight_writes,
+                                     skip_empty_chunks,
+                                     zarr_array.fill_value,
+                                     zarr_array.chunks)
+    if skip_empty_chunks:
+        return _skipped_block(chunk.ndim, skipped)
 
 def write_with_zarrpy(arr: da.Array,
                       store_path: Union[str, Path],
@@ -271,7 +682,9 @@ def write_with_zarrpy(arr: da.Array,
         compressor_params: Parameters for the compressor
         rechunk_method: Method for rechunking ('tasks' or 'p2p')
         zarr_format: Zarr format version (2 or 3)
-        **kwargs: Additional arguments for array creation
+        **kwargs: Additional arguments for array creation. With skip_empty_chunks, blocks and chunks that
+            only contain the fill value are not written, and the returned array holds the number of
+            skipped chunks per block.
     """
     store_path = str(store_path)
     dtype = dtype or arr.dtype
@@ -286,41 +699,163 @@ def write_with_zarrpy(arr: da.Array,
         shards = copy.deepcopy(chunks)
 
     if not np.allclose(np.mod(shards, chunks), 0):
-        multiples = np.floor_divide(shards, chunks)
+        multiples = np.maximum(np.floor_divide(shards, chunks), 1)
         shards = np.multiply(multiples, chunks)
 
     shards = tuple(int(size) for size in np.ravel(shards))
+    async_writes = kwargs.get('async_writes', False)
+    write_grid = chunks if zarr_format == 2 else shards
 
-    if zarr_format == 2:
-        if not np.equal(arr.chunksize, chunks).all():
-            arr = arr.rechunk(chunks, method=rechunk_method)
-    else:  # zarr_format == 3
-        if shards is not None and not np.equal(arr.chunksize, shards).all():
-            arr = arr.rechunk(shards, method=rechunk_method)
+    if async_writes:
+        # Blocks spanning several chunks are split at write time, so only misaligned blocks are rechunked.
+        if not _covers_whole_cells(arr, write_grid):
+            arr = arr.rechunk(write_grid, method=rechunk_method)
+    elif not np.equal(arr.chunksize, write_grid).all():
+        arr = arr.rechunk(write_grid, method=rechunk_method)
 
     compressor_config = CompressorConfig(name=compressor,
                                          params=compressor_params)
 
-    zarr_array = _create_zarr_array(
+    zarr_array, manifest = _create_or_resume_zarr_array(
         store_path=store_path,
         shape=arr.shape,
         chunks=chunks,
         dtype=dtype,
         overwrite=overwrite,
-        compressor_config = compressor_config,
+        compressor_config=compressor_config,
         zarr_format=zarr_format,
         shards=shards,
         dimension_names=dimension_names,
         **kwargs
     )
-    res = arr.map_blocks(write_chunk_with_zarrpy, zarr_array=zarr_array, dtype=dtype)
+    skip_empty_chunks = kwargs.get('skip_empty_chunks', False)
+    if manifest is not None:
+        if async_writes:
+            return _write_pending_blocks(arr, write_chunk_with_zarrpy_async, manifest, write_grid,
+                                         zarr_array=zarr_array,
+                                         max_inflight_writes=kwargs.get('max_inflight_writes', DEFAULT_MAX_INFLIGHT_WRITES),
+                                         skip_empty_chunks=skip_empty_chunks)
+        return _write_pending_blocks(arr, write_chunk_with_zarrpy, manifest, write_grid,
+                                     zarr_array=zarr_array,
+                                     skip_empty_chunks=skip_empty_chunks)
+    block_kwargs = _writer_block_kwargs(arr, dtype, skip_empty_chunks)
+    if async_writes:
+        res = arr.map_blocks(write_chunk_with_zarrpy_async, zarr_array=zarr_array,
+                             max_inflight_writes=kwargs.get('max_inflight_writes', DEFAULT_MAX_INFLIGHT_WRITES),
+                             skip_empty_chunks=skip_empty_chunks,
+                             **block_kwargs)
+    else:
+        res = arr.map_blocks(write_chunk_with_zarrpy, zarr_array=zarr_array,
+                             skip_empty_chunks=skip_empty_chunks,
+                             **block_kwargs)
 
     return res
 
-def write_chunk_with_tensorstore(chunk: np.ndarray, ts_store, block_info: Dict) -> None:
+# Process-wide tensorstore resources. Every worker process opens each array once and shares one
+# context, i.e. one cache pool and one set of I/O and copy concurrency limits, among all its tasks.
+_TS_CONTEXTS = {}
+_TS_HANDLES = {}
+_TS_LOCK = threading.Lock()
+
+def build_tensorstore_context_spec(threads_per_worker: int = 1,
+                                   memory_limit: int = None,
+                                   cache_fraction: float = 0.1,
+                                   s3_request_concurrency: int = None
+                                   ) -> dict:
+    """
+    Build a tensorstore context spec that matches the resources of a single worker.
+
+    Args:
+        threads_per_worker: Number of threads of the worker, used for the copy and file I/O limits
+        memory_limit: Memory of the worker in bytes. If None, no cache pool is configured.
+        cache_fraction: Fraction of the worker memory that the shared cache pool may use
+        s3_request_concurrency: Number of concurrent S3 requests. If None, the tensorstore default is used.
+
+    Returns:
+        A JSON-compatible context spec
+    """
+    threads = max(int(threads_per_worker), 1)
+    spec = {
+        "data_copy_concurrency": {"limit": threads},
+        "file_io_concurrency": {"limit": 4 * threads},
+    }
+    if memory_limit is not None:
+        spec["cache_pool"] = {"total_bytes_limit": int(memory_limit * cache_fraction)}
+    if s3_request_concurrency is not None:
+        spec["s3_request_concurrency"] = {"limit": int(s3_request_concurrency)}
+    return spec
+
+def get_tensorstore_context(context_spec: dict = None):
+    """Return the context of this process for the given spec, creating it on first use."""
+    import tensorstore as ts
+    key = json.dumps(context_spec or {}, sort_keys=True)
+    with _TS_LOCK:
+        if key not in _TS_CONTEXTS:
+            _TS_CONTEXTS[key] = ts.Context(context_spec or {})
+        return _TS_CONTEXTS[key]
+
+def open_tensorstore(spec: dict, context_spec: dict = None):
+    """Return the handle of this process for the given spec and context, opening it on first use."""
+    import tensorstore as ts
+    key = json.dumps([spec, context_spec or {}], sort_keys=True)
+    with _TS_LOCK:
+        handle = _TS_HANDLES.get(key)
+    if handle is None:
+        handle = ts.open(spec, context=get_tensorstore_context(context_spec)).result()
+        with _TS_LOCK:
+            handle = _TS_HANDLES.setdefault(key, handle)
+    return handle
+
+def write_chunk_with_tensorstore(chunk: np.ndarray,
+                                 ts_spec: dict,
+                                 block_info: Dict,
+                                 context_spec: dict = None,
+                                 skip_empty_chunks: bool = False,
+                                 fill_value: Any = None,
+                                 inner_chunks: Tuple[int, ...] = None) -> None:
     if hasattr(chunk, "get"):
         chunk = chunk.get()  # Convert CuPy -> NumPy
-    ts_store[tuple(slice(*b) for b in block_info[0]["array-location"])] = chunk
+    if skip_empty_chunks and is_constant_block(chunk, fill_value):
+        return _skipped_block(chunk.ndim, _count_chunks(chunk.shape, inner_chunks))
+    ts_store = open_tensorstore(ts_spec, context_spec)
+    location = block_info[0]["array-location"]
+    ts_store[tuple(slice(*b) for b in location)] = chunk
+    if skip_empty_chunks:
+        return _skipped_block(chunk.ndim, _count_empty_chunks(chunk, [st for st, _ in location],
+                                                              inner_chunks, fill_value))
+
+
+def write_chunk_with_tensorstore_async(chunk: np.ndarray,
+                                       ts_spec: dict,
+                                       block_info: Dict,
+                                       context_spec: dict = None,
+                                       grid: Tuple[int, ...] = None,
+                                       max_inflight_writes: int = DEFAULT_MAX_INFLIGHT_WRITES,
+                                       skip_empty_chunks: bool = False,
+                                       fill_value: Any = None,
+                                       inner_chunks: Tuple[int, ...] = None) -> None:
+    """Write a block chunk by chunk through tensorstore futures, with a bounded number of writes in flight."""
+    if hasattr(chunk, "get"):
+        chunk = chunk.get()  # Convert CuPy -> NumPy
+    ts_store = open_tensorstore(ts_spec, context_spec)
+    location = block_info[0]["array-location"]
+    offset = [start for start, _ in location]
+    pending = []
+    skipped = 0
+    for region in _grid_regions(location, grid):
+        local = tuple(slice(a - o, b - o) for (a, b), o in zip(region, offset))
+        if skip_empty_chunks and is_constant_block(chunk[local], fill_value):
+            skipped += _count_chunks(chunk[local].shape, inner_chunks)
+            continue
+        if len(pending) >= max_inflight_writes:
+            pending.pop(0).result()
+        pending.append(ts_store[tuple(slice(a, b) for a, b in region)].write(chunk[local]))
+        if skip_empty_chunks:
+            skipped += _count_empty_chunks(chunk[local], [a for a, _ in region], inner_chunks, fill_value)
+    for future in pending:
+        future.result()
+    if skip_empty_chunks:
+        return _skipped_block(chunk.ndim, skipped)
 
 
 def write_with_tensorstore(
@@ -362,18 +897,19 @@ def write_with_tensorstore(
         shards = copy.deepcopy(chunks)
 
     if not np.allclose(np.mod(shards, chunks), 0):
-        multiples = np.floor_divide(shards, chunks)
+        multiples = np.maximum(np.floor_divide(shards, chunks), 1)
         shards = np.multiply(multiples, chunks)
 
     shards = tuple(int(size) for size in np.ravel(shards))
+    async_writes = kwargs.get('async_writes', False)
+    write_grid = chunks if zarr_format == 2 else shards
 
     # Rechunk if needed
-    if zarr_format == 2:
-        if not np.equal(arr.chunksize, chunks).all():
-            arr = arr.rechunk(chunks, method=rechunk_method)
-    else:  # zarr_format == 3
-        if shards is not None and not np.equal(arr.chunksize, shards).all():
-            arr = arr.rechunk(shards, method=rechunk_method)
+    if async_writes:
+        if not _covers_whole_cells(arr, write_grid):
+            arr = arr.rechunk(write_grid, method=rechunk_method)
+    elif not np.equal(arr.chunksize, write_grid).all():
+        arr = arr.rechunk(write_grid, method=rechunk_method)
 
     # Prepare zarr metadata
     if zarr_format == 3:
@@ -422,18 +958,371 @@ def write_with_tensorstore(
 
     zarr_spec = {
         "driver": "zarr" if zarr_format == 2 else "zarr3",
-        "kvstore": {
-            "driver": "file",
-            "path": str(store_path),
-        },
+        "kvstore": get_tensorstore_kvstore(store_path),
         "metadata": zarr_metadata,
         "create": True,
         "delete_existing": overwrite,
     }
 
-    ts_store = ts.open(zarr_spec).result()
-    return arr.map_blocks(write_chunk_with_tensorstore, ts_store=ts_store, dtype=dtype)
+    # The array is created here once; the tasks only open it, through the registry of their process.
+    context_spec = kwargs.get('ts_context_spec', None)
+    manifest = ChunkManifest(store_path) if kwargs.get('resume', False) else None
+    if manifest is None or _open_for_resume(store_path, arr.shape, chunks, dtype, zarr_format, shards) is None:
+        if manifest is not None:
+            zarr_spec["delete_existing"] = True
+            manifest.clear()
+        ts.open(zarr_spec, context=get_tensorstore_context(context_spec)).result()
+    ts_spec = {key: value for key, value in zarr_spec.items()
+               if key not in ('metadata', 'create', 'delete_existing')}
+    ts_spec['open'] = True
+    skip_empty_chunks = kwargs.get('skip_empty_chunks', False)
+    if manifest is not None:
+        if async_writes:
+            return _write_pending_blocks(arr, write_chunk_with_tensorstore_async, manifest, write_grid,
+                                         ts_spec=ts_spec,
+                                         context_spec=context_spec,
+                                         grid=write_grid,
+                                         max_inflight_writes=kwargs.get('max_inflight_writes', DEFAULT_MAX_INFLIGHT_WRITES),
+                                         skip_empty_chunks=skip_empty_chunks,
+                                         fill_value=fill_value,
+                                         inner_chunks=chunks)
+        return _write_pending_blocks(arr, write_chunk_with_tensorstore, manifest, write_grid,
+                                     ts_spec=ts_spec,
+                                     context_spec=context_spec,
+                                     skip_empty_chunks=skip_empty_chunks,
+                                     fill_value=fill_value,
+                                     inner_chunks=chunks)
+    block_kwargs = _writer_block_kwargs(arr, dtype, skip_empty_chunks)
+    if async_writes:
+        return arr.map_blocks(write_chunk_with_tensorstore_async, ts_spec=ts_spec,
+                              context_spec=context_spec,
+                              grid=write_grid,
+                              max_inflight_writes=kwargs.get('max_inflight_writes', DEFAULT_MAX_INFLIGHT_WRITES),
+                              skip_empty_chunks=skip_empty_chunks,
+                              fill_value=fill_value,
+                              inner_chunks=chunks,
+                              **block_kwargs)
+    return arr.map_blocks(write_chunk_with_tensorstore, ts_spec=ts_spec,
+                          context_spec=context_spec,
+                          skip_empty_chunks=skip_empty_chunks,
+                          fill_value=fill_value,
+                          inner_chunks=chunks,
+                          **block_kwargs)
+
+
+
+def _assemble_buffer(shape: Tuple[int, ...],
+                     dtype: Any,
+                     offsets: List[Tuple[int, ...]],
+                     blocks: List[np.ndarray]
+                     ) -> np.ndarray:
+    """Copy blocks into a new buffer of the given shape, each at its offset."""
+    buffer = np.empty(shape, dtype=dtype)
+    for offset, block in zip(offsets, blocks):
+        if hasattr(block, "get"):
+            block = block.get()  # Convert CuPy -> NumPy
+        buffer[tuple(slice(o, o + s) for o, s in zip(offset, block.shape))] = block
+    return buffer
+
+def write_shard(zarr_array: zarr.Array,
+                region: Tuple[slice, ...],
+                offsets: List[Tuple[int, ...]],
+                *blocks,
+                skip_empty_chunks: bool = False,
+                manifest: ChunkManifest = None
+                ) -> int:
+    """
+    Assemble the blocks of a single shard in memory and write the shard in one go.
+    Returns the number of chunks that were skipped as empty.
+    """
+    shape = tuple(sl.stop - sl.start for sl in region)
+    shard = _assemble_buffer(shape, zarr_array.dtype, offsets, blocks)
+    skipped = 0
+    if skip_empty_chunks and is_constant_block(shard, zarr_array.fill_value):
+        skipped = _count_chunks(shape, zarr_array.chunks)
+    else:
+        # A write covering the whole shard lets zarr encode all inner chunks concurrently and
+        # store the shard with its index at once, without reading anything back.
+        zarr_array[region] = shard
+        if skip_empty_chunks:
+            skipped = _count_empty_chunks(shard, [sl.start for sl in region], zarr_array.chunks,
+                                          zarr_array.fill_value)
+    if manifest is not None:
+        manifest.record([tuple(sl.start // size for sl, size in zip(region, zarr_array.shards))])
+    return skipped
+
+@delayed
+def _complete_manifest(skipped: list, manifest: Optional[ChunkManifest]) -> int:
+    # Runs only after every block of the array has been written. The logs are then replaced by the
+    # completion marker, so that a later run skips the array without checking its cells.
+    if manifest is not None:
+        manifest.mark_complete()
+    return sum(skipped)
+
+def write_with_shards(arr: da.Array,
+                      store_path: Union[str, Path],
+                      chunks: Optional[Tuple[int, ...]] = None,
+                      shards: Optional[Tuple[int, ...]] = None,
+                      dimension_names: str = None,
+                      dtype: Any = None,
+                      compressor: str = 'blosc',
+                      compressor_params: dict = None,
+                      rechunk_method: str = 'tasks',
+                      overwrite: bool = True,
+                      zarr_format: int = 3,
+                      **kwargs
+                      ):
+    """
+    Write dask array to a sharded zarr v3 array, assembling each shard in a single task.
+
+    Instead of rechunking to the shard shape, the dask blocks belonging to one shard are passed to
+    one task, which writes the shard exactly once. The array is only rechunked (to the inner chunk
+    shape) if its block boundaries do not coincide with the shard boundaries.
+    Falls back to write_with_zarrpy for zarr v2.
+
+    Args:
+        arr: Dask array to write
+        store_path: Path where the Zarr array will be stored
+        chunks: Inner chunk size for each dimension
+        shards: Shard size for each dimension
+        dtype: Data type of the array (defaults to arr.dtype)
+        compressor: Compression algorithm ('blosc' by default)
+        compressor_params: Parameters for the compressor
+        rechunk_method: Method for rechunking ('tasks' or 'p2p')
+        zarr_format: Zarr format version (2 or 3)
+        **kwargs: Additional arguments for array creation
+
+    Returns:
+        A delayed object that returns the number of chunks skipped as empty.
+    """
+    if zarr_format != 3:
+        return write_with_zarrpy(arr, store_path, chunks=chunks, shards=shards,
+                                 dimension_names=dimension_names, dtype=dtype,
+                                 compressor=compressor, compressor_params=compressor_params,
+                                 rechunk_method=rechunk_method, overwrite=overwrite,
+                                 zarr_format=zarr_format, **kwargs)
+    store_path = str(store_path)
+    dtype = dtype or arr.dtype
+    compressor_params = compressor_params or {}
+
+    if chunks is None:
+        chunks = arr.chunksize
+    chunks = tuple(int(size) for size in np.minimum(chunks, arr.shape))
+
+    if shards is None:
+        shards = copy.deepcopy(chunks)
+
+    if not np.allclose(np.mod(shards, chunks), 0):
+        multiples = np.maximum(np.floor_divide(shards, chunks), 1)
+        shards = np.multiply(multiples, chunks)
+
+    shards = tuple(int(size) for size in np.ravel(shards))
+
+    if not _is_aligned(arr, shards):
+        arr = arr.rechunk(chunks, method=rechunk_method)
+
+    compressor_config = CompressorConfig(name=compressor,
+                                         params=compressor_params)
+
+    zarr_array, manifest = _create_or_resume_zarr_array(
+        store_path=store_path,
+        shape=arr.shape,
+        chunks=chunks,
+        dtype=dtype,
+        overwrite=overwrite,
+        compressor_config=compressor_config,
+        zarr_format=zarr_format,
+        shards=shards,
+        dimension_names=dimension_names,
+        **kwargs
+    )
 
+    if _skip_if_complete(manifest):
+        return _complete_manifest([], manifest)
+    # Group the blocks by the shard they fall into.
+    block_starts = [np.cumsum((0,) + axis_chunks[:-1]) for axis_chunks in arr.chunks]
+    blocks = arr.to_delayed()
+    groups = {}
+    for block_index in itertools.product(*[range(len(axis_chunks)) for axis_chunks in arr.chunks]):
+        start = tuple(int(block_starts[axis][idx]) for axis, idx in enumerate(block_index))
+        shard_index = tuple(st // size for st, size in zip(start, shards))
+        groups.setdefault(shard_index, []).append((start, blocks[block_index]))
+
+    skip_empty_chunks = kwargs.get('skip_empty_chunks', False)
+    done = manifest.completed() if manifest is not None else set()
+    skipped = []
+    for shard_index, members in groups.items():
+        if shard_index in done:
+            continue
+        shard_start = tuple(idx * size for idx, size in zip(shard_index, shards))
+        region = tuple(slice(st, min(st + size, dim))
+                       for st, size, dim in zip(shard_start, shards, arr.shape))
+        offsets = [tuple(st - sst for st, sst in zip(start, shard_start)) for start, _ in members]
+        skipped.append(delayed(write_shard)(zarr_array, region, offsets,
+                                            *[block for _, block in members],
+                                            skip_empty_chunks=skip_empty_chunks,
+                                            manifest=manifest))
+    return _complete_manifest(skipped, manifest)
+
+
+def _plan_buffer_shape(block_shape: Tuple[int, ...],
+                       cell_shape: Tuple[int, ...],
+                       itemsize: int,
+                       budget_bytes: float
+                       ) -> Tuple[int, ...]:
+    """
+    Choose the shape of the accumulation buffers as a whole number of write cells per axis.
+
+    Along axes where the source blocks are larger than a cell, a buffer spans the block, so that
+    each source block feeds as few buffers as possible. Buffers are then halved along the axis with
+    the most cells until they fit the budget.
+    """
+    n_cells = [max(1, int(np.ceil(b / c))) for b, c in zip(block_shape, cell_shape)]
+    while np.prod(np.multiply(n_cells, cell_shape)) * itemsize > budget_bytes and max(n_cells) > 1:
+        axis = int(np.argmax(n_cells))
+        n_cells[axis] = int(np.ceil(n_cells[axis] / 2))
+    return tuple(int(n * c) for n, c in zip(n_cells, cell_shape))
+
+def write_buffer(zarr_array: zarr.Array,
+                 region: Tuple[slice, ...],
+                 offsets: List[Tuple[int, ...]],
+                 *pieces,
+                 grid: Tuple[int, ...] = None,
+                 skip_empty_chunks: bool = False,
+                 manifest: ChunkManifest = None
+                 ) -> int:
+    """
+    Accumulate the pieces of the source blocks that fall into a buffer and flush the buffer,
+    which consists of whole write cells (chunks, or shards for zarr v3), to the array.
+    Returns the number of chunks that were skipped as empty.
+    """
+    shape = tuple(sl.stop - sl.start for sl in region)
+    buffer = _assemble_buffer(shape, zarr_array.dtype, offsets, pieces)
+    location = [(sl.start, sl.stop) for sl in region]
+    skipped = 0
+    if not skip_empty_chunks:
+        zarr_array[region] = buffer
+    else:
+        for cell in _grid_regions(location, grid):
+            local = tuple(slice(a - sl.start, b - sl.start) for (a, b), sl in zip(cell, region))
+            if is_constant_block(buffer[local], zarr_array.fill_value):
+                skipped += _count_chunks(buffer[local].shape, zarr_array.chunks)
+                continue
+            zarr_array[tuple(slice(a, b) for a, b in cell)] = buffer[local]
+            skipped += _count_empty_chunks(buffer[local], [a for a, _ in cell], zarr_array.chunks,
+                                           zarr_array.fill_value)
+    if manifest is not None:
+        manifest.record(_cells_of(location, grid))
+    return skipped
+
+def write_with_accumulator(arr: da.Array,
+                           store_path: Union[str, Path],
+                           chunks: Optional[Tuple[int, ...]] = None,
+                           shards: Optional[Tuple[int, ...]] = None,
+                           dimension_names: str = None,
+                           dtype: Any = None,
+                           compressor: str = 'blosc',
+                           compressor_params: dict = None,
+                           rechunk_method: str = 'tasks',
+                           overwrite: bool = True,
+                           zarr_format: int = 2,
+                           **kwargs
+                           ):
+    """
+    Write dask array to zarr storage without rechunking, by streaming the source blocks into
+    accumulation buffers that are flushed as soon as all their pieces have arrived.
+
+    This suits inputs whose blocks are much smaller than the output chunks along some axes,
+    such as plane-by-plane TIFF stacks. Each buffer is made of whole chunks (or shards for
+    zarr v3) and is bounded by accumulator_buffer_mb. Every source block is sliced into the
+    pieces needed by each buffer, so that a task only receives the data it writes. The graph
+    thus has one task per buffer plus one per piece, instead of the split and merge stages of
+    a rechunk.
+
+    Args:
+        arr: Dask array to write
+        store_path: Path where the Zarr array will be stored
+        chunks: Chunk size for each dimension
+        shards: Shard size for zarr v3 format
+        dtype: Data type of the array (defaults to arr.dtype)
+        compressor: Compression algorithm ('blosc' by default)
+        compressor_params: Parameters for the compressor
+        rechunk_method: Unused, accepted for compatibility with the other writers
+        zarr_format: Zarr format version (2 or 3)
+        **kwargs: Additional arguments, e.g. accumulator_buffer_mb and skip_empty_chunks
+
+    Returns:
+        A delayed object that returns the number of chunks skipped as empty.
+    """
+    store_path = str(store_path)
+    dtype = dtype or arr.dtype
+    compressor_params = compressor_params or {}
+
+    if chunks is None:
+        chunks = arr.chunksize
+    chunks = tuple(int(size) for size in np.minimum(chunks, arr.shape))
+
+    if shards is None:
+        shards = copy.deepcopy(chunks)
+
+    if not np.allclose(np.mod(shards, chunks), 0):
+        multiples = np.maximum(np.floor_divide(shards, chunks), 1)
+        shards = np.multiply(multiples, chunks)
+
+    shards = tuple(int(size) for size in np.ravel(shards))
+    grid = chunks if zarr_format == 2 else shards
+
+    compressor_config = CompressorConfig(name=compressor,
+                                         params=compressor_params)
+
+    zarr_array, manifest = _create_or_resume_zarr_array(
+        store_path=store_path,
+        shape=arr.shape,
+        chunks=chunks,
+        dtype=dtype,
+        overwrite=overwrite,
+        compressor_config=compressor_config,
+        zarr_format=zarr_format,
+        shards=shards,
+        dimension_names=dimension_names,
+        **kwargs
+    )
+
+    if _skip_if_complete(manifest):
+        return _complete_manifest([], manifest)
+    budget_bytes = kwargs.get('accumulator_buffer_mb', DEFAULT_ACCUMULATOR_BUFFER_MB) * 1024 ** 2
+    buffer_shape = _plan_buffer_shape(arr.chunksize, grid, np.dtype(dtype).itemsize, budget_bytes)
+    block_bounds = [np.cumsum((0,) + axis_chunks) for axis_chunks in arr.chunks]
+    blocks = arr.to_delayed()
+    skip_empty_chunks = kwargs.get('skip_empty_chunks', False)
+    done = manifest.completed() if manifest is not None else set()
+
+    skipped = []
+    for region in get_regions(arr.shape, buffer_shape, as_slices=True):
+        if all(cell in done for cell in _cells_of([(sl.start, sl.stop) for sl in region], grid)):
+            continue
+        # Find the source blocks overlapping the buffer along each axis.
+        per_axis = []
+        for sl, bounds in zip(region, block_bounds):
+            first = int(np.searchsorted(bounds, sl.start, side='right')) - 1
+            last = int(np.searchsorted(bounds, sl.stop, side='left'))
+            per_axis.append(range(first, last))
+        offsets, pieces = [], []
+        for block_index in itertools.product(*per_axis):
+            starts = [int(block_bounds[axis][idx]) for axis, idx in enumerate(block_index)]
+            stops = [int(block_bounds[axis][idx + 1]) for axis, idx in enumerate(block_index)]
+            lo = [max(sl.start, st) for sl, st in zip(region, starts)]
+            hi = [min(sl.stop, sp) for sl, sp in zip(region, stops)]
+            block = blocks[block_index]
+            if lo != starts or hi != stops:
+                block = block[tuple(slice(l - st, h - st) for l, h, st in zip(lo, hi, starts))]
+            offsets.append(tuple(l - sl.start for l, sl in zip(lo, region)))
+            pieces.append(block)
+        skipped.append(delayed(write_buffer)(zarr_array, region, offsets, *pieces,
+                                             grid=grid,
+                                             skip_empty_chunks=skip_empty_chunks,
+                                             manifest=manifest))
+    return _complete_manifest(skipped, manifest)
 
 
 @delayed
@@ -473,6 +1362,117 @@ def _get_or_create_multimeta(gr: zarr.Group,
         handler.parse_axes(axis_order=axis_order, units=unit_list)
     return handler
 
+class MetadataBatch:
+    """
+    Collects the NGFF metadata updates of a batch of images, so that every group is opened and its
+    metadata read only once, however many of its layers are in the batch. The updates are written
+    with one save per group, and the saves of all groups run in parallel.
+    """
+    def __init__(self,
+                 zarr_format: int = ZARR_V2,
+                 overwrite: bool = False,
+                 max_workers: int = DEFAULT_METADATA_WORKERS
+                 ):
+        self.zarr_format = zarr_format
+        self.overwrite = overwrite
+        self.max_workers = max_workers
+        self.handlers = {}
+
+    def get(self,
+            dirpath: Union[str, Path],
+            axis_order: str,
+            unit_list: List[str]
+            ) -> NGFFMetadataHandler:
+        """Return the metadata handler of a group, opening or creating the group on first use."""
+        if dirpath not in self.handlers:
+            store = resolve_store(dirpath)
+            if is_zarr_group(store):
+                gr = zarr.open_group(store, mode='a')
+            else:
+                gr = zarr.group(store, overwrite=self.overwrite, zarr_version=self.zarr_format)
+            version = '0.5' if self.zarr_format == 3 else '0.4'
+            self.handlers[dirpath] = _get_or_create_multimeta(gr,
+                                                              axis_order=axis_order,
+                                                              unit_list=unit_list,
+                                                              version=version
+                                                              )
+        return self.handlers[dirpath]
+
+    def commit(self) -> None:
+        """Save the pending changes of all groups."""
+        handlers = list(self.handlers.values())
+        if len(handlers) == 0:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(handlers)))) as pool:
+            list(pool.map(lambda handler: handler.save_changes(), handlers))
+        self.handlers = {}
+
+def _derive_pyramid_layers(arr: da.Array,
+                           axes: str,
+                           scale: Tuple[float, ...],
+                           time_scale_factor: int = 1,
+                           channel_scale_factor: int = 1,
+                           z_scale_factor: int = 1,
+                           y_scale_factor: int = 1,
+                           x_scale_factor: int = 1,
+                           n_layers: int = 1,
+                           downscale_method: str = 'simple',
+                           cascade: str = 'graph',
+                           min_dimension_size: int = None,
+                           **kwargs
+                           ) -> Dict[str, Tuple[da.Array, Tuple[float, ...]]]:
+    """
+    Derive the lower resolution layers of a base array without touching storage.
+
+    Parameters
+    ----------
+    arr : da.Array
+        Base layer, already chunked as it is going to be written.
+    axes : str
+        Axis order of the base layer.
+    scale : Tuple[float, ...]
+        Pixel scale of the base layer.
+    time_scale_factor, channel_scale_factor, z_scale_factor, y_scale_factor, x_scale_factor : int
+        Downscaling factors per axis.
+    n_layers : int or str
+        Total number of layers including the base layer, or 'auto'.
+    downscale_method : str
+        Downscaling algorithm.
+    cascade : str
+        Anything other than 'off' derives each layer from the layer before it.
+    min_dimension_size : int
+        Smallest lateral size a layer may have.
+
+    Returns
+    -------
+    layers : Dict[str, Tuple[da.Array, Tuple[float, ...]]]
+        Mapping of layer paths to the downscaled arrays and their pixel scales.
+    """
+    scale_factor_dict = {
+        't': time_scale_factor,
+        'c': channel_scale_factor,
+        'z': z_scale_factor,
+        'y': y_scale_factor,
+        'x': x_scale_factor
+    }
+    scale_factor = [scale_factor_dict[ax] for ax in axes]
+    scale_factor = tuple(np.minimum(arr.shape, scale_factor))
+    downscaler = Downscaler(array=arr,
+                            scale_factor=scale_factor,
+                            n_layers=n_layers,
+                            scale=scale,
+                            downscale_method=downscale_method,
+                            cascade=cascade not in (False, None, 'off'),
+                            axes=''.join(axes),
+                            min_dimension_size=min_dimension_size
+                            )
+    layers = {}
+    for level, layer in downscaler.downscaled_arrays.items():
+        if level == '0':
+            continue
+        layers[level] = (layer, tuple(downscaler.dm.scales[int(level)].tolist()))
+    return layers
+
 def store_arrays(arrays: Dict[str, Dict[str, da.Array]], # flatarrays
                  output_path: Union[Path, str],
                  axes: list, # flataxes
@@ -496,10 +1496,48 @@ def store_arrays(arrays: Dict[str, Dict[str, da.Array]], # flatarrays
     zarr_format = kwargs.get('zarr_format', 2)
     output_shards = kwargs.get('output_shards', None)
     target_chunk_mb = kwargs.get('target_chunk_mb', 1)
-
-    writer_func = write_with_tensorstore if use_tensorstore else write_with_zarrpy
-
+    target_shard_mb = kwargs.get('target_shard_mb', None)
+    access_profile = kwargs.get('access_profile', None)
+    max_files_per_array = kwargs.get('max_files_per_array', None)
+    # When given, the pyramid is derived from the base blocks in memory and written in the same compute.
+    pyramid_params = kwargs.pop('pyramid_params', None)
+
+    assemble_shards = kwargs.get('assemble_shards', False)
+    accumulate_chunks = kwargs.get('accumulate_chunks', False)
+    compressor = kwargs.get('compressor', 'blosc')
+
+    zip_output = kwargs.get('zip_output', False) or any(is_zip_output(key) for key in arrays.keys())
+    if zip_output:
+        # Zip entries cannot be rewritten, so every chunk, or every shard for zarr v3, must be written whole.
+        if use_tensorstore:
+            logger.warning(f"Tensorstore cannot write into zip files. Zarr-python is used instead.")
+            use_tensorstore = False
+        if zarr_format == 3 and not accumulate_chunks:
+            assemble_shards = True
+
+    if use_tensorstore:
+        writer_func = write_with_tensorstore
+    elif accumulate_chunks:
+        writer_func = write_with_accumulator
+    elif assemble_shards and zarr_format == 3:
+        writer_func = write_with_shards
+    else:
+        writer_func = write_with_zarrpy
+
+    resume = kwargs.get('resume', False)
+    if resume:
+        if is_remote_path(output_path) or zip_output:
+            raise ValueError(f"Resuming is only supported for local directory outputs, not for {output_path}.")
+        # Keep whatever has been written so far; the writers only add the missing chunks.
+        overwrite = False
     zarr.group(output_path, overwrite=overwrite, zarr_version = zarr_format)
+    if kwargs.get('zip_output', False):
+        # Only now, as overwriting the output group above clears the output directory.
+        for image_path in sorted(set(os.path.dirname(key) for key in arrays.keys())):
+            open_zip_output(image_path, zarr_format=zarr_format, overwrite=overwrite)
+    metadata_batch = MetadataBatch(zarr_format=zarr_format,
+                                   overwrite=overwrite,
+                                   max_workers=kwargs.get('metadata_workers', DEFAULT_METADATA_WORKERS))
     results = {}
 
     for key, arr in arrays.items():
@@ -520,7 +1558,10 @@ def store_arrays(arrays: Dict[str, Dict[str, da.Array]], # flatarrays
             flatchunks = autocompute_chunk_shape(arr.shape,
                                                  axes=flataxes,
                                                  target_chunk_mb=target_chunk_mb,
-                                                 dtype=dtype
+                                                 dtype=dtype,
+                                                 # With an access profile, the chunks also follow the source blocks.
+                                                 source_chunks=arr.chunksize if access_profile is not None else None,
+                                                 access_profile=access_profile
                                                  )
             if verbose:
                 logger.info(f"Auto-chunking {key} to {flatchunks}")
@@ -533,6 +1574,16 @@ def store_arrays(arrays: Dict[str, Dict[str, da.Array]], # flatarrays
         if zarr_format == 3:
             if output_shards is not None:
                 shards = output_shards[key]
+            elif target_shard_mb is not None or max_files_per_array is not None:
+                shards = autocompute_shard_shape(arr.shape,
+                                                 chunks,
+                                                 axes=flataxes,
+                                                 target_shard_mb=target_shard_mb,
+                                                 max_files_per_array=max_files_per_array,
+                                                 dtype=dtype
+                                                 )
+                if verbose:
+                    logger.info(f"Auto-sharding {key} to {shards}")
             elif output_shard_coefficients is not None:
                 flatshardcoefs = output_shard_coefficients[key]
                 shards = np.multiply(chunks, flatshardcoefs)
@@ -543,27 +1594,48 @@ def store_arrays(arrays: Dict[str, Dict[str, da.Array]], # flatarrays
         else:
             shards = None
 
+        writer_kwargs = dict(kwargs)
+        if compressor == 'auto':
+            samples = sample_chunks(arr, chunks,
+                                    kwargs.get('compressor_sample_chunks', DEFAULT_COMPRESSOR_SAMPLE_CHUNKS))
+            (writer_kwargs['compressor'],
+             writer_kwargs['compressor_params'],
+             ratio,
+             throughput) = tune_compressor(samples,
+                                           zarr_format=zarr_format,
+                                           min_throughput=kwargs.get('min_compression_throughput',
+                                                                     DEFAULT_MIN_COMPRESSION_THROUGHPUT),
+                                           allow_pcodec=zarr_format == 2 and not use_tensorstore)
+            logger.info(f"Compressor chosen for {key}: {writer_kwargs['compressor']} "
+                        f"{writer_kwargs['compressor_params']} (ratio {ratio:.2f}, {throughput:.0f} MB/s)")
+
         dirpath = os.path.dirname(key)
         arrpath = os.path.basename(key)
 
-        if is_zarr_group(dirpath):
-            gr = zarr.open_group(dirpath, mode='a')
-        else:
-            gr = zarr.group(dirpath, overwrite=overwrite, zarr_version = zarr_format)
-
-        version = '0.5' if zarr_format == 3 else '0.4'
-
-        meta = _get_or_create_multimeta(gr,
-                                        axis_order=flataxes,
-                                        unit_list=flatunit,
-                                        version=version
-                                        )
+        meta = metadata_batch.get(dirpath,
+                                  axis_order=flataxes,
+                                  unit_list=flatunit
+                                  )
 
         meta.add_dataset(path=arrpath,
                          scale=flatscale,
                          overwrite=True)
         meta.retag(os.path.basename(dirpath))
 
+        layers = {}
+        if pyramid_params is not None and arrpath == '0':
+            # Rechunk once to the write grid so that the base writer and the first
+            # downscaled layer consume the very same blocks.
+            write_grid = shards if zarr_format == 3 and writer_func is not write_with_shards else chunks
+            write_grid = tuple(np.minimum(write_grid, arr.shape).tolist())
+            if not np.equal(arr.chunksize, write_grid).all():
+                arr = arr.rechunk(write_grid, method=rechunk_method)
+            layers = _derive_pyramid_layers(arr, flataxes, flatscale, **pyramid_params)
+            for level, (_, layer_scale) in layers.items():
+                meta.add_dataset(path=level,
+                                 scale=layer_scale,
+                                 overwrite=True)
+
         if flatchannels == 'auto':
             if 'c' in flataxes:
                 idx = flataxes.index('c')
@@ -579,7 +1651,6 @@ def store_arrays(arrays: Dict[str, Dict[str, da.Array]], # flatarrays
                                  label = channel['label'],
                                  dtype = dtype.str
                                  )
-        meta.save_changes()
 
         if verbose:
             logger.info(f"Writer function: {writer_func}")
@@ -591,19 +1662,34 @@ def store_arrays(arrays: Dict[str, Dict[str, da.Array]], # flatarrays
                                    shards = shards,
                                    dimension_names = flataxes,
                                    overwrite=overwrite,
-                                   **kwargs
+                                   **writer_kwargs
                                    )
+        for level, (layer, _) in layers.items():
+            layerpath = os.path.join(dirpath, level)
+            results[layerpath] = writer_func(arr=layer,
+                                             store_path=layerpath,
+                                             chunks=tuple(np.minimum(chunks, layer.shape).tolist()),
+                                             shards=shards,
+                                             dimension_names=flataxes,
+                                             overwrite=overwrite,
+                                             **writer_kwargs
+                                             )
+
+    metadata_batch.commit()
 
     if compute:
         try:
             # dask.compute(list(results.values()), retries = 6)
-            dask.compute(
+            (counts,) = dask.compute(
                 list(results.values()),
                 retries=6,
             )
+            if kwargs.get('skip_empty_chunks', False):
+                report_skipped_chunks(list(results.keys()), counts)
         except Exception as e:
-            # print(e)
-            pass
+            if resume:
+                logger.error(f"Writing failed: {e}. Run again with resume to write the missing chunks only.")
+            raise
     else:
         return results
     return results
@@ -11,10 +11,14 @@ from typing import Union
 # from eubi_bridge.ngff.multiscales import Pyramid
 # from eubi_bridge.ngff import defaults
 from eubi_bridge.base.data_manager import BatchManager
-from eubi_bridge.ebridge_base import BridgeBase, downscale
+from eubi_bridge.base.writers import build_tensorstore_context_spec
+from eubi_bridge.ebridge_base import BridgeBase, downscale, extend_pyramid, repair_pyramid_layer, consolidate_groups
 from eubi_bridge.utils.convenience import take_filepaths, is_zarr_group
 from eubi_bridge.utils.metadata_utils import print_printable, get_printables
 from eubi_bridge.utils.logging_config import get_logger
+from eubi_bridge.utils.storage import is_remote_path, configure_remote_storage, close_zip_outputs
+from eubi_bridge.utils.metadata_cache import configure_metadata_cache
+from eubi_bridge.base.metadata_service import configure_metadata_service
 
 import logging, warnings
 
@@ -196,7 +200,16 @@ class EuBIBridge:
                 scene_index=0,
                 rotation_index=0,
                 mosaic_tile_index=0,
-                sample_index=0
+                sample_index=0,
+                tiff_fast_path=True,
+                probe_workers=16,
+                assume_homogeneous=False,
+                homogeneous_sample_size=0,
+                metadata_cache=True,
+                metadata_cache_max_age_days=30,
+                metadata_cache_max_size_mb=256,
+                metadata_service_workers=2,
+                metadata_service_timeout=300
             ),                
             conversion = dict(
                 zarr_format = 2,
@@ -225,7 +238,25 @@ class EuBIBridge:
                 trim_memory=False,
                 metadata_reader = 'bfio',
                 save_omexml = True,
-                squeeze = False
+                squeeze = False,
+                assemble_shards = False,
+                async_writes = False,
+                max_inflight_writes = 16,
+                skip_empty_chunks = False,
+                min_compression_throughput = 100,
+                accumulate_chunks = False,
+                accumulator_buffer_mb = 256,
+                resume = False,
+                consolidate_metadata = True,
+                metadata_workers = 16,
+                s3_endpoint_url = None,
+                s3_max_connections = 64,
+                s3_multipart_concurrency = 8,
+                s3_request_concurrency = 64,
+                zip_output = False,
+                target_shard_mb = None,
+                max_files_per_array = None,
+                access_profile = None
             ),
             downscale = dict(
                 time_scale_factor = 1,
@@ -235,20 +266,26 @@ class EuBIBridge:
                 x_scale_factor = 2,
                 n_layers=3,
                 downscale_method='simple',
+                cascade='graph',
+                fused=False,
+                min_dimension_size=None,
             )
         )
 
         self.root_defaults = defaults
         self.root_dask_defaults = root_dask_defaults
+        self._configpath = configpath
         config_gr = zarr.open_group(configpath, mode = 'a')
         config = config_gr.attrs
         for key in defaults.keys():
-            if key not in config.keys():
-                config[key] = {}
-                for subkey in defaults[key].keys():
-                    if subkey not in config[key].keys():
-                        config[key][subkey] = defaults[key][subkey]
-            config_gr.attrs[key] = config[key]
+            section = dict(config[key]) if key in config.keys() else {}
+            # Parameters introduced after the configuration was first written are filled in here.
+            for subkey in defaults[key].keys():
+                if subkey not in section.keys():
+                    section[subkey] = defaults[key][subkey]
+            # Renamed or removed parameters are dropped, so that they cannot shadow a parameter of another section.
+            section = {subkey: value for subkey, value in section.items() if subkey in defaults[key]}
+            config_gr.attrs[key] = section
         self.config = dict(config_gr.attrs)
         ###
         if not 'dask_config' in config_gr.keys():
@@ -263,6 +300,7 @@ class EuBIBridge:
         ###
         self._dask_temp_dir = None
         self.client = None
+        self._ts_context_spec = None
 
     def reset_config(self):
         """
@@ -384,10 +422,39 @@ class EuBIBridge:
                           rotation_index: int = 'default',
                           mosaic_tile_index: int = 'default',
                           sample_index: int = 'default',
+                          tiff_fast_path: bool = 'default',
+                          probe_workers: int = 'default',
+                          assume_homogeneous: bool = 'default',
+                          homogeneous_sample_size: int = 'default',
+                          metadata_cache: bool = 'default',
+                          metadata_cache_max_age_days: float = 'default',
+                          metadata_cache_max_size_mb: float = 'default',
+                          metadata_service_workers: int = 'default',
+                          metadata_service_timeout: float = 'default',
                          ):
         """
         Updates reader configuration settings. To update the current default value for a parameter, provide that parameter with a value other than 'default'.
 
+        Args:
+            tiff_fast_path (bool, optional): Read TIFF files with tifffile directly instead of through bioio:
+                uncompressed files memory-mapped, compressed strip and tiled files block by block through
+                tifffile's zarr store. OME-TIFF files, and files whose axes do not map to TCZYX, use bioio.
+            probe_workers (int, optional): Number of threads that probe the image headers concurrently. Images
+                with a header probe (TIFF files read by tifffile) skip the construction of a full reader.
+            assume_homogeneous (bool, optional): Assume that all input images share the shape and dtype of the
+                first one, which is then the only image probed. Each image is checked when it is read.
+            homogeneous_sample_size (int, optional): Number of further images, chosen at random, that are probed
+                and validated up front when assume_homogeneous is set.
+            metadata_cache (bool, optional): Keep the metadata read from the input files in a SQLite database
+                in the configuration directory, and reuse it while a file keeps its size and modification time.
+            metadata_cache_max_age_days (float, optional): Age after which an unused cache entry is dropped.
+            metadata_cache_max_size_mb (float, optional): Size of the cached metadata above which the least
+                recently used entries are dropped.
+            metadata_service_workers (int, optional): Number of long-lived processes that read metadata with bfio, each
+                keeping its JVM warm across files and conversions. 0 reads the metadata in the conversion tasks.
+            metadata_service_timeout (float, optional): Time in seconds after which reading the metadata of a file in a
+                metadata process fails; the process is then restarted and the file is read in its task instead.
+
         Returns:
             None
         """
@@ -400,7 +467,16 @@ class EuBIBridge:
             'scene_index': scene_index,
             'rotation_index': rotation_index,
             'mosaic_tile_index': mosaic_tile_index,
-            'sample_index': sample_index
+            'sample_index': sample_index,
+            'tiff_fast_path': tiff_fast_path,
+            'probe_workers': probe_workers,
+            'assume_homogeneous': assume_homogeneous,
+            'homogeneous_sample_size': homogeneous_sample_size,
+            'metadata_cache': metadata_cache,
+            'metadata_cache_max_age_days': metadata_cache_max_age_days,
+            'metadata_cache_max_size_mb': metadata_cache_max_size_mb,
+            'metadata_service_workers': metadata_service_workers,
+            'metadata_service_timeout': metadata_service_timeout
         }
 
         for key in params:
@@ -438,13 +514,31 @@ class EuBIBridge:
                              use_gpu: bool = 'default',
                              metadata_reader: str = 'default',
                              save_omexml: bool = 'default',
-                             squeeze: bool = 'default'
+                             squeeze: bool = 'default',
+                             assemble_shards: bool = 'default',
+                             async_writes: bool = 'default',
+                             max_inflight_writes: int = 'default',
+                             skip_empty_chunks: bool = 'default',
+                             min_compression_throughput: float = 'default',
+                             accumulate_chunks: bool = 'default',
+                             accumulator_buffer_mb: float = 'default',
+                             resume: bool = 'default',
+                             consolidate_metadata: bool = 'default',
+                             metadata_workers: int = 'default',
+                             s3_endpoint_url: str = 'default',
+                             s3_max_connections: int = 'default',
+                             s3_multipart_concurrency: int = 'default',
+                             s3_request_concurrency: int = 'default',
+                             zip_output: bool = 'default',
+                             target_shard_mb: float = 'default',
+                             max_files_per_array: int = 'default',
+                             access_profile: str = 'default'
                              ):
         """
         Updates conversion configuration settings. To update the current default value for a parameter, provide that parameter with a value other than 'default'.
 
         The following parameters can be configured:
-            - compressor (str, optional): Compression algorithm.
+            - compressor (str, optional): Compression algorithm. If 'auto', the compressor is chosen per image by benchmarking candidates on a sample of its chunks.
             - compressor_params (dict, optional): Parameters for the compressor.
             - output_chunks (list, optional): Chunk size for output.
             - overwrite (bool, optional): Whether to overwrite existing data.
@@ -452,8 +546,26 @@ class EuBIBridge:
             - trim_memory (bool, optional): Whether to trim memory usage.
             - use_tensorstore (bool, optional): Whether to use TensorStore for writing.
             - save_omexml (bool, optional): Whether to create a METADATA.ome.xml file.
+            - assemble_shards (bool, optional): For zarr v3, write each shard in a single task that assembles its blocks, instead of rechunking to the shard shape.
+            - async_writes (bool, optional): Keep several chunk writes in flight per task, so that compression and file I/O overlap.
+            - max_inflight_writes (int, optional): Maximum number of chunk writes in flight when async_writes is set: per worker process, shared by all its tasks, for zarr-python; per task for tensorstore, whose shared context bounds the I/O of the process.
+            - skip_empty_chunks (bool, optional): If True, chunks that only contain the fill value are not written and the number of skipped chunks is logged.
+            - min_compression_throughput (float, optional): Minimum encoding throughput in MB/s that a compressor chosen with compressor='auto' must reach.
+            - accumulate_chunks (bool, optional): Write by streaming the input blocks into chunk-aligned buffers instead of rechunking. Suits plane-by-plane inputs such as TIFF stacks. Ignored with use_tensorstore.
+            - accumulator_buffer_mb (float, optional): Maximum size in MB of a single accumulation buffer when accumulate_chunks is set.
+            - resume (bool, optional): Record the written chunks of every array in a manifest and, for arrays that already exist with the same layout, write only the chunks missing from it. Use it for the first run too, so that an interrupted conversion can be resumed. Once an array is complete, its manifest is reduced to a marker file, with which later runs skip the array without reading its input. Resuming assumes that the input has not changed since the interrupted run.
+            - consolidate_metadata (bool, optional): Write consolidated metadata (.zmetadata for zarr v2, inside zarr.json for zarr v3) for every output OME-Zarr once the conversion is finished.
+            - metadata_workers (int, optional): Number of threads that write the metadata of different images in parallel.
+            - s3_endpoint_url (str, optional): Endpoint URL of an S3-compatible object store (e.g. MinIO) for s3:// output paths. Defaults to AWS S3.
+            - s3_max_connections (int, optional): Size of the HTTP connection pool used for s3:// outputs.
+            - s3_multipart_concurrency (int, optional): Number of parts uploaded concurrently when an object (typically a shard) is written in parts to s3://.
+            - s3_request_concurrency (int, optional): Number of concurrent store requests of zarr-python and tensorstore for s3:// outputs.
+            - zip_output (bool, optional): Write every output OME-Zarr into a single uncompressed zip file (image.ozx for zarr v3, image.zarr.zip for v2) in one pass instead of a directory tree. Runs without a distributed cluster, as a zip file has a single writer.
+            - target_shard_mb (float, optional): Zarr v3 only. Target uncompressed shard size in MB. If set, the shard shape of every array is planned from its chunk shape to land near this size, and the *_shard_coef parameters are ignored.
+            - max_files_per_array (int, optional): Zarr v3 only. Upper bound for the number of shard files per array. Shards are enlarged until the bound is met, overriding target_shard_mb if needed.
+            - access_profile (str, optional): How the output will mostly be read, used when chunks are computed automatically: 'volumetric', '2d-browse' or 'time-series'. If set, the chunks are also aligned with the blocks of the source (multiples or divisors of them), which avoids rechunking traffic. If None, the budget is spread over the spatial axes without alignment.
         Args:
-            compressor (str, optional): Compression algorithm.
+            compressor (str, optional): Compression algorithm. If 'auto', the compressor is chosen per image by benchmarking candidates on a sample of its chunks.
             compressor_params (dict, optional): Parameters for the compressor.
             output_chunks (list, optional): Chunk size for output.
             overwrite (bool, optional): Whether to overwrite existing data.
@@ -461,6 +573,24 @@ class EuBIBridge:
             trim_memory (bool, optional): Whether to trim memory usage.
             use_tensorstore (bool, optional): Whether to use TensorStore for storage.
             save_omexml (bool, optional): Whether to create a METADATA.ome.xml file.
+            assemble_shards (bool, optional): For zarr v3, write each shard in a single task that assembles its blocks, instead of rechunking to the shard shape.
+            async_writes (bool, optional): Keep several chunk writes in flight per task, so that compression and file I/O overlap.
+            max_inflight_writes (int, optional): Maximum number of chunk writes in flight when async_writes is set: per worker process, shared by all its tasks, for zarr-python; per task for tensorstore, whose shared context bounds the I/O of the process.
+            skip_empty_chunks (bool, optional): If True, chunks that only contain the fill value are not written and the number of skipped chunks is logged.
+            min_compression_throughput (float, optional): Minimum encoding throughput in MB/s that a compressor chosen with compressor='auto' must reach.
+            accumulate_chunks (bool, optional): Write by streaming the input blocks into chunk-aligned buffers instead of rechunking. Suits plane-by-plane inputs such as TIFF stacks. Ignored with use_tensorstore.
+            accumulator_buffer_mb (float, optional): Maximum size in MB of a single accumulation buffer when accumulate_chunks is set.
+            resume (bool, optional): Record the written chunks of every array in a manifest and, for arrays that already exist with the same layout, write only the chunks missing from it. Use it for the first run too, so that an interrupted conversion can be resumed. Once an array is complete, its manifest is reduced to a marker file, with which later runs skip the array without reading its input. Resuming assumes that the input has not changed since the interrupted run.
+            consolidate_metadata (bool, optional): Write consolidated metadata (.zmetadata for zarr v2, inside zarr.json for zarr v3) for every output OME-Zarr once the conversion is finished.
+            metadata_workers (int, optional): Number of threads that write the metadata of different images in parallel.
+            s3_endpoint_url (str, optional): Endpoint URL of an S3-compatible object store (e.g. MinIO) for s3:// output paths. Defaults to AWS S3.
+            s3_max_connections (int, optional): Size of the HTTP connection pool used for s3:// outputs.
+            s3_multipart_concurrency (int, optional): Number of parts uploaded concurrently when an object (typically a shard) is written in parts to s3://.
+            s3_request_concurrency (int, optional): Number of concurrent store requests of zarr-python and tensorstore for s3:// outputs.
+            zip_output (bool, optional): Write every output OME-Zarr into a single uncompressed zip file (image.ozx for zarr v3, image.zarr.zip for v2) in one pass instead of a directory tree. Runs without a distributed cluster, as a zip file has a single writer.
+            target_shard_mb (float, optional): Zarr v3 only. Target uncompressed shard size in MB. If set, the shard shape of every array is planned from its chunk shape to land near this size, and the *_shard_coef parameters are ignored.
+            max_files_per_array (int, optional): Zarr v3 only. Upper bound for the number of shard files per array. Shards are enlarged until the bound is met, overriding target_shard_mb if needed.
+            access_profile (str, optional): How the output will mostly be read, used when chunks are computed automatically: 'volumetric', '2d-browse' or 'time-series'. If set, the chunks are also aligned with the blocks of the source (multiples or divisors of them), which avoids rechunking traffic. If None, the budget is spread over the spatial axes without alignment.
 
         Returns:
             None
@@ -494,7 +624,25 @@ class EuBIBridge:
             'use_gpu': use_gpu,
             'metadata_reader': metadata_reader,
             'save_omexml': save_omexml,
-            'squeeze': squeeze
+            'squeeze': squeeze,
+            'assemble_shards': assemble_shards,
+            'async_writes': async_writes,
+            'max_inflight_writes': max_inflight_writes,
+            'skip_empty_chunks': skip_empty_chunks,
+            'min_compression_throughput': min_compression_throughput,
+            'accumulate_chunks': accumulate_chunks,
+            'accumulator_buffer_mb': accumulator_buffer_mb,
+            'resume': resume,
+            'consolidate_metadata': consolidate_metadata,
+            'metadata_workers': metadata_workers,
+            's3_endpoint_url': s3_endpoint_url,
+            's3_max_connections': s3_max_connections,
+            's3_multipart_concurrency': s3_multipart_concurrency,
+            's3_request_concurrency': s3_request_concurrency,
+            'zip_output': zip_output,
+            'target_shard_mb': target_shard_mb,
+            'max_files_per_array': max_files_per_array,
+            'access_profile': access_profile
         }
 
         for key in params:
@@ -511,6 +659,9 @@ class EuBIBridge:
                             z_scale_factor: int = 'default',
                             y_scale_factor: int = 'default',
                             x_scale_factor: int = 'default',
+                            cascade: str = 'default',
+                            fused: bool = 'default',
+                            min_dimension_size: int = 'default',
                             ):
         """
         Updates downscaling configuration settings. To update the current default value for a parameter, provide that parameter with a value other than 'default'.
@@ -519,11 +670,21 @@ class EuBIBridge:
             - downscale_method (str, optional): Downscaling algorithm.
             - n_layers (int, optional): Number of downscaling layers.
             - scale_factor (list, optional): Scaling factors for each dimension.
+            - cascade (str, optional): Where each layer is computed from ('graph', 'disk' or 'off').
+            - fused (bool, optional): Write the pyramid together with the base layer.
+            - min_dimension_size (int, optional): Smallest lateral size of a downscaled layer.
 
         Args:
             downscale_method (str, optional): Downscaling algorithm.
-            n_layers (int, optional): Number of downscaling layers.
+            n_layers (int, optional): Number of downscaling layers. Use 'auto' to let the number of layers
+                be determined by min_dimension_size.
             scale_factor (list, optional): Scaling factors for each dimension.
+            cascade (str, optional): 'graph' derives each layer from the previous one in a single graph,
+                'disk' reads the previous layer back from the output, 'off' derives every layer from the base layer.
+            fused (bool, optional): If True, the downscaled layers are derived from the base blocks while they are
+                in memory and written in the same compute as the base layer, so the base is never read back.
+            min_dimension_size (int, optional): No layer is created whose lateral dimensions would drop below
+                this size, and z is not downscaled below it either.
 
         Returns:
             None
@@ -537,6 +698,9 @@ class EuBIBridge:
             "z_scale_factor": z_scale_factor,
             "y_scale_factor": y_scale_factor,
             "x_scale_factor": x_scale_factor,
+            "cascade": cascade,
+            "fused": fused,
+            "min_dimension_size": min_dimension_size,
         }
 
         for key in params:
@@ -545,6 +709,16 @@ class EuBIBridge:
                     self.config['downscale'][key] = params[key]
         self.config_gr.attrs['downscale'] = self.config['downscale']
 
+    def _configure_metadata_reading(self):
+        # Set before the cluster starts, so that the worker processes inherit the settings.
+        path = os.path.join(self._configpath, 'metadata_cache.sqlite')
+        configure_metadata_cache(path if self.readers_params['metadata_cache'] else None,
+                                 max_age_days = self.readers_params['metadata_cache_max_age_days'],
+                                 max_size_mb = self.readers_params['metadata_cache_max_size_mb'])
+        configure_metadata_service(n_workers = self.readers_params['metadata_service_workers'],
+                                   timeout = self.readers_params['metadata_service_timeout'])
+        return self
+
     def _set_dask_temp_dir(self, temp_dir = 'auto'):
         if self._dask_temp_dir is not None:
             self._dask_temp_dir.cleanup()
@@ -594,6 +768,13 @@ class EuBIBridge:
                                )
             dask.config.set(config_dict)
             logger.info(f"Process running locally via multithreading.")
+            # All threads share the single process, and thus a single tensorstore context.
+            reserve_fraction = kwargs.get('reserve_memory_fraction', 0.1)
+            self._ts_context_spec = build_tensorstore_context_spec(
+                threads_per_worker = n_jobs,
+                memory_limit = psutil.virtual_memory().total * (1 - reserve_fraction),
+                s3_request_concurrency = self.conversion_params['s3_request_concurrency']
+            )
         else:
             if memory_limit == 'auto':
                 reserve_fraction = kwargs.get('reserve_memory_fraction', 0.1)
@@ -647,6 +828,11 @@ class EuBIBridge:
                                        )
             cluster.scale(n_jobs)
             self.client = Client(cluster)
+            self._ts_context_spec = build_tensorstore_context_spec(
+                threads_per_worker = threads_per_worker,
+                memory_limit = dask.utils.parse_bytes(memory_limit) if isinstance(memory_limit, str) else memory_limit,
+                s3_request_concurrency = self.conversion_params['s3_request_concurrency']
+            )
             if verbose:
                 logger.info(self.client.cluster)
         return self
@@ -670,6 +856,7 @@ class EuBIBridge:
         Args:
             input_path (Union[Path, str]): Path to input file or directory.
             output_path (Union[Path, str]): Directory, in which the output OME-Zarrs will be written.
+                Can also be the URL of an object store, e.g. s3://bucket/prefix.
             includes (str, optional): Filename patterns to filter for.
             excludes (str, optional): Filename patterns to filter against.
             time_tag (Union[str, tuple], optional): Time dimension tag.
@@ -714,6 +901,10 @@ class EuBIBridge:
         if not verified_for_cluster:
             self.cluster_params['no_distributed'] = True
 
+        if self.conversion_params['zip_output'] and not self.cluster_params['no_distributed']:
+            logger.warning(f"Zipped outputs are written by a single process. Running without a distributed cluster.")
+            self.cluster_params['no_distributed'] = True
+
         cluster_is_true = not self.cluster_params['no_distributed']
 
         if cluster_is_true:
@@ -727,6 +918,15 @@ class EuBIBridge:
         logger.info(f"Readers Params: {self.readers_params}")
         logger.info(f"Conversion Params: {self.conversion_params}")
         logger.info(f"Downscale Params: {self.downscale_params}")
+        if is_remote_path(output_path):
+            # Set before the cluster starts, so that the worker processes inherit the settings.
+            configure_remote_storage(
+                endpoint_url = self.conversion_params['s3_endpoint_url'],
+                max_connections = self.conversion_params['s3_max_connections'],
+                multipart_concurrency = self.conversion_params['s3_multipart_concurrency'],
+                request_concurrency = self.conversion_params['s3_request_concurrency']
+            )
+        self._configure_metadata_reading()
         self._start_cluster(**self.cluster_params)
 
         series = self.readers_params['scene_index']
@@ -778,30 +978,52 @@ class EuBIBridge:
             base.client = self.client
         base.set_dask_temp_dir(self._dask_temp_dir)
 
+        downscale_params = copy.deepcopy(self.downscale_params)
+        fused = downscale_params.pop('fused', False)
+        n_layers = downscale_params['n_layers']
+        has_pyramid = n_layers == 'auto' or int(n_layers) > 1
+        pyramid_params = downscale_params if fused and has_pyramid else None
+
         ###### Write
         self.base_results = base.write_arrays(output_path,
                                            compute=True,
                                            verbose=verbose,
+                                           pyramid_params=pyramid_params,
+                                           ts_context_spec=self._ts_context_spec,
                                            **self.conversion_params
                                            )
         ###### Downscale
         logger.info(f"Base conversion finished.")
         t1 = time.time()
         logger.info(f"Elapsed for base conversion: {(t1 - t0) / 60} min.")
-        n_layers = self.downscale_params['n_layers']
-        if n_layers > 1:
+        if has_pyramid and pyramid_params is None:
             logger.info(f"Downscaling initiated.")
             _ = downscale(
                       self.base_results,
-                      **self.downscale_params,
+                      **downscale_params,
                       zarr_format = self.conversion_params['zarr_format'],
                       rechunk_method = self.conversion_params['rechunk_method'],
                       use_tensorstore = self.conversion_params['use_tensorstore'],
+                      assemble_shards = self.conversion_params['assemble_shards'],
+                      async_writes = self.conversion_params['async_writes'],
+                      max_inflight_writes = self.conversion_params['max_inflight_writes'],
+                      skip_empty_chunks = self.conversion_params['skip_empty_chunks'],
+                      accumulate_chunks = self.conversion_params['accumulate_chunks'],
+                      accumulator_buffer_mb = self.conversion_params['accumulator_buffer_mb'],
+                      resume = self.conversion_params['resume'],
+                      access_profile = self.conversion_params['access_profile'],
+                      ts_context_spec = self._ts_context_spec,
                       verbose = verbose
                       ) # TODO: add to_cupy parameter here.
 
             logger.info(f"Downscaling finished.")
 
+        ###### Consolidate metadata
+        gr_paths = list(set(os.path.dirname(key) for key in self.base_results.keys()))
+        consolidate_groups(gr_paths, force=self.conversion_params['consolidate_metadata'])
+        for zip_path in close_zip_outputs():
+            logger.info(f"Finished writing {zip_path}.")
+
         ###### Shutdown and clean up
         if self.client is not None:
             self.client.shutdown()
@@ -819,6 +1041,134 @@ class EuBIBridge:
         logger.info(f"Elapsed for conversion + downscaling: {(t1 - t0) / 60} min.")
 
 
+    def _take_pyramid_paths(self,
+                            input_path: Union[Path, str],
+                            includes=None,
+                            excludes=None
+                            ):
+        paths = take_filepaths(input_path, includes = includes, excludes = excludes)
+        gr_paths = [path for path in sorted(paths) if is_zarr_group(path)]
+        if len(gr_paths) == 0:
+            raise ValueError(f"No OME-Zarr groups found for {input_path}")
+        return gr_paths
+
+    def _stop_cluster(self):
+        if self.client is not None:
+            self.client.shutdown()
+            self.client.close()
+
+        if isinstance(self._dask_temp_dir, tempfile.TemporaryDirectory):
+            self.remove_temp_dir(self._dask_temp_dir.name)
+        else:
+            self.remove_temp_dir(self._dask_temp_dir)
+
+    def extend_pyramid(self,
+                       input_path: Union[Path, str],
+                       includes=None,
+                       excludes=None,
+                       **kwargs
+                       ):
+        """
+        Adds the missing resolution layers to existing OME-Zarrs without recomputing the existing layers.
+
+        The new layers are derived from the deepest readable layer. Layers listed in the metadata after an
+        unreadable layer are deleted and, up to the requested number of layers, computed anew. If the
+        computation fails, the layers being added are removed again and the exception is raised. The number of layers and the scale factors are taken from the
+        downscale configuration, and can be overridden, e.g. with '--n_layers 6'.
+
+        Args:
+            input_path (Union[Path, str]): Path to an OME-Zarr or a directory of OME-Zarrs.
+            includes (str, optional): Filename patterns to filter for.
+            excludes (str, optional): Filename patterns to filter against.
+            **kwargs: Additional configuration overrides.
+
+        Returns:
+            None
+        """
+        t0 = time.time()
+        self.cluster_params = self._collect_params('cluster', **kwargs)
+        self.conversion_params = self._collect_params('conversion', **kwargs)
+        self.downscale_params = self._collect_params('downscale', **kwargs)
+
+        gr_paths = self._take_pyramid_paths(input_path, includes = includes, excludes = excludes)
+        self._start_cluster(**self.cluster_params)
+
+        downscale_params = copy.deepcopy(self.downscale_params)
+        for key in ('cascade', 'fused'):
+            downscale_params.pop(key, None)
+        try:
+            added = extend_pyramid(gr_paths,
+                                   **downscale_params,
+                                   rechunk_method = self.conversion_params['rechunk_method'],
+                                   use_tensorstore = self.conversion_params['use_tensorstore'],
+                                   assemble_shards = self.conversion_params['assemble_shards'],
+                                   async_writes = self.conversion_params['async_writes'],
+                                   max_inflight_writes = self.conversion_params['max_inflight_writes'],
+                                   skip_empty_chunks = self.conversion_params['skip_empty_chunks'],
+                                   accumulate_chunks = self.conversion_params['accumulate_chunks'],
+                                   accumulator_buffer_mb = self.conversion_params['accumulator_buffer_mb'],
+                                   consolidate_metadata = self.conversion_params['consolidate_metadata'],
+                                   access_profile = self.conversion_params['access_profile'],
+                                   ts_context_spec = self._ts_context_spec,
+                                   verbose = self.cluster_params['verbose']
+                                   )
+        finally:
+            self._stop_cluster()
+        for path, layers in added.items():
+            logger.info(f"Layers added to '{path}': {layers}")
+
+        t1 = time.time()
+        logger.info(f"Elapsed for extending the pyramids: {(t1 - t0) / 60} min.")
+
+    def repair_layer(self,
+                     input_path: Union[Path, str],
+                     level: Union[int, str],
+                     includes=None,
+                     excludes=None,
+                     **kwargs
+                     ):
+        """
+        Rebuilds a single resolution layer of existing OME-Zarrs from the layer before it.
+
+        Args:
+            input_path (Union[Path, str]): Path to an OME-Zarr or a directory of OME-Zarrs.
+            level (Union[int, str]): Path of the layer to rebuild, e.g. 2.
+            includes (str, optional): Filename patterns to filter for.
+            excludes (str, optional): Filename patterns to filter against.
+            **kwargs: Additional configuration overrides.
+
+        Returns:
+            None
+        """
+        self.cluster_params = self._collect_params('cluster', **kwargs)
+        self.conversion_params = self._collect_params('conversion', **kwargs)
+        self.downscale_params = self._collect_params('downscale', **kwargs)
+
+        gr_paths = self._take_pyramid_paths(input_path, includes = includes, excludes = excludes)
+        self._start_cluster(**self.cluster_params)
+
+        try:
+            for path in gr_paths:
+                repair_pyramid_layer(path,
+                                     level,
+                                     downscale_method = self.downscale_params['downscale_method'],
+                                     rechunk_method = self.conversion_params['rechunk_method'],
+                                     use_tensorstore = self.conversion_params['use_tensorstore'],
+                                     assemble_shards = self.conversion_params['assemble_shards'],
+                                     async_writes = self.conversion_params['async_writes'],
+                                     max_inflight_writes = self.conversion_params['max_inflight_writes'],
+                                     skip_empty_chunks = self.conversion_params['skip_empty_chunks'],
+                                     accumulate_chunks = self.conversion_params['accumulate_chunks'],
+                                     accumulator_buffer_mb = self.conversion_params['accumulator_buffer_mb'],
+                                     consolidate_metadata = self.conversion_params['consolidate_metadata'],
+                                     access_profile = self.conversion_params['access_profile'],
+                                     ts_context_spec = self._ts_context_spec,
+                                     verbose = self.cluster_params['verbose']
+                                     )
+                logger.info(f"Layer '{level}' of '{path}' was rebuilt.")
+        finally:
+            self._stop_cluster()
+
     def remove_temp_dir(self, temp_dir):
         if os.path.exists(temp_dir) and os.access(temp_dir, os.W_OK):
             shutil.rmtree(temp_dir)
@@ -864,6 +1214,7 @@ class EuBIBridge:
         if not verified_for_cluster:
             self.cluster_params['no_distributed'] = True
 
+        self._configure_metadata_reading()
         self._start_cluster(**self.cluster_params)
 
         series = self.readers_params['scene_index']
@@ -961,6 +1312,7 @@ class EuBIBridge:
         cluster_is_true = not self.cluster_params['no_distributed']
 
         # Start the processing cluster
+        self._configure_metadata_reading()
         self._start_cluster(**self.cluster_params)
 
         series = self.readers_params['scene_index']
@@ -995,11 +1347,15 @@ class EuBIBridge:
         base.set_dask_temp_dir(self._dask_temp_dir)
 
         # Update metadata for each dataset manager
+        gr_paths = []
         for path, manager in base.batchdata.managers.items():
             if is_zarr_group(manager.path):
                 manager.sync_pyramid(self.conversion_params['save_omexml'])
+                gr_paths.append(manager.path)
             else:
                 logger.info(f"Cannot update metadata for non-zarr path: {path}")
+        # Keep existing consolidated metadata in sync with the attributes just written.
+        consolidate_groups(gr_paths, force=False)
 
         # Shutdown the cluster and clean up temporary directories
         if self.client is not None:
@@ -2,8 +2,10 @@
 import copy
 import logging
 import os
+import shutil
 import tempfile
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Tuple, Union
 
@@ -11,23 +13,30 @@ from typing import Tuple, Union
 import dask
 import dask.array as da
 import numpy as np
+import zarr
 
 # Local application imports
 from eubi_bridge.base.data_manager import BatchManager
-from eubi_bridge.base.readers import read_single_image_asarray
-from eubi_bridge.base.writers import store_arrays
+from eubi_bridge.base.readers import (read_single_image_asarray, probe_headers, probe_homogeneous_headers,
+                                      array_from_header, DEFAULT_PROBE_WORKERS)
+from eubi_bridge.base.scale import Downscaler
+from eubi_bridge.base.writers import store_arrays, report_skipped_chunks, DEFAULT_METADATA_WORKERS
 # from eubi_bridge.fileset_io import FileSet
 from eubi_bridge.fileset_io import BatchFile
-from eubi_bridge.ngff.multiscales import Pyramid
+from eubi_bridge.ngff.multiscales import Pyramid, consolidate_metadata, has_consolidated_metadata
 from eubi_bridge.ngff.defaults import unit_map, scale_map, default_axes
 from eubi_bridge.utils.convenience import (
     take_filepaths
 )
+from eubi_bridge.utils.logging_config import get_logger
+from eubi_bridge.utils.storage import is_remote_path, get_store_url, resolve_store
 
 # Configure logging
 logging.getLogger('distributed.diskutils').setLevel(logging.CRITICAL)
 warnings.filterwarnings('ignore')
 
+logger = get_logger(__name__)
+
 
 class BridgeBase:
     def __init__(self,
@@ -153,14 +162,37 @@ class BridgeBase:
             except:
                 pass
 
-        futures = [read_single_image_asarray(path,
+        # Images whose headers can be probed are described by a few bytes each and their arrays are built here.
+        # Only the others construct a full reader in a task.
+        probe_workers = readers_params.get('probe_workers', DEFAULT_PROBE_WORKERS)
+        headers = None
+        if readers_params.get('assume_homogeneous', False):
+            # One image describes all; mismatches in the rest of the collection surface when they are read.
+            headers = probe_homogeneous_headers(self.filepaths,
+                                                sample_size=readers_params.get('homogeneous_sample_size', 0),
+                                                max_workers=probe_workers,
+                                                **readers_params)
+            if headers is None:
+                logger.warning(f"assume_homogeneous is ignored, since {self.filepaths[0]} has no header probe.")
+        if headers is None:
+            headers = probe_headers(self.filepaths,
+                                    max_workers=probe_workers,
+                                    **readers_params)
+        arrays = [array_from_header(header, chunks_yx=chunks_yx) if header is not None else None
+                  for header in headers]
+        unprobed = [idx for idx, arr in enumerate(arrays) if arr is None]
+        if verbose:
+            logger.info(f"Probed the headers of {len(arrays) - len(unprobed)} of {len(arrays)} images.")
+        futures = [read_single_image_asarray(self.filepaths[idx],
                                               chunks_yx=chunks_yx,
                                               verified_for_cluster=verified_for_cluster,
                                               zarr_format = zarr_format,
                                               verbose = verbose,
                                               **readers_params)
-                   for path in self.filepaths]
-        self.arrays = dask.compute(*futures)
+                   for idx in unprobed]
+        for idx, arr in zip(unprobed, dask.compute(*futures)):
+            arrays[idx] = arr
+        self.arrays = tuple(arrays)
 
         if metadata_path is None:
             self.metadata_path = self.filepaths[0]
@@ -416,7 +448,8 @@ class BridgeBase:
         Returns:
             Results of the storage operation
         """
-        output_dir = os.path.abspath(output_dir)
+        if not is_remote_path(output_dir):
+            output_dir = os.path.abspath(output_dir)
         storage_options = kwargs.copy()
 
         # Apply transformations
@@ -512,13 +545,104 @@ class BridgeBase:
                 for name, file_path in sample_path_mapping.items()
             }
 
-            for output_path, manager in manager_paths.items():
+            def _save_omexml(item):
+                output_path, manager = item
                 if manager.omemeta is None:
                     manager.create_omemeta()
                 manager.save_omexml(output_path)
 
+            # The OME-XML of the images are independent of each other, so they are written in parallel.
+            max_workers = storage_options.get('metadata_workers', DEFAULT_METADATA_WORKERS)
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(manager_paths)))) as pool:
+                list(pool.map(_save_omexml, manager_paths.items()))
+
         return storage_results
 
+def _store_pyramid_layers(pyr,
+                          layers,
+                          scales=None,
+                          **kwargs
+                          ):
+    """Write the given downscaled layers of a pyramid next to its existing layers.
+
+    Args:
+        pyr: Pyramid object, whose base layer the new layers were derived from
+        layers: Dictionary mapping layer paths to dask arrays
+        scales: Dictionary mapping layer paths to pixel scales. Defaults to the scales of the pyramid's downscaler.
+        **kwargs: Additional arguments for array storage
+
+    Returns:
+        Lazy write results as returned by store_arrays
+    """
+    grpath = get_store_url(pyr.gr)
+    grname = os.path.basename(grpath)
+    grdict = {grname: {}}
+    axisdict = {grname: {}}
+    scaledict = {grname: {}}
+    unitdict = {grname: {}}
+    chunkdict = {grname: {}}
+    sharddict = {grname: {}}
+
+    for key, value in layers.items():
+        if key != '0':
+            grdict[grname][key] = value
+            axisdict[grname][key] = tuple(pyr.meta.axis_order)
+            if scales is None:
+                scaledict[grname][key] = tuple(pyr.downscaler.dm.scales[int(key)])
+            else:
+                scaledict[grname][key] = tuple(scales[key])
+            unitdict[grname][key] = tuple(pyr.meta.unit_list)
+            chunkdict[grname][key] = tuple(pyr.base_array.chunksize)
+            # channeldict[grname][key] = tuple(pyr.meta.channels)
+            if pyr.meta.zarr_format == 3:
+                basepath = pyr.meta.resolution_paths[0]
+                sharddict[grname][key] = tuple(pyr.gr[basepath].shards)
+
+    output_path = os.path.dirname(grpath)
+    arrays = {k: {'0': v} if not isinstance(v, dict) else v for k, v in grdict.items()}
+
+    flatarrays = {os.path.join(output_path, f"{key}.zarr"
+                  if not key.endswith('zarr') else key, str(level)): arr
+                  for key, subarrays in arrays.items()
+                  for level, arr in subarrays.items()}
+    flataxes = {os.path.join(output_path, f"{key}.zarr"
+                  if not key.endswith('zarr') else key, str(level)): axes
+                  for key, subaxes in axisdict.items()
+                  for level, axes in subaxes.items()}
+    flatscales = {os.path.join(output_path, f"{key}.zarr"
+                  if not key.endswith('zarr') else key, str(level)): scale
+                  for key, subscales in scaledict.items()
+                  for level, scale in subscales.items()}
+    flatunits = {os.path.join(output_path, f"{key}.zarr"
+                  if not key.endswith('zarr') else key, str(level)): unit
+                  for key, subunits in unitdict.items()
+                  for level, unit in subunits.items()}
+    flatchunks = {os.path.join(output_path, f"{key}.zarr"
+                  if not key.endswith('zarr') else key, str(level)): chunk
+                  for key, subchunks in chunkdict.items()
+                  for level, chunk in subchunks.items()}
+
+    if len(sharddict) > 0:
+        flatshards = {os.path.join(output_path, f"{key}.zarr"
+                      if not key.endswith('zarr') else key, str(level)): shard
+                      for key, subshards in sharddict.items()
+                      for level, shard in subshards.items()}
+    else:
+        flatshards = None
+
+    return store_arrays(flatarrays,
+                        output_path=output_path,
+                        axes = flataxes,
+                        scales=flatscales,
+                        units=flatunits,
+                        output_chunks = flatchunks,
+                        output_shards = flatshards,
+                        compute=False,
+                        channel_meta=None,
+                        **kwargs
+                        )
+
+
 def downscale(
         gr_paths,
         time_scale_factor,
@@ -528,8 +652,23 @@ def downscale(
         x_scale_factor,
         n_layers,
         downscale_method='simple',
-        **kwargs # a min_dimension_size parameter added
+        cascade='graph',
+        **kwargs
         ):
+    """
+    Create the downscaled layers for the given OME-Zarr groups.
+
+    The ``cascade`` parameter decides where each layer is computed from:
+        - 'graph' (or True): layer n is derived from layer n-1 within a single dask graph.
+        - 'disk': layers are written one at a time and layer n is read back from the
+          already written layer n-1. This keeps each graph small for very large images.
+        - 'off' (or False): every layer is derived from the base layer.
+
+    ``n_layers`` may be 'auto', in which case layers are added until the smallest lateral
+    dimension reaches ``min_dimension_size`` (passed via kwargs).
+
+    Consolidated metadata is not updated here; the caller does so once with ``consolidate_groups``.
+    """
 
     scale_factor_dict = {
                         't': time_scale_factor,
@@ -539,11 +678,18 @@ def downscale(
                         'x': x_scale_factor
                          }
 
+    if cascade in (True, 'graph'):
+        cascade = 'graph'
+    elif cascade in (False, None, 'off'):
+        cascade = 'off'
+    elif cascade != 'disk':
+        raise ValueError(f"Unsupported cascade mode: {cascade}. Choose either of 'graph', 'disk' or 'off'.")
+
     if isinstance(gr_paths, dict):
         gr_paths = list(set(os.path.dirname(key) for key in gr_paths.keys()))
 
     pyrs = [Pyramid(path) for path in gr_paths] # TODO: add a to_cupy parameter here.
-    result_collection = []
+    result_collection = {}
 
     min_dimension_size = kwargs.get('min_dimension_size', None)
     for pyr in pyrs:
@@ -552,85 +698,267 @@ def downscale(
         pyr.update_downscaler(scale_factor=scale_factor,
                               n_layers=n_layers,
                               downscale_method=downscale_method,
-                              min_dimension_size=min_dimension_size
+                              min_dimension_size=min_dimension_size,
+                              cascade=cascade == 'graph'
                               )
-        grpath = pyr.gr.store.root
-        grname = os.path.basename(grpath)
-        grdict = {grname: {}}
-        axisdict = {grname: {}}
-        scaledict = {grname: {}}
-        unitdict = {grname: {}}
-        chunkdict = {grname: {}}
-        sharddict = {grname: {}}
-
-        for key, value in pyr.downscaler.downscaled_arrays.items():
-            if key != '0':
-                grdict[grname][key] = value
-                axisdict[grname][key] = tuple(pyr.meta.axis_order)
-                scaledict[grname][key] = tuple(pyr.downscaler.dm.scales[int(key)])
-                unitdict[grname][key] = tuple(pyr.meta.unit_list)
-                chunkdict[grname][key] = tuple(pyr.base_array.chunksize)
-                # channeldict[grname][key] = tuple(pyr.meta.channels)
-                if pyr.meta.zarr_format == 3:
-                    sharddict[grname][key] = tuple(pyr.meta.zarr_group)
-                    basepath = pyr.meta.resolution_paths[0]
-                    sharddict[grname][key] = tuple(pyr.layers[basepath].shards)
-
-        output_path = os.path.dirname(grpath)
-        arrays = {k: {'0': v} if not isinstance(v, dict) else v for k, v in grdict.items()}
-
-        ### TODO: make this a separate function? def flatten_pyramids
-        flatarrays = {os.path.join(output_path, f"{key}.zarr"
-                      if not key.endswith('zarr') else key, str(level)): arr
-                      for key, subarrays in arrays.items()
-                      for level, arr in subarrays.items()}
-        flataxes = {os.path.join(output_path, f"{key}.zarr"
-                      if not key.endswith('zarr') else key, str(level)): axes
-                      for key, subaxes in axisdict.items()
-                      for level, axes in subaxes.items()}
-        flatscales = {os.path.join(output_path, f"{key}.zarr"
-                      if not key.endswith('zarr') else key, str(level)): scale
-                      for key, subscales in scaledict.items()
-                      for level, scale in subscales.items()}
-        flatunits = {os.path.join(output_path, f"{key}.zarr"
-                      if not key.endswith('zarr') else key, str(level)): unit
-                      for key, subunits in unitdict.items()
-                      for level, unit in subunits.items()}
-        flatchunks = {os.path.join(output_path, f"{key}.zarr"
-                      if not key.endswith('zarr') else key, str(level)): chunk
-                      for key, subchunks in chunkdict.items()
-                      for level, chunk in subchunks.items()}
-
-        if len(sharddict) > 0:
-            flatshards = {os.path.join(output_path, f"{key}.zarr"
-                          if not key.endswith('zarr') else key, str(level)): shard
-                          for key, subshards in sharddict.items()
-                          for level, shard in subshards.items()}
-        else:
-            flatshards = None
-        ### TODO ends
-
-        results = store_arrays(flatarrays,
-                               output_path=output_path,
-                               axes = flataxes,
-                               scales=flatscales,
-                               units=flatunits,
-                               output_chunks = flatchunks,
-                               output_shards = flatshards,
-                               compute=False,
-                               channel_meta=None,
-                               **kwargs
-                               )
+        if cascade != 'disk':
+            results = _store_pyramid_layers(pyr, pyr.downscaler.downscaled_arrays, **kwargs)
+            result_collection.update(results)
 
-        result_collection += list(results.values())
     if 'rechunk_method' in kwargs:
         if kwargs.get('rechunk_method') == 'rechunker':
             raise NotImplementedError(f"Rechunker is not supported for the downscaling step.")
     if 'max_mem' in kwargs:
         raise NotImplementedError(f"Rechunker is not supported for the downscaling step.")
+
+    if cascade == 'disk':
+        # Each round reads the layer that was written in the previous round.
+        n_rounds = max(len(pyr.downscaler.dm.output_shapes) for pyr in pyrs)
+        for level in range(1, n_rounds):
+            result_collection = {}
+            for pyr in pyrs:
+                dm = pyr.downscaler.dm
+                if level >= len(dm.output_shapes):
+                    continue
+                previous = da.from_zarr(pyr.gr[str(level - 1)])
+                factor = tuple(int(x) for x in dm.relative_scale_factors[level])
+                layer = pyr.downscaler.method(previous, scale_factor=factor)
+                results = _store_pyramid_layers(pyr, {str(level): layer}, **kwargs)
+                result_collection.update(results)
+            # A failed round must not go on, as the next round would read an incomplete layer.
+            counts = dask.compute(*result_collection.values())
+            if kwargs.get('skip_empty_chunks', False):
+                report_skipped_chunks(list(result_collection.keys()), counts)
+        return results
+
+    counts = dask.compute(*result_collection.values())
+    if kwargs.get('skip_empty_chunks', False):
+        report_skipped_chunks(list(result_collection.keys()), counts)
+    return results
+
+
+def consolidate_groups(gr_paths, force=True):
+    """
+    Write consolidated metadata for the given OME-Zarr groups.
+
+    Args:
+        gr_paths: Paths to the OME-Zarr groups
+        force: If False, only groups that already carry consolidated metadata are updated
+    """
+    for gr_path in sorted(set(gr_paths)):
+        gr = zarr.open_group(resolve_store(gr_path), mode='a', use_consolidated=False)
+        if force or has_consolidated_metadata(gr):
+            consolidate_metadata(gr)
+
+
+def _is_readable_layer(pyr, path):
+    """Check whether the array at the given path of a pyramid exists and its metadata can be read."""
+    try:
+        # Open the array itself, as consolidated metadata may still list a broken array.
+        arr = zarr.open_array(resolve_store(os.path.join(get_store_url(pyr.gr), path)), mode='r')
+        return len(arr.shape) == pyr.meta.ndim
+    except Exception:
+        return False
+
+
+def _remove_layer(pyr, path):
+    """Remove a layer from a pyramid, including any chunks left behind by a broken array."""
     try:
-        dask.compute(*result_collection)
-    except Exception as e:
-        # print(e)
+        del pyr.gr[path]
+    except KeyError:
         pass
-    return results
+    layer_dir = os.path.join(get_store_url(pyr.gr), path)
+    if not is_remote_path(layer_dir) and os.path.isdir(layer_dir):
+        shutil.rmtree(layer_dir)
+
+
+def _drop_layers(pyr, paths):
+    """Remove layers from a pyramid and from its multiscales metadata."""
+    for path in paths:
+        pyr.meta.del_dataset(path)
+        _remove_layer(pyr, path)
+    pyr.meta.save_changes()
+
+
+def _resolve_pyramid_paths(gr_paths):
+    if isinstance(gr_paths, dict):
+        gr_paths = list(set(os.path.dirname(key) for key in gr_paths.keys()))
+    if isinstance(gr_paths, (str, Path)):
+        gr_paths = [gr_paths]
+    return list(gr_paths)
+
+
+def extend_pyramid(
+        gr_paths,
+        time_scale_factor,
+        channel_scale_factor,
+        z_scale_factor,
+        y_scale_factor,
+        x_scale_factor,
+        n_layers,
+        downscale_method='simple',
+        min_dimension_size=None,
+        **kwargs
+        ):
+    """
+    Add the missing resolution layers to existing OME-Zarr groups without recomputing the existing ones.
+
+    The layers listed in the multiscales metadata are checked in order. The deepest layer, up to which
+    all arrays can be opened, is taken as the source. Every layer after it is deleted, including
+    readable layers that follow an unreadable one, and new layers are computed from the source by
+    cascaded downscaling until the pyramid has ``n_layers`` layers. If ``n_layers`` is not larger
+    than the number of readable layers, the pyramid is only truncated.
+
+    If the computation fails, the layers added are removed again, so that the pyramids list only
+    complete layers, and the exception is raised.
+
+    Args:
+        gr_paths: Paths to the OME-Zarr groups, or the results of store_arrays
+        time_scale_factor, channel_scale_factor, z_scale_factor, y_scale_factor, x_scale_factor: Downscaling factors
+        n_layers: Total number of layers the pyramids should have, or 'auto'
+        downscale_method: Downscaling algorithm
+        min_dimension_size: Smallest lateral size of a layer
+        **kwargs: Additional arguments for array storage
+
+    Returns:
+        Dictionary mapping the group paths to the paths of the newly written layers
+    """
+    scale_factor_dict = {
+                        't': time_scale_factor,
+                        'c': channel_scale_factor,
+                        'z': z_scale_factor,
+                        'y': y_scale_factor,
+                        'x': x_scale_factor
+                         }
+
+    kwargs.pop('zarr_format', None)
+    kwargs.pop('cascade', None)
+    added = {}
+    result_collection = {}
+    for gr_path in _resolve_pyramid_paths(gr_paths):
+        pyr = Pyramid(gr_path)
+        paths = pyr.meta.resolution_paths
+        valid_paths = []
+        for path in paths:
+            if not _is_readable_layer(pyr, path):
+                break
+            valid_paths.append(path)
+        if len(valid_paths) == 0:
+            raise ValueError(f"The base layer of '{gr_path}' is missing or unreadable.")
+
+        # Discard whatever follows the source layer; it is recomputed below, if n_layers asks for it.
+        broken = paths[len(valid_paths):]
+        if len(broken) > 0:
+            logger.warning(f"Removing the layers {broken} of '{gr_path}', which follow an unreadable layer.")
+            _drop_layers(pyr, broken)
+
+        source_path = valid_paths[-1]
+        source = da.from_zarr(pyr.gr[source_path])
+        remaining = n_layers if n_layers == 'auto' else int(n_layers) - len(valid_paths) + 1
+        if remaining != 'auto' and remaining < 2:
+            logger.info(f"'{gr_path}' has {len(valid_paths)} readable layers, nothing to add.")
+            added[gr_path] = []
+            continue
+
+        scale_factor = [scale_factor_dict[ax] for ax in pyr.meta.axis_order]
+        scale_factor = tuple(np.minimum(source.shape, scale_factor))
+        downscaler = Downscaler(array=source,
+                                scale_factor=scale_factor,
+                                n_layers=remaining,
+                                scale=pyr.meta.scales[source_path],
+                                downscale_method=downscale_method,
+                                cascade=True,
+                                axes=pyr.meta.axis_order,
+                                min_dimension_size=min_dimension_size
+                                )
+
+        offset = len(valid_paths) - 1
+        layers, scales = {}, {}
+        for level, layer in downscaler.downscaled_arrays.items():
+            if level == '0':
+                continue
+            path = str(int(level) + offset)
+            layers[path] = layer
+            scales[path] = downscaler.dm.scales[int(level)]
+        if len(layers) == 0:
+            logger.info(f"No further layers can be derived from layer '{source_path}' of '{gr_path}'.")
+        added[gr_path] = list(layers.keys())
+        results = _store_pyramid_layers(pyr, layers, scales=scales,
+                                        zarr_format=pyr.meta.zarr_format, **kwargs)
+        result_collection.update(results)
+
+    try:
+        counts = dask.compute(*result_collection.values())
+    except Exception:
+        # The new layers may be listed without holding all their data; they are removed again.
+        for gr_path, paths in added.items():
+            _drop_layers(Pyramid(gr_path), paths)
+        logger.error(f"Extending the pyramids failed. The layers being added were removed again.")
+        raise
+    if kwargs.get('skip_empty_chunks', False):
+        report_skipped_chunks(list(result_collection.keys()), counts)
+    consolidate_groups(_resolve_pyramid_paths(gr_paths), force=kwargs.get('consolidate_metadata', False))
+    return added
+
+
+def repair_pyramid_layer(
+        gr_path,
+        level,
+        downscale_method='simple',
+        **kwargs
+        ):
+    """
+    Rebuild a single resolution layer of an OME-Zarr group from the layer before it.
+
+    The scale factor is taken from the pixel scales of the two layers in the multiscales metadata,
+    so the rebuilt layer replaces the original one in place. No other layer is touched. If the
+    computation fails, the layer is removed but stays listed, and the exception is raised.
+
+    Args:
+        gr_path: Path to the OME-Zarr group
+        level: Path of the layer to rebuild
+        downscale_method: Downscaling algorithm
+        **kwargs: Additional arguments for array storage
+
+    Returns:
+        The path of the rebuilt layer
+    """
+    kwargs.pop('zarr_format', None)
+    level = str(level)
+    pyr = Pyramid(gr_path)
+    paths = pyr.meta.resolution_paths
+    if level not in paths:
+        raise ValueError(f"Layer '{level}' is not listed in the metadata of '{gr_path}'.")
+    idx = paths.index(level)
+    if idx == 0:
+        raise ValueError(f"The base layer cannot be rebuilt from the pyramid. Convert the input again instead.")
+
+    previous_path = paths[idx - 1]
+    if not _is_readable_layer(pyr, previous_path):
+        raise ValueError(f"Layer '{previous_path}' of '{gr_path}' is unreadable. Repair it first.")
+    source = da.from_zarr(pyr.gr[previous_path])
+    scales = pyr.meta.scales
+    scale_factor = np.round(np.divide(scales[level], scales[previous_path])).astype(int)
+    scale_factor = tuple(np.maximum(scale_factor, 1).tolist())
+    downscaler = Downscaler(array=source,
+                            scale_factor=scale_factor,
+                            n_layers=2,
+                            downscale_method=downscale_method
+                            )
+
+    _remove_layer(pyr, level)
+    results = _store_pyramid_layers(pyr, {level: downscaler.downscaled_arrays['1']},
+                                    scales={level: scales[level]},
+                                    zarr_format=pyr.meta.zarr_format, **kwargs)
+    try:
+        counts = dask.compute(*results.values())
+    except Exception:
+        # An incomplete layer could pass as readable. It is removed but stays listed, so that
+        # repairing it again, or extending the pyramid, rebuilds it.
+        _remove_layer(pyr, level)
+        logger.error(f"Rebuilding layer '{level}' of '{gr_path}' failed. The layer was removed; rebuild it again.")
+        raise
+    if kwargs.get('skip_empty_chunks', False):
+        report_skipped_chunks(list(results.keys()), counts)
+    consolidate_groups([gr_path], force=kwargs.get('consolidate_metadata', False))
+    return level
@@ -9,6 +9,7 @@ from dask import delayed
 from natsort import natsorted
 
 from eubi_bridge.base.data_manager import ArrayManager, ChannelIterator
+from eubi_bridge.base.metadata_service import prefetch_metadata
 
 transpose_list = lambda l: list(map(list, zip(*l)))
 get_numerics = lambda string: list(re.findall(r'\d+', string))
@@ -488,9 +489,14 @@ class BatchFile:
         grs = self.split_channel_groups()
         self.sample_paths = natsorted([grs[grname][0]
                                         for grname in grs])
+        omemetas = {}
+        if metadata_reader == 'bfio':
+            # Read through the warm JVMs of the metadata service rather than one cold JVM per task.
+            omemetas = prefetch_metadata(self.sample_paths, series = series, meta_reader = metadata_reader)
         managers = {path: delayed(ArrayManager)(path,
                                             series = series,
                                             metadata_reader = metadata_reader,
+                                            omemeta = omemetas.get(path),
                                             **kwargs
                                             ) for
                          path in self.sample_paths
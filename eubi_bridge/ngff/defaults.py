@@ -19,6 +19,9 @@ scale_factor_map = {
     'x': 2
 }
 
+# Smallest lateral size of a resolution layer when the number of layers is planned automatically
+min_dimension_size = 64
+
 scale_map = {
     't': 1,
     'c': 1,
@@ -1,4 +1,4 @@
-import copy
+import copy, warnings
 from pathlib import Path
 from typing import Optional, Dict, List, Any, Union, Iterable, ClassVar
 
@@ -7,7 +7,9 @@ import numpy as np
 import zarr
 
 from eubi_bridge.base.scale import Downscaler
+from eubi_bridge.ngff import defaults
 from eubi_bridge.utils.logging_config import get_logger
+from eubi_bridge.utils.storage import resolve_store
 
 # Set up logger for this module
 logger = get_logger(__name__)
@@ -22,6 +24,27 @@ def is_zarr_group(path: (str, Path)
         return False
 
 
+def has_consolidated_metadata(gr: zarr.Group) -> bool:
+    """Check whether a zarr group carries consolidated metadata (.zmetadata for v2, in zarr.json for v3)."""
+    try:
+        _ = zarr.open_consolidated(gr.store, path=gr.path, mode='r')
+        return True
+    except Exception:
+        return False
+
+
+def consolidate_metadata(gr: Union[zarr.Group, str, Path]) -> None:
+    """Write the metadata of a zarr group and all its members into the consolidated metadata of the group."""
+    if isinstance(gr, zarr.Group):
+        store, path, zarr_format = gr.store, gr.path, gr.metadata.zarr_format
+    else:
+        store, path, zarr_format = str(gr), None, None
+    with warnings.catch_warnings():
+        # Consolidated metadata is not yet part of the zarr v3 specification.
+        warnings.simplefilter('ignore')
+        zarr.consolidate_metadata(store, path=path, zarr_format=zarr_format)
+
+
 def generate_channel_metadata(num_channels,
                               dtype = np.uint16
                               ):
@@ -230,6 +253,7 @@ class NGFFMetadataHandler:
         if isinstance(store, zarr.Group):
             self.zarr_group = store
         else: # isinstance(store, (str, Path))
+            store = resolve_store(store)
             if is_zarr_group(store):
                 self.zarr_group = zarr.open_group(store, mode=mode)
                 # zarr_version = self.zarr_group.info._zarr_format
@@ -279,7 +303,6 @@ class NGFFMetadataHandler:
                 self.zarr_group.attrs['omero'] = self.metadata['omero']
             if '_creator' in self.metadata:
                 self.zarr_group.attrs['_creator'] = self.metadata['_creator']
-
         self._pending_changes = False
 
     def update_all_datasets(self,
@@ -421,6 +444,13 @@ class NGFFMetadataHandler:
         )
         self._pending_changes = True
 
+    def del_dataset(self, path: Union[str, int]) -> None:
+        """Remove the dataset with the given path from the metadata."""
+        path = str(path)
+        datasets = self.metadata['multiscales'][0]['datasets']
+        self.metadata['multiscales'][0]['datasets'] = [ds for ds in datasets if ds['path'] != path]
+        self._pending_changes = True
+
     def update_scale(self,
                      path: Union[str, int],
                      scale: Iterable[Union[int, float]]) -> None:
@@ -660,7 +690,7 @@ class Pyramid:
 
     @property
     def base_array(self):
-        return self.dask_arrays['0']
+        return da.from_zarr(self.gr['0'])
 
     # def shrink(self,
     #            hard=False
@@ -747,6 +777,8 @@ class Pyramid:
                           n_layers=1,
                           downscale_method='simple',
                           backend='numpy',
+                          cascade=True,
+                          min_dimension_size=None,
                           **kwargs
                           ):
         darr = self.base_array
@@ -759,6 +791,89 @@ class Pyramid:
                                      n_layers=n_layers,
                                      scale=scale,
                                      downscale_method=downscale_method,
-                                     backend=backend
+                                     backend=backend,
+                                     cascade=cascade,
+                                     axes=''.join(self.axes),
+                                     min_dimension_size=min_dimension_size
                                      )
         return self
+
+    def _relative_scale_factors(self):
+        """
+        Per-layer scale factors relative to the previous layer. These are taken from the
+        downscaler if one was set for this pyramid, otherwise from the pixel scales in the metadata.
+        """
+        paths = self.meta.resolution_paths
+        if getattr(self, 'downscaler', None) is not None:
+            factors = self.downscaler.dm.relative_scale_factors
+            if len(factors) == len(paths):
+                return factors
+        scales = self.meta.scales
+        factors = [np.ones(self.meta.ndim, dtype=int)]
+        for previous, current in zip(paths[:-1], paths[1:]):
+            factor = np.round(np.divide(scales[current], scales[previous])).astype(int)
+            factors.append(np.maximum(factor, 1))
+        return np.array(factors)
+
+    def refresh_region(self,
+                       region: (list, tuple),
+                       downscale_method: str = 'simple'
+                       ):
+        """
+        Recompute the lower resolution layers after a region of the base layer has been modified.
+
+        Only the chunks (or shards for zarr v3) of each layer whose footprint intersects the
+        modified region are recomputed. Each layer is updated from the already refreshed layer
+        before it, so the result equals that of downscaling the whole base layer again.
+
+        :param region: Per-axis (start, stop) pairs or slices in level-0 coordinates. None selects the full axis.
+        :param downscale_method: Downscaling algorithm. Ignored if a downscaler was set via update_downscaler.
+        :return: Dictionary mapping layer paths to the refreshed regions as tuples of slices.
+        """
+        paths = self.meta.resolution_paths
+        base = self.gr[paths[0]]
+        if len(region) != base.ndim:
+            raise ValueError("The region must have an entry for each axis.")
+        bounds = []
+        for item, size in zip(region, base.shape):
+            if item is None:
+                item = slice(None)
+            if not isinstance(item, slice):
+                item = slice(*item)
+            start, stop, _ = item.indices(size)
+            bounds.append((start, stop))
+        start = np.array([b[0] for b in bounds])
+        stop = np.array([b[1] for b in bounds])
+
+        if getattr(self, 'downscaler', None) is not None:
+            method = self.downscaler.method
+        else:
+            method = Downscaler(array=self.base_array,
+                                scale_factor=[1] * base.ndim,
+                                n_layers=1,
+                                downscale_method=downscale_method
+                                ).method
+        factors = self._relative_scale_factors()
+
+        refreshed = {}
+        for idx in range(1, len(paths)):
+            if np.any(stop <= start):
+                break
+            source = self.gr[paths[idx - 1]]
+            target = self.gr[paths[idx]]
+            factor = factors[idx]
+            # Footprint in this layer, widened to whole chunks (or shards) of the target array.
+            grid = np.array(getattr(target, 'shards', None) or target.chunks)
+            start = np.floor_divide(np.floor_divide(start, factor), grid) * grid
+            stop = np.minimum(-(-(-(-stop // factor)) // grid) * grid, target.shape)
+            source_start = start * factor
+            source_stop = np.minimum(stop * factor, source.shape)
+            source_slices = tuple(slice(int(a), int(b)) for a, b in zip(source_start, source_stop))
+            target_slices = tuple(slice(int(a), int(b)) for a, b in zip(start, stop))
+
+            layer = method(da.from_zarr(source)[source_slices],
+                           scale_factor=tuple(int(f) for f in factor))
+            layer = layer.rechunk(tuple(int(g) for g in grid))
+            da.store(layer, target, regions=target_slices, lock=False)
+            refreshed[paths[idx]] = target_slices
+        return refreshed
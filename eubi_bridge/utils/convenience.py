@@ -410,25 +410,47 @@ def take_filepaths(input_path: str,
 
 # res = take_filepaths(f"/home/oezdemir/PycharmProjects/TIM2025/data/targets.csv")
 
+ACCESS_PROFILES = ('volumetric', '2d-browse', 'time-series')
+MIN_TIME_SERIES_TILE = 64
+
+def _align_to_source(size: int, source: int, dim: int) -> int:
+    """Snap a chunk size to the source blocks: a multiple of the block if larger, a divisor of it if smaller."""
+    if source >= dim or size >= dim:
+        # Either the source is not split along this axis or the chunk spans the whole axis.
+        return size
+    if size >= source:
+        return int(min(dim, max(1, round(size / source)) * source))
+    divisors = [d for d in range(1, source + 1) if source % d == 0]
+    return int(min(divisors, key=lambda d: abs(np.log(d / size))))
+
 def autocompute_chunk_shape(
         array_shape: Tuple[int, ...],
         axes: str,
         target_chunk_mb: float = 1.0,
-        dtype: type = np.uint16
+        dtype: type = np.uint16,
+        source_chunks: Tuple[int, ...] = None,
+        access_profile: str = None
 ) -> Tuple[int, ...]:
     """
     Compute an appropriate chunk shape for a multi-dimensional array.
 
     The function calculates chunk dimensions such that:
-    - Time ('t') and channel ('c') dimensions are always chunked as 1
-    - Spatial dimensions are chunked to approximately reach the target chunk size
+    - Time ('t') and channel ('c') dimensions are chunked as 1, except for time in the 'time-series' profile
+    - The axes that the access profile reads together are chunked to approximately reach the target chunk size
     - Chunk dimensions never exceed array dimensions
+    - With source_chunks, every chunk size is a multiple or a divisor of the source block size along its axis,
+      so that source blocks map onto whole output chunks
 
     Args:
         array_shape: Tuple of integers representing the shape of the array
         axes: String specifying the axis order (e.g., 'tczyx', 'zyx', 'cyx')
         target_chunk_mb: Target chunk size in megabytes (default: 1MB)
         dtype: Data type of the array (default: uint16)
+        source_chunks: Block shape of the source data, e.g. the chunksize of the dask array read from the input
+        access_profile: How the output will mostly be read. One of:
+            - 'volumetric': the budget is spread evenly over the spatial axes (default)
+            - '2d-browse': z is chunked as 1 and the budget is spread over y and x
+            - 'time-series': z is chunked as 1 and time as long as tiles of at least 64x64 in y and x allow
 
     Returns:
         Tuple of chunk sizes matching the input array dimensions
@@ -436,36 +458,123 @@ def autocompute_chunk_shape(
     Example:
         >>> autocompute_chunk_shape((1, 3, 512, 512, 512), 'tczyx')
         (1, 1, 64, 64, 64)  # For 1MB chunks with uint16 data
+        >>> autocompute_chunk_shape((1, 3, 512, 512, 512), 'tczyx', access_profile='2d-browse')
+        (1, 1, 1, 512, 512)
     """
     if len(array_shape) != len(axes):
         raise ValueError(f"Length of array_shape ({len(array_shape)}) must match length of axes ({len(axes)})")
+    access_profile = access_profile or 'volumetric'
+    if access_profile not in ACCESS_PROFILES:
+        raise ValueError(f"access_profile must be one of {ACCESS_PROFILES}, not {access_profile}")
 
     # Convert target size to bytes
     chunk_bytes = int(target_chunk_mb * 1024 * 1024)
     element_size = np.dtype(dtype).itemsize
     max_elements = chunk_bytes // element_size
 
-    # Identify spatial axes (everything except 't' and 'c')
-    spatial_axes = [i for i, ax in enumerate(axes) if ax not in 'tc']
+    # Identify the axes that share the budget (spatial axes for volumetric access)
+    if access_profile == 'volumetric':
+        budget_axes = [i for i, ax in enumerate(axes) if ax not in 'tc']
+    else:
+        budget_axes = [i for i, ax in enumerate(axes) if ax in 'yx']
 
-    if not spatial_axes:
+    if not budget_axes:
         # If no spatial axes, just return ones
         return (1,) * len(axes)
 
-    # Calculate base chunk size for spatial dimensions
-    spatial_dims = [array_shape[i] for i in spatial_axes]
-    base_chunk = int(round((max_elements) ** (1.0 / len(spatial_axes))))
+    time_chunk = 1
+    if access_profile == 'time-series' and 't' in axes:
+        time_chunk = min(array_shape[axes.index('t')],
+                         max(1, max_elements // MIN_TIME_SERIES_TILE ** len(budget_axes)))
+        max_elements = max(1, max_elements // time_chunk)
+
+    # Calculate base chunk size for the budget axes
+    base_chunk = int(round((max_elements) ** (1.0 / len(budget_axes))))
 
     # Adjust chunks to fit within array dimensions
     chunks = []
     for i, (dim, ax) in enumerate(zip(array_shape, axes)):
-        if ax in 'tc':
-            # Time and channel dimensions are always 1
-            chunks.append(1)
-        else:
-            # For spatial dimensions, use base_chunk but not larger than dimension size
+        if ax == 't':
+            chunk_size = time_chunk
+        elif i in budget_axes:
+            # Use base_chunk but not larger than dimension size
             chunk_size = min(base_chunk, dim)
-            # Ensure chunk size is at least 1
-            chunks.append(max(1, chunk_size))
+        else:
+            chunk_size = 1
+        if source_chunks is not None:
+            chunk_size = _align_to_source(chunk_size, int(source_chunks[i]), dim)
+        # Ensure chunk size is at least 1
+        chunks.append(max(1, chunk_size))
 
-    return tuple(chunks)
\ No newline at end of file
+    return tuple(chunks)
+
+def autocompute_shard_shape(
+        array_shape: Tuple[int, ...],
+        chunk_shape: Tuple[int, ...],
+        axes: str,
+        target_shard_mb: float = None,
+        max_files_per_array: int = None,
+        dtype: type = np.uint16
+) -> Tuple[int, ...]:
+    """
+    Compute a shard shape for a multi-dimensional array from a byte target and a file count bound.
+
+    The shard is grown from the chunk shape by doubling the number of chunks along one axis at a time:
+    - Spatial axes are grown before channel and time axes, the shortest side of the shard first
+    - Along each axis the shard never spans more chunks than the array has
+    - Growth stops before the uncompressed shard size would exceed target_shard_mb
+    - Growth then continues, regardless of the size, until the array has at most max_files_per_array shards
+
+    Args:
+        array_shape: Tuple of integers representing the shape of the array
+        chunk_shape: Chunk shape of the array, of which the shard shape is a multiple
+        axes: String specifying the axis order (e.g., 'tczyx', 'zyx', 'cyx')
+        target_shard_mb: Target uncompressed shard size in megabytes. If None, only max_files_per_array applies.
+        max_files_per_array: Upper bound for the number of shards of the array. If None, only target_shard_mb applies.
+        dtype: Data type of the array (default: uint16)
+
+    Returns:
+        Tuple of shard sizes matching the input array dimensions
+
+    Example:
+        >>> autocompute_shard_shape((1, 2, 2048, 2048), (1, 1, 256, 256), 'tcyx', target_shard_mb=64)
+        (1, 2, 2048, 2048)  # A single shard of 16 MB, as the array holds no more
+        >>> autocompute_shard_shape((512, 512, 512), (64, 64, 64), 'zyx', target_shard_mb=64)
+        (512, 256, 256)  # 4 shards of 64 MB
+    """
+    if len(array_shape) != len(axes) or len(chunk_shape) != len(axes):
+        raise ValueError(f"Lengths of array_shape ({len(array_shape)}) and chunk_shape ({len(chunk_shape)}) "
+                         f"must match length of axes ({len(axes)})")
+    chunk_shape = [int(min(chunk, dim)) for chunk, dim in zip(chunk_shape, array_shape)]
+    n_chunks = [-(-int(dim) // chunk) for dim, chunk in zip(array_shape, chunk_shape)]
+    chunk_bytes = int(np.prod(chunk_shape)) * np.dtype(dtype).itemsize
+    priority = {ax: (0 if ax not in 'tc' else 1 if ax == 'c' else 2) for ax in axes}
+    factors = [1] * len(axes)
+
+    def grown(i):
+        return min(factors[i] * 2, n_chunks[i])
+
+    def candidates():
+        # Ordered by axis group, then by the current extent of the shard along the axis.
+        growable = [i for i in range(len(axes)) if factors[i] < n_chunks[i]]
+        return sorted(growable, key=lambda i: (priority[axes[i]], factors[i] * chunk_shape[i]))
+
+    def n_files():
+        return int(np.prod([-(-n // f) for n, f in zip(n_chunks, factors)]))
+
+    if target_shard_mb is not None:
+        target_bytes = target_shard_mb * 1024 * 1024
+        while True:
+            fitting = [i for i in candidates()
+                       if chunk_bytes * np.prod(factors) // factors[i] * grown(i) <= target_bytes]
+            if len(fitting) == 0:
+                break
+            i = fitting[0]
+            factors[i] = grown(i)
+
+    if max_files_per_array is not None:
+        while n_files() > max_files_per_array and len(candidates()) > 0:
+            i = candidates()[0]
+            factors[i] = grown(i)
+
+    return tuple(int(factor * chunk) for factor, chunk in zip(factors, chunk_shape))
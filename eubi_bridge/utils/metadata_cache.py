@@ -0,0 +1,157 @@
+import os, sqlite3, time
+from pathlib import Path
+from typing import Optional, Union
+
+from eubi_bridge.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_METADATA_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.eubi_bridge', 'metadata_cache.sqlite')
+DEFAULT_METADATA_CACHE_MAX_AGE_DAYS = 30
+DEFAULT_METADATA_CACHE_MAX_SIZE_MB = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    path TEXT NOT NULL,
+    series TEXT NOT NULL,
+    reader TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    omexml TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (path, series, reader)
+)
+"""
+
+
+class MetadataCache:
+    """
+    A persistent cache of the OME metadata read from image files, stored in a SQLite database.
+
+    An entry holds the OME-XML of the selected series, which carries the pixels block with the
+    sizes, physical scales and channels. It is valid as long as the file keeps its size and
+    modification time, so an edited or replaced file is read again. Entries not used for
+    max_age_days are dropped, and the least recently used entries are dropped while the database
+    holds more than max_size_mb of metadata.
+
+    Errors of the database are logged and otherwise ignored, so that the cache never stops a
+    conversion; the metadata is then read from the file as usual.
+
+    Args:
+        path: Path of the database file
+        max_age_days: Age after which an unused entry is dropped
+        max_size_mb: Total size of the cached metadata above which entries are dropped
+    """
+    def __init__(self,
+                 path: Union[str, Path] = DEFAULT_METADATA_CACHE_PATH,
+                 max_age_days: float = DEFAULT_METADATA_CACHE_MAX_AGE_DAYS,
+                 max_size_mb: float = DEFAULT_METADATA_CACHE_MAX_SIZE_MB
+                 ):
+        self.path = str(path)
+        self.max_age_days = float(max_age_days)
+        self.max_size_mb = float(max_size_mb)
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Several worker processes may read the same files at once; they wait for each other's writes.
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        return conn
+
+    @staticmethod
+    def _stat(input_path: str):
+        stat = os.stat(input_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def get(self, input_path: str, series: Union[int, str] = 0, reader: str = 'bfio'):
+        """Return the cached OME metadata of a series, or None if it is missing or the file has changed."""
+        from ome_types import from_xml
+        try:
+            size, mtime = self._stat(input_path)
+            with self._connect() as conn:
+                row = conn.execute("SELECT omexml FROM metadata "
+                                   "WHERE path = ? AND series = ? AND reader = ? AND size = ? AND mtime = ?",
+                                   (os.path.abspath(input_path), str(series), reader, size, mtime)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE metadata SET accessed = ? WHERE path = ? AND series = ? AND reader = ?",
+                             (time.time(), os.path.abspath(input_path), str(series), reader))
+            return from_xml(row[0])
+        except Exception as e:
+            logger.warning(f"Could not look up the metadata of {input_path} in {self.path}: {e}")
+            return None
+
+    def has(self, input_path: str, series: Union[int, str] = 0, reader: str = 'bfio') -> bool:
+        """Tell whether the cache holds valid metadata of a series, without parsing it."""
+        try:
+            size, mtime = self._stat(input_path)
+            with self._connect() as conn:
+                row = conn.execute("SELECT 1 FROM metadata "
+                                   "WHERE path = ? AND series = ? AND reader = ? AND size = ? AND mtime = ?",
+                                   (os.path.abspath(input_path), str(series), reader, size, mtime)).fetchone()
+            return row is not None
+        except Exception as e:
+            logger.warning(f"Could not look up the metadata of {input_path} in {self.path}: {e}")
+            return False
+
+    def put(self, input_path: str, omemeta, series: Union[int, str] = 0, reader: str = 'bfio') -> None:
+        """Store the OME metadata of a series, replacing an entry of an older version of the file."""
+        from ome_types import to_xml
+        try:
+            size, mtime = self._stat(input_path)
+            omexml = to_xml(omemeta)
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (os.path.abspath(input_path), str(series), reader, size, mtime,
+                              omexml, len(omexml.encode('utf-8')), time.time()))
+                self._evict(conn)
+        except Exception as e:
+            logger.warning(f"Could not cache the metadata of {input_path} in {self.path}: {e}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM metadata WHERE accessed < ?", (time.time() - self.max_age_days * 86400,))
+        total = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM metadata").fetchone()[0]
+        excess = total - self.max_size_mb * 1024 ** 2
+        if excess <= 0:
+            return
+        rows = conn.execute("SELECT rowid, nbytes FROM metadata ORDER BY accessed").fetchall()
+        stale = []
+        for rowid, nbytes in rows:
+            if excess <= 0:
+                break
+            stale.append((rowid,))
+            excess -= nbytes
+        conn.executemany("DELETE FROM metadata WHERE rowid = ?", stale)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM metadata")
+
+
+def configure_metadata_cache(path: Optional[Union[str, Path]] = DEFAULT_METADATA_CACHE_PATH,
+                             max_age_days: float = DEFAULT_METADATA_CACHE_MAX_AGE_DAYS,
+                             max_size_mb: float = DEFAULT_METADATA_CACHE_MAX_SIZE_MB
+                             ) -> None:
+    """
+    Configure the metadata cache used by `get_metadata_cache`, or disable it with path=None.
+
+    The settings are exported to the environment, from which worker processes started afterwards read them.
+    """
+    os.environ['EUBI_METADATA_CACHE'] = '' if path is None else str(path)
+    os.environ['EUBI_METADATA_CACHE_MAX_AGE_DAYS'] = str(max_age_days)
+    os.environ['EUBI_METADATA_CACHE_MAX_SIZE_MB'] = str(max_size_mb)
+
+
+def get_metadata_cache() -> Optional[MetadataCache]:
+    """Return the configured metadata cache, or None if it is disabled."""
+    path = os.environ.get('EUBI_METADATA_CACHE', DEFAULT_METADATA_CACHE_PATH)
+    if path == '':
+        return None
+    return MetadataCache(path,
+                         max_age_days=float(os.environ.get('EUBI_METADATA_CACHE_MAX_AGE_DAYS',
+                                                           DEFAULT_METADATA_CACHE_MAX_AGE_DAYS)),
+                         max_size_mb=float(os.environ.get('EUBI_METADATA_CACHE_MAX_SIZE_MB',
+                                                          DEFAULT_METADATA_CACHE_MAX_SIZE_MB)))
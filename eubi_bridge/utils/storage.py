@@ -0,0 +1,319 @@
+import os, json, threading, zipfile
+from pathlib import Path
+from typing import Any, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import fsspec
+import zarr
+from zarr.storage import FsspecStore, LocalStore, StorePath, ZipStore
+
+from eubi_bridge.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_S3_MAX_CONNECTIONS = 64
+DEFAULT_S3_MULTIPART_CONCURRENCY = 8
+DEFAULT_S3_REQUEST_CONCURRENCY = 64
+ZARR_METADATA_KEYS = ('zarr.json', '.zarray', '.zattrs', '.zgroup', '.zmetadata')
+
+
+def is_remote_path(path: Union[str, Path]) -> bool:
+    """Tell whether a path is a URL of an object store, e.g. s3://bucket/image.zarr, rather than a local path."""
+    scheme = urlparse(str(path)).scheme
+    # Single letters are Windows drive letters.
+    return len(scheme) > 1 and scheme != 'file'
+
+
+def configure_remote_storage(endpoint_url: Optional[str] = None,
+                             max_connections: int = DEFAULT_S3_MAX_CONNECTIONS,
+                             multipart_concurrency: int = DEFAULT_S3_MULTIPART_CONCURRENCY,
+                             request_concurrency: int = DEFAULT_S3_REQUEST_CONCURRENCY
+                             ) -> dict:
+    """
+    Configure the S3 connections used for s3:// outputs.
+
+    The options are registered as fsspec defaults for the s3 protocol, so every store opened from
+    an s3:// URL uses them. They are also exported to the environment, from which worker processes
+    started afterwards read them.
+
+    Args:
+        endpoint_url: URL of an S3-compatible service, e.g. a MinIO server. If None, AWS S3 is used.
+        max_connections: Size of the HTTP connection pool of each filesystem instance
+        multipart_concurrency: Number of parts of a single object uploaded concurrently. Objects
+            larger than the part size, typically shards, are uploaded in parts.
+        request_concurrency: Number of store requests that zarr and tensorstore may have in flight
+
+    Returns:
+        The s3 options registered with fsspec
+    """
+    options = {
+        'config_kwargs': {'max_pool_connections': int(max_connections)},
+        'max_concurrency': int(multipart_concurrency),
+    }
+    if endpoint_url is not None:
+        options['endpoint_url'] = endpoint_url
+    fsspec.config.conf.setdefault('s3', {}).update(options)
+    os.environ['FSSPEC_S3'] = json.dumps(fsspec.config.conf['s3'])
+    zarr.config.set({'async.concurrency': int(request_concurrency)})
+    os.environ['ZARR_ASYNC__CONCURRENCY'] = str(int(request_concurrency))
+    return options
+
+
+def get_s3_endpoint_url() -> Optional[str]:
+    """Return the S3 endpoint configured for fsspec, if any."""
+    options = fsspec.config.conf.get('s3', {})
+    return options.get('endpoint_url', options.get('client_kwargs', {}).get('endpoint_url'))
+
+
+def get_zarr_store(path: Union[str, Path], read_only: bool = False) -> Any:
+    """Return a zarr store for a local path, for the URL of an object store or for a path inside a zipped output."""
+    zipped = _find_zip_output(path)
+    if zipped is not None:
+        return StorePath(*zipped)
+    if is_remote_path(path):
+        return FsspecStore.from_url(str(path), read_only=read_only)
+    return LocalStore(path, read_only=read_only)
+
+
+def get_store_url(gr: Union[zarr.Group, zarr.Array]) -> str:
+    """Return the local path or URL of a zarr group or array, the inverse of `get_zarr_store`."""
+    store = gr.store
+    if isinstance(store, StreamingZipStore):
+        root = store.root
+    elif isinstance(store, FsspecStore):
+        root = store.fs.unstrip_protocol(store.path)
+    else:
+        root = str(store.root)
+    return os.path.join(root, gr.path) if gr.path else root
+
+
+def get_tensorstore_kvstore(path: Union[str, Path]) -> dict:
+    """Return the tensorstore kvstore spec of a local path or of an s3:// or gs:// URL."""
+    if not is_remote_path(path):
+        return {"driver": "file", "path": str(path)}
+    url = urlparse(str(path))
+    key = url.path.strip('/') + '/'
+    if url.scheme in ('s3', 's3a'):
+        kvstore = {"driver": "s3", "bucket": url.netloc, "path": key}
+        endpoint_url = get_s3_endpoint_url()
+        if endpoint_url is not None:
+            kvstore["endpoint"] = endpoint_url
+        return kvstore
+    if url.scheme in ('gs', 'gcs'):
+        return {"driver": "gcs", "bucket": url.netloc, "path": key}
+    raise ValueError(f"Tensorstore cannot write to '{url.scheme}' URLs. Use the zarr-python writer instead.")
+
+
+def write_store_bytes(gr: zarr.Group, key: str, data: bytes) -> None:
+    """Write raw bytes under a key of a group, locally, into an object store or into a zipped output."""
+    path = os.path.join(get_store_url(gr), key)
+    zipped = _find_zip_output(path)
+    if zipped is not None:
+        store, inner = zipped
+        store.write_bytes(inner, data)
+    elif is_remote_path(path):
+        with fsspec.open(path, 'wb') as f:
+            f.write(data)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def _is_metadata_key(key: str) -> bool:
+    return key.rsplit('/', 1)[-1] in ZARR_METADATA_KEYS
+
+
+class StreamingZipStore(ZipStore):
+    """
+    A zip store that writes an OME-Zarr into a single file in one sequential pass.
+
+    Chunks, or whole shards for zarr v3, are appended to the archive as soon as they are written,
+    as stored entries since zarr has compressed them already. Metadata documents, which are
+    rewritten several times during a conversion, are kept in memory and appended once on close,
+    followed by the central directory.
+
+    The archive is opened by zarr when a group or an array is first opened on the store, as with
+    any other zarr store.
+
+    Args:
+        path: Path of the zip file
+        root: Path of the OME-Zarr that the zip file stands for, e.g. /data/out/image.zarr
+    """
+    def __init__(self, path: Union[str, Path], root: Union[str, Path]):
+        super().__init__(path, mode='w')
+        self.root = os.path.normpath(str(root))
+        self._metadata = {}
+        self._metadata_lock = threading.Lock()
+        self._closed = False
+
+    def __setstate__(self, state: dict) -> None:
+        # Reopening the archive in another process would truncate it.
+        raise RuntimeError(f"The zipped output {state.get('path')} can only be written by the process that created it.")
+
+    def _check_not_closed(self) -> None:
+        # zarr would reopen a closed archive for writing, which truncates it.
+        if self._closed:
+            raise ValueError(f"The zipped output {self.path} is closed already.")
+
+    async def get(self, key, prototype, byte_range=None):
+        self._check_not_closed()
+        with self._metadata_lock:
+            value = self._metadata.get(key)
+        if value is not None and byte_range is None:
+            return prototype.buffer.from_bytes(value)
+        return await super().get(key, prototype, byte_range)
+
+    async def get_partial_values(self, prototype, key_ranges):
+        self._check_not_closed()
+        return await super().get_partial_values(prototype, key_ranges)
+
+    async def set(self, key, value) -> None:
+        self._check_not_closed()
+        if not _is_metadata_key(key):
+            return await super().set(key, value)
+        with self._metadata_lock:
+            self._metadata[key] = value.to_bytes()
+
+    async def set_if_not_exists(self, key, value) -> None:
+        self._check_not_closed()
+        if not _is_metadata_key(key):
+            return await super().set_if_not_exists(key, value)
+        with self._metadata_lock:
+            self._metadata.setdefault(key, value.to_bytes())
+
+    async def delete(self, key: str) -> None:
+        with self._metadata_lock:
+            if self._metadata.pop(key, None) is not None:
+                return
+        await super().delete(key)
+
+    async def delete_dir(self, prefix: str) -> None:
+        if prefix != "" and not prefix.endswith("/"):
+            prefix += "/"
+        with self._metadata_lock:
+            for key in [key for key in self._metadata if key.startswith(prefix)]:
+                del self._metadata[key]
+        await super().delete_dir(prefix)
+
+    async def exists(self, key: str) -> bool:
+        self._check_not_closed()
+        with self._metadata_lock:
+            if key in self._metadata:
+                return True
+        return await super().exists(key)
+
+    async def list(self):
+        self._check_not_closed()
+        async for key in super().list():
+            yield key
+        with self._metadata_lock:
+            keys = list(self._metadata)
+        for key in keys:
+            yield key
+
+    async def list_dir(self, prefix: str):
+        prefix = prefix.rstrip("/")
+        seen = set()
+        async for key in self.list():
+            if prefix == "":
+                child = key.split("/")[0]
+            elif key.startswith(prefix + "/") and key.strip("/") != prefix:
+                child = key.removeprefix(prefix + "/").split("/")[0]
+            else:
+                continue
+            if child not in seen:
+                seen.add(child)
+                yield child
+
+    def write_bytes(self, key: str, data: bytes) -> None:
+        """Buffer an entry, e.g. OME/METADATA.ome.xml, to be appended on close, without going through zarr's event loop."""
+        self._check_not_closed()
+        with self._metadata_lock:
+            self._metadata[key] = bytes(data)
+
+    def close(self) -> None:
+        with self._metadata_lock:
+            if self._closed:
+                return
+            self._closed = True
+            metadata, self._metadata = self._metadata, {}
+        super().close()
+        # Appending rewrites the central directory after the buffered entries.
+        with zipfile.ZipFile(self.path, mode='a', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            # Parents first, so that the root group precedes its arrays.
+            for key in sorted(metadata, key=lambda key: (key.count('/'), key)):
+                zf.writestr(key, metadata[key])
+
+
+_ZIP_OUTPUTS = {}
+_ZIP_LOCK = threading.Lock()
+
+
+def get_zip_output_path(image_path: Union[str, Path], zarr_format: int = 2) -> str:
+    """Return the path of the zip file written for an OME-Zarr: image.ozx for zarr v3, image.zarr.zip for v2."""
+    image_path = os.path.normpath(str(image_path))
+    if zarr_format == 3:
+        base = image_path[:-len('.zarr')] if image_path.endswith('.zarr') else image_path
+        return base + '.ozx'
+    return image_path + '.zip'
+
+
+def open_zip_output(image_path: Union[str, Path],
+                    zarr_format: int = 2,
+                    overwrite: bool = False
+                    ) -> StreamingZipStore:
+    """
+    Register an OME-Zarr path to be written into a single zip file.
+
+    Until `close_zip_outputs` is called, `get_zarr_store` and `resolve_store` map the path and any
+    path inside it to the zip file, so the writers can keep addressing the image by its path.
+    """
+    if is_remote_path(image_path):
+        raise ValueError(f"Zipped outputs must be written to a local path, not to {image_path}.")
+    root = os.path.normpath(str(image_path))
+    with _ZIP_LOCK:
+        if root not in _ZIP_OUTPUTS:
+            zip_path = get_zip_output_path(root, zarr_format)
+            if os.path.exists(zip_path) and not overwrite:
+                raise FileExistsError(f"{zip_path} already exists. Set overwrite to replace it.")
+            os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+            store = StreamingZipStore(zip_path, root)
+            # Opening the root group opens the archive, before any path inside it is resolved.
+            zarr.open_group(store, mode='a', zarr_format=zarr_format)
+            _ZIP_OUTPUTS[root] = store
+            logger.info(f"Writing {root} into {zip_path}.")
+        return _ZIP_OUTPUTS[root]
+
+
+def _find_zip_output(path: Union[str, Path]) -> Optional[Tuple[StreamingZipStore, str]]:
+    if len(_ZIP_OUTPUTS) == 0 or is_remote_path(path):
+        return None
+    path = os.path.normpath(str(path))
+    with _ZIP_LOCK:
+        for root, store in _ZIP_OUTPUTS.items():
+            if path == root or path.startswith(root + os.sep):
+                inner = os.path.relpath(path, root)
+                return store, '' if inner == '.' else inner.replace(os.sep, '/')
+    return None
+
+
+def is_zip_output(path: Union[str, Path]) -> bool:
+    """Tell whether a path lies inside an OME-Zarr that is being written into a zip file."""
+    return _find_zip_output(path) is not None
+
+
+def resolve_store(path: Union[str, Path]) -> Union[str, Path, StorePath]:
+    """Return the store of a path inside a zipped output, or the path itself, for passing to the zarr API."""
+    zipped = _find_zip_output(path)
+    return StorePath(*zipped) if zipped is not None else path
+
+
+def close_zip_outputs() -> List[str]:
+    """Finish all zipped outputs by writing their metadata and central directories, and return the zip paths."""
+    with _ZIP_LOCK:
+        stores = list(_ZIP_OUTPUTS.values())
+        _ZIP_OUTPUTS.clear()
+    for store in stores:
+        store.close()
+    return [str(store.path) for store in stores]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from eubi_bridge.utils.convenience import _align_to_source, autocompute_chunk_shape, autocompute_shard_shape
+
+
+@pytest.mark.parametrize('array_shape, chunk_shape, axes, kwargs, expected', [
+    # The array holds less than the target, so it becomes a single shard.
+    ((1, 2, 2048, 2048), (1, 1, 256, 256), 'tcyx', dict(target_shard_mb=64), (1, 2, 2048, 2048)),
+    # The shortest side grows first, so the shard stays close to a cube.
+    ((512, 512, 512), (64, 64, 64), 'zyx', dict(target_shard_mb=64), (512, 256, 256)),
+    # Spatial axes grow before channels, channels before time.
+    ((4, 2, 512, 512), (1, 1, 256, 256), 'tcyx', dict(target_shard_mb=1), (1, 2, 512, 512)),
+    # Planes stack along z until the target is reached.
+    ((1, 1, 100, 1000, 1000), (1, 1, 1, 1000, 1000), 'tczyx', dict(target_shard_mb=8), (1, 1, 4, 1000, 1000)),
+])
+def test_shard_shape_from_target(array_shape, chunk_shape, axes, kwargs, expected):
+    shards = autocompute_shard_shape(array_shape, chunk_shape, axes, **kwargs)
+    assert shards == expected
+    assert np.all(np.mod(shards, chunk_shape) == 0)
+
+
+def test_max_files_overrides_target():
+    array_shape, chunk_shape = (4, 2, 512, 512), (1, 1, 256, 256)
+    shards = autocompute_shard_shape(array_shape, chunk_shape, 'tcyx', target_shard_mb=0.5, max_files_per_array=2)
+    assert shards == (2, 2, 512, 512)
+    assert np.prod(-(-np.array(array_shape) // shards)) == 2
+
+
+def test_shard_spans_at_most_the_chunks_of_the_array():
+    assert autocompute_shard_shape((3, 100, 100), (2, 64, 64), 'zyx', max_files_per_array=1) == (4, 128, 128)
+    assert autocompute_shard_shape((3, 100, 100), (2, 64, 64), 'zyx', target_shard_mb=1e6) == (4, 128, 128)
+
+
+def test_lengths_must_match_axes():
+    with pytest.raises(ValueError):
+        autocompute_shard_shape((10, 10), (5, 5, 5), 'yx', target_shard_mb=1)
+
+
+@pytest.mark.parametrize('size, source, dim, expected', [
+    (100, 16, 1000, 96),    # the nearest multiple of a smaller block
+    (20, 16, 1000, 16),
+    (5, 16, 1000, 4),       # the nearest divisor of a larger block
+    (7, 12, 1000, 6),
+    (100, 1000, 1000, 100), # the source is not split along the axis
+    (64, 512, 40, 64),      # the chunk spans the whole axis
+])
+def test_align_to_source(size, source, dim, expected):
+    assert _align_to_source(size, source, dim) == expected
+
+
+@pytest.mark.parametrize('access_profile, array_shape, expected', [
+    ('volumetric', (1, 3, 512, 512, 512), (1, 1, 81, 81, 81)),
+    ('2d-browse', (1, 3, 512, 512, 512), (1, 1, 1, 512, 512)),
+    ('time-series', (100, 1, 20, 512, 512), (100, 1, 1, 72, 72)),
+])
+def test_chunk_shape_per_access_profile(access_profile, array_shape, expected):
+    assert autocompute_chunk_shape(array_shape, 'tczyx', access_profile=access_profile) == expected
+
+
+def test_chunk_shape_follows_source_blocks():
+    chunks = autocompute_chunk_shape((1, 1, 512, 512, 512), 'tczyx', source_chunks=(1, 1, 512, 48, 48))
+    assert chunks == (1, 1, 81, 96, 96)
+
+
+def test_unknown_access_profile():
+    with pytest.raises(ValueError):
+        autocompute_chunk_shape((1, 1, 8, 8, 8), 'tczyx', access_profile='random')
@@ -0,0 +1,156 @@
+import os
+
+import numpy as np
+import dask.array as da
+import pytest
+import zarr
+
+import eubi_bridge.ebridge_base as ebridge_base
+from eubi_bridge.base.writers import store_arrays
+from eubi_bridge.ebridge_base import downscale, extend_pyramid, repair_pyramid_layer
+from eubi_bridge.ngff.multiscales import Pyramid
+
+FACTORS = dict(time_scale_factor=1, channel_scale_factor=1, z_scale_factor=1, y_scale_factor=2, x_scale_factor=2)
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).integers(0, 1000, size=(1, 2, 4, 64, 80)).astype('uint16')
+
+
+def _write_base(output_path, data, zarr_format=3, **kwargs):
+    key = os.path.join(str(output_path), 'image.zarr', '0')
+    return store_arrays({key: da.from_array(data, chunks=(1, 1, 2, 32, 32))}, str(output_path),
+                        axes={key: 'tczyx'}, scales={key: (1, 1, 2, 0.5, 0.5)},
+                        units={key: ['second', 'micrometer', 'micrometer', 'micrometer']},
+                        auto_chunk=False, output_chunks={key: (1, 1, 2, 16, 16)},
+                        output_shard_coefficients={key: (1, 1, 1, 2, 2)}, channel_meta={key: 'auto'},
+                        compute=True, overwrite=True, zarr_format=zarr_format, **kwargs)
+
+
+def _fail_layer(monkeypatch, failing):
+    """Make the layers at the given paths fail while they are computed."""
+    store_pyramid_layers = ebridge_base._store_pyramid_layers
+
+    def fail(block):
+        raise RuntimeError('preempted')
+
+    def patched(pyr, layers, **kwargs):
+        layers = {path: layer.map_blocks(fail, dtype=layer.dtype) if path in failing else layer
+                  for path, layer in layers.items()}
+        return store_pyramid_layers(pyr, layers, **kwargs)
+    monkeypatch.setattr(ebridge_base, '_store_pyramid_layers', patched)
+
+
+@pytest.mark.parametrize('cascade', ['graph', 'disk', 'off'])
+def test_downscale(tmp_path, data, cascade):
+    results = _write_base(tmp_path, data)
+    downscale(results, **FACTORS, n_layers=3, downscale_method='simple', cascade=cascade, zarr_format=3)
+    gr = zarr.open_group(str(tmp_path / 'image.zarr'), mode='r')
+    for level in range(3):
+        step = 2 ** level
+        np.testing.assert_array_equal(gr[str(level)][:], data[..., ::step, ::step])
+
+
+def test_disk_cascade_stops_at_failed_round(tmp_path, data, monkeypatch):
+    results = _write_base(tmp_path, data)
+    _fail_layer(monkeypatch, {'1'})
+    with pytest.raises(RuntimeError, match='preempted'):
+        downscale(results, **FACTORS, n_layers=3, downscale_method='simple', cascade='disk', zarr_format=3)
+    # The layer after the failed one is never derived from it.
+    assert '2' not in zarr.open_group(str(tmp_path / 'image.zarr'), mode='r')
+
+
+def _pyramid(tmp_path, data, n_layers, downscale_method='simple', cascade='graph'):
+    results = _write_base(tmp_path, data)
+    downscale(results, **FACTORS, n_layers=n_layers, downscale_method=downscale_method, cascade=cascade,
+              zarr_format=3)
+    return str(tmp_path / 'image.zarr')
+
+
+def test_extend_pyramid(tmp_path, data):
+    gr_path = _pyramid(tmp_path, data, n_layers=2)
+    added = extend_pyramid([gr_path], **FACTORS, n_layers=4, downscale_method='simple')
+    assert added == {gr_path: ['2', '3']}
+    gr = zarr.open_group(gr_path, mode='r')
+    for level in range(4):
+        step = 2 ** level
+        np.testing.assert_array_equal(gr[str(level)][:], data[..., ::step, ::step])
+    assert Pyramid(gr_path).meta.resolution_paths == ['0', '1', '2', '3']
+
+
+def test_extend_pyramid_removes_layers_after_unreadable_one(tmp_path, data):
+    gr_path = _pyramid(tmp_path, data, n_layers=4)
+    os.remove(os.path.join(gr_path, '1', 'zarr.json'))
+    # Only the base layer is readable, and no new layer is asked for.
+    assert extend_pyramid([gr_path], **FACTORS, n_layers=1, downscale_method='simple') == {gr_path: []}
+    assert Pyramid(gr_path).meta.resolution_paths == ['0']
+    assert not os.path.exists(os.path.join(gr_path, '2'))
+
+
+def test_failed_extend_keeps_pyramid_consistent(tmp_path, data, monkeypatch):
+    gr_path = _pyramid(tmp_path, data, n_layers=2)
+    _fail_layer(monkeypatch, {'3'})
+    with pytest.raises(RuntimeError, match='preempted'):
+        extend_pyramid([gr_path], **FACTORS, n_layers=4, downscale_method='simple')
+    assert Pyramid(gr_path).meta.resolution_paths == ['0', '1']
+    assert sorted(zarr.open_group(gr_path, mode='r').array_keys()) == ['0', '1']
+
+
+def test_repair_pyramid_layer(tmp_path, data):
+    gr_path = _pyramid(tmp_path, data, n_layers=3)
+    zarr.open_group(gr_path, mode='a')['1'][:] = 0
+    assert repair_pyramid_layer(gr_path, 1, downscale_method='simple') == '1'
+    gr = zarr.open_group(gr_path, mode='r')
+    np.testing.assert_array_equal(gr['1'][:], data[..., ::2, ::2])
+    np.testing.assert_array_equal(gr['2'][:], data[..., ::4, ::4])
+
+
+def test_repair_base_layer_is_refused(tmp_path, data):
+    gr_path = _pyramid(tmp_path, data, n_layers=2)
+    with pytest.raises(ValueError):
+        repair_pyramid_layer(gr_path, 0)
+
+
+def test_failed_repair_removes_layer(tmp_path, data, monkeypatch):
+    gr_path = _pyramid(tmp_path, data, n_layers=3)
+    _fail_layer(monkeypatch, {'1'})
+    with pytest.raises(RuntimeError, match='preempted'):
+        repair_pyramid_layer(gr_path, 1, downscale_method='simple')
+    # The layer stays listed but can no longer pass as complete; a second repair rebuilds it.
+    assert Pyramid(gr_path).meta.resolution_paths == ['0', '1', '2']
+    assert not os.path.exists(os.path.join(gr_path, '1'))
+    monkeypatch.undo()
+    repair_pyramid_layer(gr_path, 1, downscale_method='simple')
+    np.testing.assert_array_equal(zarr.open_group(gr_path, mode='r')['1'][:], data[..., ::2, ::2])
+
+
+def test_refresh_region_matches_full_downscale(tmp_path, data):
+    gr_path = _pyramid(tmp_path / 'edited', data, n_layers=3, downscale_method='mean')
+    modified = data.copy()
+    modified[0, 1, 1:3, 10:30, 5:40] = 7
+    zarr.open_group(gr_path, mode='a')['0'][0, 1, 1:3, 10:30, 5:40] = 7
+    refreshed = Pyramid(gr_path).refresh_region([None, (1, 2), (1, 3), (10, 30), (5, 40)], downscale_method='mean')
+    assert list(refreshed) == ['1', '2']
+    # Only the shards under the edit are recomputed: the other channel is left alone.
+    assert refreshed['1'][1] == slice(1, 2)
+    assert refreshed['1'][3] == slice(0, 32)
+    expected = zarr.open_group(_pyramid(tmp_path / 'fresh', modified, n_layers=3, downscale_method='mean'), mode='r')
+    gr = zarr.open_group(gr_path, mode='r')
+    for level in ['1', '2']:
+        np.testing.assert_array_equal(gr[level][:], expected[level][:])
+
+
+@pytest.mark.parametrize('cascade', ['graph', 'off'])
+@pytest.mark.parametrize('downscale_method', ['simple', 'mean'])
+def test_fused_pyramid_equals_separate_one(tmp_path, data, cascade, downscale_method):
+    fused_path = tmp_path / 'fused' / 'image.zarr'
+    _write_base(tmp_path / 'fused', data, pyramid_params=dict(**FACTORS, n_layers=3, cascade=cascade,
+                                                              downscale_method=downscale_method))
+    expected_path = _pyramid(tmp_path / 'separate', data, n_layers=3, downscale_method=downscale_method,
+                             cascade=cascade)
+    fused, expected = Pyramid(str(fused_path)), Pyramid(expected_path)
+    assert fused.meta.resolution_paths == expected.meta.resolution_paths == ['0', '1', '2']
+    for level in ['0', '1', '2']:
+        assert fused.meta.get_scale(level) == expected.meta.get_scale(level)
+        np.testing.assert_array_equal(fused.gr[level][:], expected.gr[level][:])
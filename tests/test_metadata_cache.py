@@ -0,0 +1,116 @@
+import os, time
+
+import pytest
+from ome_types import OME
+from ome_types.model import Image, Pixels
+
+from eubi_bridge.utils.metadata_cache import MetadataCache, configure_metadata_cache, get_metadata_cache
+
+
+def _ome(name, size_x=8):
+    pixels = Pixels(dimension_order='XYZCT', type='uint16', size_x=size_x, size_y=8, size_z=1, size_c=1, size_t=1)
+    return OME(images=[Image(id='Image:0', name=name, pixels=pixels)])
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / 'image.tif'
+    path.write_bytes(b'\0' * 64)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MetadataCache(tmp_path / 'cache' / 'metadata.sqlite')
+
+
+def test_round_trip(cache, image):
+    assert cache.get(image) is None
+    assert not cache.has(image)
+    cache.put(image, _ome('image', size_x=17))
+    assert cache.has(image)
+    omemeta = cache.get(image)
+    assert omemeta.images[0].name == 'image'
+    assert omemeta.images[0].pixels.size_x == 17
+
+
+def test_key_includes_series_and_reader(cache, image):
+    cache.put(image, _ome('series 1'), series=1, reader='bfio')
+    assert cache.get(image, series=1, reader='bfio').images[0].name == 'series 1'
+    assert cache.get(image, series=0, reader='bfio') is None
+    assert cache.get(image, series=1, reader='bioio') is None
+
+
+def test_invalidated_when_mtime_changes(cache, image):
+    cache.put(image, _ome('image'))
+    stat = os.stat(image)
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.get(image) is None
+    assert not cache.has(image)
+
+
+def test_invalidated_when_size_changes(cache, image):
+    cache.put(image, _ome('image'))
+    stat = os.stat(image)
+    with open(image, 'ab') as f:
+        f.write(b'\0')
+    # Keep the modification time, so that only the size tells the versions apart.
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.get(image) is None
+
+
+def test_put_replaces_older_version(cache, image):
+    cache.put(image, _ome('old'))
+    with open(image, 'ab') as f:
+        f.write(b'\0')
+    cache.put(image, _ome('new'))
+    assert cache.get(image).images[0].name == 'new'
+
+
+def test_unused_entries_expire(tmp_path, image):
+    cache = MetadataCache(tmp_path / 'metadata.sqlite', max_age_days=1)
+    cache.put(image, _ome('image'))
+    with cache._connect() as conn:
+        conn.execute("UPDATE metadata SET accessed = ?", (time.time() - 2 * 86400,))
+    other = tmp_path / 'other.tif'
+    other.write_bytes(b'\0')
+    cache.put(str(other), _ome('other'))
+    assert cache.get(image) is None
+    assert cache.get(str(other)) is not None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'image{i}.tif'
+        path.write_bytes(b'\0')
+        paths.append(str(path))
+    nbytes = len(_ome('image0').to_xml().encode('utf-8'))
+    # Room for two entries only.
+    cache = MetadataCache(tmp_path / 'metadata.sqlite', max_size_mb=2.5 * nbytes / 1024 ** 2)
+    cache.put(paths[0], _ome('image0'))
+    cache.put(paths[1], _ome('image1'))
+    cache.get(paths[0])
+    cache.put(paths[2], _ome('image2'))
+    assert cache.has(paths[0])
+    assert not cache.has(paths[1])
+    assert cache.has(paths[2])
+
+
+def test_unreadable_database_is_ignored(tmp_path, image):
+    path = tmp_path / 'metadata.sqlite'
+    path.write_bytes(b'not a database' * 100)
+    cache = MetadataCache(path)
+    cache.put(image, _ome('image'))
+    assert cache.get(image) is None
+
+
+def test_configure(tmp_path, monkeypatch):
+    for key in ('EUBI_METADATA_CACHE', 'EUBI_METADATA_CACHE_MAX_AGE_DAYS', 'EUBI_METADATA_CACHE_MAX_SIZE_MB'):
+        monkeypatch.delenv(key, raising=False)
+    configure_metadata_cache(tmp_path / 'metadata.sqlite', max_age_days=3, max_size_mb=5)
+    cache = get_metadata_cache()
+    assert cache.path == str(tmp_path / 'metadata.sqlite')
+    assert (cache.max_age_days, cache.max_size_mb) == (3, 5)
+    configure_metadata_cache(None)
+    assert get_metadata_cache() is None
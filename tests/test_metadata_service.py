@@ -0,0 +1,98 @@
+import os, sys, textwrap
+
+import pytest
+from ome_types import OME, to_xml
+from ome_types.model import Image, Pixels
+
+import eubi_bridge
+from eubi_bridge.base.metadata_service import MetadataService
+
+# Loaded by the spawned workers at startup. Files named hang.* never return, files named crash.* kill
+# the worker; all other files are read as usual.
+_FAULTY_READER = textwrap.dedent("""
+    import os, time
+    import eubi_bridge.base.readers as readers
+    _read_ome_metadata = readers.read_ome_metadata
+    def read_ome_metadata(input_path, series=None, meta_reader='bioio'):
+        name = os.path.basename(input_path)
+        if name.startswith('hang.'):
+            time.sleep(3600)
+        if name.startswith('crash.'):
+            os._exit(3)
+        return _read_ome_metadata(input_path, series, meta_reader)
+    readers.read_ome_metadata = read_ome_metadata
+""")
+
+
+def _write_ome(path, name):
+    pixels = Pixels(dimension_order='XYZCT', type='uint16', size_x=8, size_y=8, size_z=1, size_c=1, size_t=1)
+    with open(path, 'w') as f:
+        f.write(to_xml(OME(images=[Image(id='Image:0', name=name, pixels=pixels)])))
+    return str(path)
+
+
+@pytest.fixture
+def faulty_reader(tmp_path, monkeypatch):
+    hooks = tmp_path / 'hooks'
+    hooks.mkdir()
+    (hooks / 'sitecustomize.py').write_text(_FAULTY_READER)
+    package_root = os.path.dirname(os.path.dirname(eubi_bridge.__file__))
+    paths = [str(hooks), package_root] + [path for path in sys.path if path]
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(paths))
+
+
+def _names(results):
+    return [result.images[0].name if not isinstance(result, Exception) else None for result in results]
+
+
+def test_reads_in_order(tmp_path):
+    paths = [_write_ome(tmp_path / f'image{i}.ome.xml', f'image{i}') for i in range(5)]
+    service = MetadataService(n_workers=2, timeout=60)
+    try:
+        results = service.read([(path, 0, 'bioio') for path in paths])
+    finally:
+        service.close()
+    assert _names(results) == [f'image{i}' for i in range(5)]
+
+
+def test_failed_request_does_not_fail_others(tmp_path):
+    good = _write_ome(tmp_path / 'good.ome.xml', 'good')
+    service = MetadataService(n_workers=1, timeout=60)
+    try:
+        results = service.read([(str(tmp_path / 'missing.ome.xml'), 0, 'bioio'), (good, 0, 'bioio')])
+    finally:
+        service.close()
+    assert isinstance(results[0], RuntimeError)
+    assert _names(results)[1] == 'good'
+
+
+def test_timed_out_worker_is_restarted(tmp_path, faulty_reader):
+    before = _write_ome(tmp_path / 'before.ome.xml', 'before')
+    hang = _write_ome(tmp_path / 'hang.ome.xml', 'hang')
+    after = _write_ome(tmp_path / 'after.ome.xml', 'after')
+    service = MetadataService(n_workers=1, timeout=2)
+    try:
+        results = service.read([(path, 0, 'bioio') for path in (before, hang, after)])
+        pid = service._workers[0].process.pid
+        again = service.read([(before, 0, 'bioio')])
+        assert service._workers[0].process.pid == pid
+    finally:
+        service.close()
+    assert _names(results) == ['before', None, 'after']
+    assert 'took longer than' in str(results[1])
+    assert _names(again) == ['before']
+
+
+def test_crashed_worker_is_restarted(tmp_path, faulty_reader):
+    before = _write_ome(tmp_path / 'before.ome.xml', 'before')
+    crash = _write_ome(tmp_path / 'crash.ome.xml', 'crash')
+    after = _write_ome(tmp_path / 'after.ome.xml', 'after')
+    service = MetadataService(n_workers=1, timeout=60)
+    try:
+        results = service.read([(path, 0, 'bioio') for path in (before, crash, after)])
+        again = service.read([(crash, 0, 'bioio'), (after, 0, 'bioio')])
+    finally:
+        service.close()
+    assert _names(results) == ['before', None, 'after']
+    assert 'crashed' in str(results[1])
+    assert _names(again) == [None, 'after']
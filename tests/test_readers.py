@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+import tifffile
+
+from eubi_bridge.base.readers import array_from_header, probe_header, probe_headers, probe_homogeneous_headers
+
+
+@pytest.fixture
+def stack():
+    return np.random.default_rng(0).integers(0, 60000, size=(3, 2, 40, 50)).astype('uint16')
+
+
+def _write(path, data, **kwargs):
+    tifffile.imwrite(path, data, metadata={'axes': 'ZCYX'}, **kwargs)
+    return str(path)
+
+
+def test_probe_headers(tmp_path, stack):
+    paths = [_write(tmp_path / 'contiguous.tif', stack),
+             _write(tmp_path / 'tiles.tif', stack + 1, compression='zlib', tile=(16, 32)),
+             str(tmp_path / 'image.czi'),
+             str(tmp_path / 'image.ome.tif')]
+    headers = probe_headers(paths, max_workers=2)
+    # Formats without a header probe are left to their readers.
+    assert headers[2:] == [None, None]
+    for header, path, offset in zip(headers, paths, (0, 1)):
+        assert header['path'] == path
+        assert header['layout']['shape'] == stack.shape
+        np.testing.assert_array_equal(array_from_header(header).compute(), (stack + offset).transpose(1, 0, 2, 3)[None])
+
+
+def test_probe_follows_reader_options(tmp_path, stack):
+    path = _write(tmp_path / 'image.tif', stack)
+    assert probe_header(path, tiff_fast_path=False) is None
+    assert probe_header(path, scene_index=1) is None
+    assert probe_headers([]) == []
+
+
+def test_homogeneous_headers(tmp_path, stack):
+    paths = [_write(tmp_path / f'image{i}.tif', stack + i) for i in range(4)]
+    headers = probe_homogeneous_headers(paths, sample_size=2)
+    assert [header['path'] for header in headers] == paths
+    # Only the first image was opened; the others take over its layout.
+    assert headers[0]['layout']['mtime'] is not None
+    assert all(header['layout']['mtime'] is None for header in headers[1:])
+    for i, header in enumerate(headers):
+        np.testing.assert_array_equal(array_from_header(header)[0].compute(), (stack + i).transpose(1, 0, 2, 3))
+
+
+def test_sample_detects_heterogeneous_images(tmp_path, stack):
+    paths = [_write(tmp_path / 'image0.tif', stack), _write(tmp_path / 'image1.tif', stack[:, :, :30])]
+    with pytest.raises(ValueError, match='not homogeneous'):
+        probe_homogeneous_headers(paths, sample_size=1)
+    # Outside the sample, the mismatch shows up when the image is read.
+    headers = probe_homogeneous_headers(paths, sample_size=0)
+    with pytest.raises(ValueError, match='not homogeneous'):
+        array_from_header(headers[1]).compute()
+
+
+def test_homogeneous_headers_without_probe(tmp_path):
+    assert probe_homogeneous_headers([str(tmp_path / 'image.czi'), str(tmp_path / 'other.czi')]) is None
+    assert probe_homogeneous_headers([]) == []
@@ -0,0 +1,78 @@
+import os, urllib.request
+
+import numpy as np
+import dask.array as da
+import fsspec
+import pytest
+import zarr
+from zarr.storage import FsspecStore
+
+moto_server = pytest.importorskip('moto.server')
+s3fs = pytest.importorskip('s3fs')
+
+from eubi_bridge.base.writers import store_arrays
+from eubi_bridge.utils.storage import configure_remote_storage, get_tensorstore_kvstore, get_zarr_store
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).integers(0, 1000, size=(1, 2, 4, 40, 50)).astype('uint16')
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    yield 'http://{}:{}'.format(*server.get_host_and_port())
+    server.stop()
+
+
+@pytest.fixture
+def endpoint_url(server, monkeypatch):
+    """Serve an empty mock S3 with a bucket named 'bucket', and undo the configuration of the remote storage."""
+    urllib.request.urlopen(urllib.request.Request(f'{server}/moto-api/reset', method='POST'))
+    for name, value in [('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                        ('AWS_DEFAULT_REGION', 'us-east-1'), ('AWS_REGION', 'us-east-1')]:
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv('FSSPEC_S3', raising=False)
+    monkeypatch.delenv('ZARR_ASYNC__CONCURRENCY', raising=False)
+    monkeypatch.setitem(fsspec.config.conf, 's3', {})
+    concurrency = zarr.config.get('async.concurrency')
+    s3fs.S3FileSystem.clear_instance_cache()
+    s3fs.S3FileSystem(endpoint_url=server).mkdir('bucket')
+    yield server
+    zarr.config.set({'async.concurrency': concurrency})
+    s3fs.S3FileSystem.clear_instance_cache()
+
+
+def test_configure_remote_storage(endpoint_url, data):
+    options = configure_remote_storage(endpoint_url=endpoint_url, max_connections=8, request_concurrency=4)
+    assert options['config_kwargs'] == {'max_pool_connections': 8}
+    assert fsspec.config.conf['s3']['endpoint_url'] == endpoint_url
+    assert zarr.config.get('async.concurrency') == 4
+
+    store = get_zarr_store('s3://bucket/image.zarr')
+    assert isinstance(store, FsspecStore)
+    zarr.open_group(store, mode='w').create_array('0', shape=data.shape, chunks=(1, 1, 2, 20, 25),
+                                                  dtype=data.dtype)[:] = data
+    gr = zarr.open_group(get_zarr_store('s3://bucket/image.zarr', read_only=True), mode='r')
+    np.testing.assert_array_equal(gr['0'][:], data)
+
+
+@pytest.mark.parametrize('writer', [dict(), dict(use_tensorstore=True)])
+def test_store_arrays_to_s3(endpoint_url, data, writer):
+    configure_remote_storage(endpoint_url=endpoint_url)
+    output_path = 's3://bucket/out'
+    key = os.path.join(output_path, 'image.zarr', '0')
+    if writer:
+        assert get_tensorstore_kvstore(key) == {'driver': 's3', 'bucket': 'bucket', 'path': 'out/image.zarr/0/',
+                                                'endpoint': endpoint_url}
+    store_arrays({key: da.from_array(data, chunks=(1, 1, 2, 20, 25))}, output_path,
+                 axes={key: 'tczyx'}, scales={key: (1, 1, 2, 0.5, 0.5)},
+                 units={key: ['second', 'micrometer', 'micrometer', 'micrometer']},
+                 auto_chunk=False, output_chunks={key: (1, 1, 2, 20, 25)},
+                 output_shard_coefficients={key: (1, 1, 1, 1, 2)}, channel_meta={key: 'auto'},
+                 compute=True, overwrite=True, zarr_format=3, **writer)
+    gr = zarr.open_group(get_zarr_store('s3://bucket/out/image.zarr', read_only=True), mode='r')
+    np.testing.assert_array_equal(gr['0'][:], data)
+    assert [dataset['path'] for dataset in gr.attrs['ome']['multiscales'][0]['datasets']] == ['0']
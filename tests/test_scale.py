@@ -0,0 +1,106 @@
+import itertools
+
+import numpy as np
+import dask.array as da
+import pytest
+
+from eubi_bridge.base.scale import (
+    DownscaleManager,
+    max_downscale,
+    mean_downscale,
+    median_downscale,
+    min_downscale,
+    mode_downscale
+)
+
+
+def _mode(window):
+    values, counts = np.unique(window, return_counts=True)
+    return values[np.argmax(counts)] # np.unique sorts, so ties go to the smallest value.
+
+
+def _mean(window):
+    return window.astype(np.float64).mean()
+
+
+REFERENCES = {
+    mean_downscale: _mean,
+    median_downscale: np.median,
+    max_downscale: np.max,
+    min_downscale: np.min,
+    mode_downscale: _mode,
+}
+
+
+def _reference(data, factor, reduce):
+    """Reduce every window of the array, including the incomplete windows at its far edges."""
+    shape = tuple(-(-size // f) for size, f in zip(data.shape, factor))
+    result = np.empty(shape, dtype=np.float64)
+    for index in itertools.product(*[range(size) for size in shape]):
+        window = data[tuple(slice(i * f, (i + 1) * f) for i, f in zip(index, factor))]
+        result[index] = reduce(window)
+    if np.issubdtype(data.dtype, np.integer):
+        result = np.rint(result)
+    return result.astype(data.dtype)
+
+
+@pytest.mark.parametrize('downscale', list(REFERENCES), ids=lambda func: func.__name__)
+@pytest.mark.parametrize('chunks', [
+    (4, 6, 8),   # aligned with the factor, uneven blocks at the far edges
+    (3, 5, 7),   # misaligned, rechunked first
+    (7, 11, 13), # a single block with incomplete windows
+], ids=str)
+@pytest.mark.parametrize('dtype', ['uint8', 'int16', 'float32'])
+def test_kernels_match_reference(downscale, chunks, dtype):
+    rng = np.random.default_rng(0)
+    # Few distinct values, so that the mode and the median have ties to resolve.
+    data = rng.integers(-3, 4, size=(7, 11, 13))
+    if dtype == 'uint8':
+        data = data + 3
+    data = data.astype(dtype)
+    factor = (2, 3, 2)
+    result = downscale(da.from_array(data, chunks=chunks), factor)
+    assert result.dtype == data.dtype
+    expected = _reference(data, factor, REFERENCES[downscale])
+    assert result.shape == expected.shape == (4, 4, 7)
+    np.testing.assert_allclose(result.compute(), expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize('downscale', list(REFERENCES), ids=lambda func: func.__name__)
+def test_unit_factor_is_identity(downscale):
+    arr = da.from_array(np.arange(24, dtype='uint16').reshape(2, 3, 4), chunks=2)
+    assert downscale(arr, (1, 1, 1)) is arr
+
+
+def test_mean_does_not_overflow():
+    data = np.full((4, 4), 65535, dtype='uint16')
+    np.testing.assert_array_equal(mean_downscale(da.from_array(data, chunks=3), (2, 2)).compute(),
+                                  np.full((2, 2), 65535, dtype='uint16'))
+
+
+def test_factor_length_must_match():
+    with pytest.raises(ValueError):
+        mean_downscale(da.zeros((4, 4), chunks=2), (2,))
+
+
+def test_plan_waits_for_z_to_match_lateral_pixel_size():
+    # z pixels are 4 times larger than the lateral pixels, so z is only downscaled from the third layer on.
+    dm = DownscaleManager((1, 1, 16, 256, 256), (1, 1, 2, 2, 2), 4, (1, 1, 2, 0.5, 0.5), axes='tczyx')
+    assert dm.relative_scale_factors.tolist() == [[1, 1, 1, 1, 1], [1, 1, 1, 2, 2], [1, 1, 1, 2, 2], [1, 1, 2, 2, 2]]
+    assert dm.output_shapes[-1].tolist() == [1, 1, 8, 32, 32]
+
+
+def test_plan_honors_min_dimension_size():
+    dm = DownscaleManager((1, 1, 10, 100, 100), (1, 1, 2, 2, 2), 10, axes='tczyx', min_dimension_size=16)
+    # z would drop below 16 at once and is kept; the planning stops before y and x would.
+    assert dm.output_shapes.tolist() == [[1, 1, 10, 100, 100], [1, 1, 10, 50, 50], [1, 1, 10, 25, 25]]
+
+
+def test_plan_stops_when_nothing_is_left_to_downscale():
+    dm = DownscaleManager((1, 1, 1, 4, 4), (1, 1, 2, 2, 2), 6, axes='tczyx')
+    assert dm.output_shapes[:, -2:].tolist() == [[4, 4], [2, 2], [1, 1]]
+
+
+def test_auto_plan_uses_default_min_dimension_size():
+    dm = DownscaleManager((1, 1, 1, 1000, 1000), (1, 1, 2, 2, 2), 'auto', axes='tczyx')
+    assert dm.output_shapes[:, -1].tolist() == [1000, 500, 250, 125]
@@ -0,0 +1,116 @@
+import os, zipfile
+
+import numpy as np
+import dask.array as da
+import pytest
+import zarr
+
+from eubi_bridge.base.writers import store_arrays
+from eubi_bridge.utils.storage import (
+    StreamingZipStore,
+    close_zip_outputs,
+    get_zip_output_path,
+    is_zip_output,
+    open_zip_output,
+    resolve_store,
+    write_store_bytes
+)
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).integers(0, 1000, size=(1, 2, 6, 40, 50)).astype('uint16')
+
+
+@pytest.fixture(autouse=True)
+def no_open_outputs():
+    yield
+    close_zip_outputs()
+
+
+def _read_zip(path):
+    return zarr.open_group(zarr.storage.ZipStore(path, mode='r'), mode='r')
+
+
+@pytest.mark.parametrize('zarr_format', [2, 3])
+def test_streaming_zip_store_round_trip(tmp_path, data, zarr_format):
+    zip_path = str(tmp_path / 'image.zip')
+    store = StreamingZipStore(zip_path, root=tmp_path / 'image.zarr')
+    gr = zarr.open_group(store, mode='w', zarr_format=zarr_format)
+    shards = (1, 1, 6, 20, 50) if zarr_format == 3 else None
+    arr = gr.create_array('0', shape=data.shape, chunks=(1, 1, 3, 10, 25), shards=shards, dtype=data.dtype)
+    arr[:] = data
+    # Metadata is rewritten during a conversion; only the last version may end up in the archive.
+    gr.attrs['name'] = 'first'
+    gr.attrs['name'] = 'last'
+    store.write_bytes('OME/METADATA.ome.xml', b'<OME/>')
+    store.close()
+
+    with zipfile.ZipFile(zip_path) as zf:
+        names = zf.namelist()
+        assert len(names) == len(set(names))
+        assert {info.compress_type for info in zf.infolist()} == {zipfile.ZIP_STORED}
+        assert zf.read('OME/METADATA.ome.xml') == b'<OME/>'
+    gr = _read_zip(zip_path)
+    assert gr.attrs['name'] == 'last'
+    np.testing.assert_array_equal(gr['0'][:], data)
+
+
+def test_zip_path_per_format(tmp_path):
+    assert get_zip_output_path(tmp_path / 'image.zarr', zarr_format=2) == str(tmp_path / 'image.zarr.zip')
+    assert get_zip_output_path(tmp_path / 'image.zarr', zarr_format=3) == str(tmp_path / 'image.ozx')
+
+
+def test_paths_inside_output_resolve_to_zip(tmp_path):
+    root = str(tmp_path / 'image.zarr')
+    open_zip_output(root, zarr_format=3)
+    assert is_zip_output(root)
+    assert is_zip_output(os.path.join(root, '0'))
+    assert not is_zip_output(str(tmp_path / 'other.zarr'))
+    assert resolve_store(os.path.join(root, '0')).path == '0'
+    assert resolve_store(str(tmp_path / 'other.zarr')) == str(tmp_path / 'other.zarr')
+
+
+def test_existing_zip_is_not_overwritten(tmp_path):
+    root = str(tmp_path / 'image.zarr')
+    open(get_zip_output_path(root, zarr_format=3), 'wb').close()
+    with pytest.raises(FileExistsError):
+        open_zip_output(root, zarr_format=3)
+
+
+@pytest.mark.parametrize('zarr_format', [2, 3])
+def test_store_arrays_into_zip(tmp_path, data, zarr_format):
+    output_path = str(tmp_path / 'out')
+    root = os.path.join(output_path, 'image.zarr')
+    key = os.path.join(root, '0')
+    store_arrays({key: da.from_array(data, chunks=(1, 1, 3, 20, 25))}, output_path,
+                 axes={key: 'tczyx'}, scales={key: (1, 1, 2, 0.5, 0.5)},
+                 units={key: ['second', 'micrometer', 'micrometer', 'micrometer']},
+                 auto_chunk=False, output_chunks={key: (1, 1, 3, 20, 25)},
+                 output_shard_coefficients={key: (1, 1, 2, 1, 2)}, channel_meta={key: 'auto'},
+                 compute=True, overwrite=True, zarr_format=zarr_format, zip_output=True)
+    gr = zarr.open_group(resolve_store(root), mode='r')
+    write_store_bytes(gr, 'OME/METADATA.ome.xml', b'<OME/>')
+    zip_path = get_zip_output_path(root, zarr_format)
+    assert close_zip_outputs() == [zip_path]
+    assert not os.path.exists(root)
+
+    gr = _read_zip(zip_path)
+    np.testing.assert_array_equal(gr['0'][:], data)
+    attrs = gr.attrs['ome'] if zarr_format == 3 else gr.attrs
+    assert [dataset['path'] for dataset in attrs['multiscales'][0]['datasets']] == ['0']
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.read('OME/METADATA.ome.xml') == b'<OME/>'
+
+
+def test_closed_zip_store_is_not_reopened(tmp_path, data):
+    root = str(tmp_path / 'image.zarr')
+    store = open_zip_output(root, zarr_format=3)
+    gr = zarr.open_group(resolve_store(root), mode='a')
+    gr.create_array('0', shape=data.shape, chunks=(1, 1, 3, 20, 25), dtype=data.dtype)[:] = data
+    close_zip_outputs()
+    with pytest.raises(ValueError, match='closed'):
+        store.write_bytes('OME/METADATA.ome.xml', b'<OME/>')
+    with pytest.raises(ValueError, match='closed'):
+        gr['0'][:] = 0
+    np.testing.assert_array_equal(_read_zip(get_zip_output_path(root, 3))['0'][:], data)
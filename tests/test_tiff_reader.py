@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import tifffile
+
+from eubi_bridge.base.tiff_reader import (
+    map_axes_to_tczyx,
+    plan_yx_blocks,
+    probe_tiff,
+    read_tiff_native,
+    tiff_array_from_layout
+)
+
+
+@pytest.fixture
+def stack():
+    return np.random.default_rng(0).integers(0, 60000, size=(3, 2, 70, 90)).astype('uint16')
+
+
+def _write(path, data, **kwargs):
+    tifffile.imwrite(path, data, metadata={'axes': 'ZCYX'}, **kwargs)
+    return str(path)
+
+
+@pytest.mark.parametrize('layout, kwargs', [
+    ('contiguous', {}),
+    ('strips', dict(compression='zlib', rowsperstrip=16)),
+    ('tiles', dict(compression='zlib', tile=(32, 48))),
+])
+@pytest.mark.parametrize('chunks_yx', [None, (20, 30)])
+def test_read_matches_tifffile(tmp_path, stack, layout, kwargs, chunks_yx):
+    path = _write(tmp_path / f'{layout}.tif', stack, **kwargs)
+    expected = tifffile.imread(path)
+    arr = read_tiff_native(path, chunks_yx=chunks_yx)
+    assert arr.shape == (1, 2, 3, 70, 90)
+    np.testing.assert_array_equal(arr.compute(), expected.transpose(1, 0, 2, 3)[None])
+    # Uneven blocks at the edges, and a window across blocks.
+    np.testing.assert_array_equal(arr[0, 1, 2, 5:67, 11:89].compute(), expected[2, 1, 5:67, 11:89])
+
+
+@pytest.mark.parametrize('kwargs, mode, native_yx', [
+    ({}, 'memmap', (1, 1)),
+    (dict(compression='zlib', rowsperstrip=16), 'zarr', (16, 90)),
+    (dict(compression='zlib', tile=(32, 48)), 'zarr', (32, 48)),
+])
+def test_probe(tmp_path, stack, kwargs, mode, native_yx):
+    layout = probe_tiff(_write(tmp_path / 'image.tif', stack, **kwargs))
+    assert layout['axes'] == 'ZCYX'
+    assert layout['shape'] == stack.shape
+    assert layout['dtype'] == stack.dtype
+    assert (layout['mode'], layout['native_yx']) == (mode, native_yx)
+
+
+def test_probe_missing_series(tmp_path, stack):
+    assert probe_tiff(_write(tmp_path / 'image.tif', stack), series=1) is None
+
+
+def test_samples_become_channels(tmp_path):
+    rgb = np.random.default_rng(0).integers(0, 255, size=(40, 50, 3)).astype('uint8')
+    path = str(tmp_path / 'rgb.tif')
+    tifffile.imwrite(path, rgb, photometric='rgb')
+    arr = read_tiff_native(path)
+    assert arr.shape == (1, 3, 1, 40, 50)
+    np.testing.assert_array_equal(arr[0, :, 0].compute(), rgb.transpose(2, 0, 1))
+
+
+def test_blocks_follow_tiles(tmp_path, stack):
+    path = _write(tmp_path / 'tiles.tif', stack, compression='zlib', tile=(32, 48))
+    arr = read_tiff_native(path, chunks_yx=(50, 50))
+    assert arr.chunks[-2:] == ((64, 6), (48, 42))
+
+
+def test_layout_from_another_file(tmp_path, stack):
+    # A homogeneous collection is probed on one file; files stored differently are decoded instead.
+    layout = probe_tiff(_write(tmp_path / 'contiguous.tif', stack))
+    path = _write(tmp_path / 'tiles.tif', stack, compression='zlib', tile=(32, 48))
+    np.testing.assert_array_equal(tiff_array_from_layout(path, 0, layout)[0].compute(), stack.transpose(1, 0, 2, 3))
+    other = _write(tmp_path / 'other.tif', stack[:, :, :60])
+    with pytest.raises(ValueError, match='not homogeneous'):
+        tiff_array_from_layout(other, 0, layout).compute()
+
+
+@pytest.mark.parametrize('axes, expected', [
+    ('ZCYX', 'ZCYX'),
+    ('YXS', 'YXC'),
+    ('IYX', 'ZYX'),
+    ('QQYX', 'CZYX'),
+    ('CYXS', None),
+    ('ZY', None),
+])
+def test_map_axes(axes, expected):
+    assert map_axes_to_tczyx(axes) == expected
+
+
+def test_plan_yx_blocks():
+    assert plan_yx_blocks((100, 200), (16, 200), itemsize=2) == (100, 200)
+    assert plan_yx_blocks((100, 200), (16, 200), itemsize=2, chunks_yx=(50, 64)) == (48, 200)
+    side = plan_yx_blocks((10000, 10000), (1, 1), itemsize=1, max_block_mb=1)
+    assert side == (1024, 1024)
@@ -0,0 +1,252 @@
+import itertools, os
+
+import numpy as np
+import dask
+import dask.array as da
+import pytest
+import zarr
+
+import eubi_bridge.base.writers as writers
+from eubi_bridge.base.writers import (
+    ChunkManifest,
+    MANIFEST_DIRNAME,
+    format_compressor_params,
+    get_compressor,
+    is_constant_block,
+    _get_write_pool,
+    _plan_buffer_shape,
+    _write_pending_blocks,
+    store_arrays,
+    tune_compressor,
+    write_chunk_with_zarrpy,
+    write_with_shards
+)
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(1).integers(1, 1000, size=(4, 30, 40)).astype('uint16')
+
+
+def test_manifest_ignores_incomplete_lines(tmp_path):
+    manifest = ChunkManifest(tmp_path)
+    manifest.record([(0, 1, 2), (3, 4, 5)])
+    with open(os.path.join(manifest.directory, 'killed.log'), 'w') as f:
+        f.write('6,7,8\n9,1')
+    assert manifest.completed() == {(0, 1, 2), (3, 4, 5), (6, 7, 8)}
+    manifest.clear()
+    assert manifest.completed() == set()
+
+
+def test_resume_writes_only_missing_blocks(tmp_path, data):
+    store_path = str(tmp_path / 'array')
+    zarr_array = zarr.create_array(store_path, shape=data.shape, chunks=(2, 10, 20), dtype=data.dtype,
+                                   zarr_format=3)
+    manifest = ChunkManifest(store_path)
+    arr = da.from_array(data, chunks=(2, 10, 20))
+    written = []
+
+    def flaky_writer(block, block_info, fail, **kwargs):
+        start = tuple(start for start, _ in block_info[0]['array-location'])
+        if fail and len(written) >= 6:
+            raise RuntimeError('preempted')
+        written.append(start)
+        return write_chunk_with_zarrpy(block, block_info=block_info, **kwargs)
+
+    with pytest.raises(RuntimeError, match='preempted'):
+        dask.compute(_write_pending_blocks(arr, flaky_writer, manifest, (2, 10, 20),
+                                           zarr_array=zarr_array, fail=True), scheduler='threads')
+    first = set(written)
+    assert 0 < len(first) < 12
+    assert manifest.completed() == {(z // 2, y // 10, x // 20) for z, y, x in first}
+
+    written.clear()
+    dask.compute(_write_pending_blocks(arr, flaky_writer, manifest, (2, 10, 20),
+                                       zarr_array=zarr_array, fail=False), scheduler='threads')
+    assert first.isdisjoint(written)
+    assert len(first) + len(written) == 12
+    np.testing.assert_array_equal(zarr_array[:], data)
+    # Once the array is complete, only the marker is kept, and nothing is written again.
+    assert manifest.is_complete()
+    assert manifest.completed() == set()
+    written.clear()
+    dask.compute(_write_pending_blocks(arr, flaky_writer, manifest, (2, 10, 20),
+                                       zarr_array=zarr_array, fail=False), scheduler='threads')
+    assert written == []
+
+
+def _resumable_run(output_path, data, fail, read, **writer):
+    """Return a function writing the given images with resume; image name fails after fail[name] blocks."""
+    def maybe_fail(block, name, block_info=None):
+        start = tuple(start for start, _ in block_info[0]['array-location'])
+        if name in fail and sum(done == name for done, _ in read) >= fail[name]:
+            raise RuntimeError('preempted')
+        read.append((name, start))
+        return block
+
+    def run(*names):
+        arrays, keys = {}, {}
+        for name in names:
+            key = os.path.join(output_path, f'{name}.zarr', '0')
+            arrays[key] = da.from_array(data[None, None], chunks=(1, 1, 2, 10, 10)).map_blocks(
+                maybe_fail, name, dtype=data.dtype)
+            keys[name] = key
+        store_arrays(arrays, output_path, axes={key: 'tczyx' for key in arrays},
+                     scales={key: (1, 1, 1, 1, 1) for key in arrays},
+                     units={key: ['second', 'micrometer', 'micrometer', 'micrometer'] for key in arrays},
+                     auto_chunk=False, output_chunks={key: (1, 1, 2, 10, 10) for key in arrays},
+                     output_shard_coefficients={key: (1, 1, 1, 1, 2) for key in arrays},
+                     channel_meta={key: 'auto' for key in arrays},
+                     compute=True, overwrite=True, zarr_format=3, resume=True, **writer)
+        return keys
+    return run
+
+
+@pytest.mark.parametrize('writer', [dict(), dict(use_tensorstore=True), dict(assemble_shards=True),
+                                    dict(accumulate_chunks=True, accumulator_buffer_mb=0.001)])
+def test_store_arrays_resume(tmp_path, data, writer):
+    output_path = str(tmp_path / 'out')
+    key = os.path.join(output_path, 'image.zarr', '0')
+    fail = {'image': 16}
+    read = []
+    run = _resumable_run(output_path, data, fail, read, **writer)
+
+    with pytest.raises(RuntimeError, match='preempted'):
+        run('image')
+    assert os.path.isdir(os.path.join(key, MANIFEST_DIRNAME))
+    assert not np.array_equal(zarr.open_array(key, mode='r')[0, 0], data)
+    fail.clear()
+    read.clear()
+    run('image')
+    # Only the blocks of the shards that were not completed are read again.
+    assert 0 < len(read) < 24
+    np.testing.assert_array_equal(zarr.open_array(key, mode='r')[0, 0], data)
+    assert ChunkManifest(key).is_complete()
+
+
+@pytest.mark.parametrize('writer', [dict(), dict(use_tensorstore=True), dict(assemble_shards=True),
+                                    dict(accumulate_chunks=True, accumulator_buffer_mb=0.001)])
+def test_resume_skips_complete_arrays(tmp_path, data, writer):
+    output_path = str(tmp_path / 'out')
+    fail = {'unfinished': 16}
+    read = []
+    run = _resumable_run(output_path, data, fail, read, **writer)
+    run('finished')
+    with pytest.raises(RuntimeError, match='preempted'):
+        run('unfinished')
+    fail.clear()
+    read.clear()
+    keys = run('finished', 'unfinished')
+    assert not any(name == 'finished' for name, _ in read)
+    assert 0 < len(read) < 24
+    for key in keys.values():
+        np.testing.assert_array_equal(zarr.open_array(key, mode='r')[0, 0], data)
+        assert ChunkManifest(key).is_complete()
+
+
+def test_skipped_chunks_are_counted_per_chunk(tmp_path, data):
+    data = data.copy()
+    data[:, :10] = 0
+    data[2:] = 0
+    output_path = str(tmp_path / 'out')
+    key = os.path.join(output_path, 'image.zarr', '0')
+    # A block spans several chunks, of which only some are empty.
+    results = store_arrays({key: da.from_array(data[None, None], chunks=(1, 1, 2, 30, 40))}, output_path,
+                           axes={key: 'tczyx'}, scales={key: (1, 1, 1, 1, 1)},
+                           units={key: ['second', 'micrometer', 'micrometer', 'micrometer']},
+                           auto_chunk=False, output_chunks={key: (1, 1, 1, 10, 20)},
+                           output_shard_coefficients={key: (1, 1, 1, 1, 1)}, channel_meta={key: 'auto'},
+                           compute=False, overwrite=True, zarr_format=3, skip_empty_chunks=True)
+    skipped = int(np.sum(dask.compute(*results.values())[0]))
+    # Planes 0 and 1 have their first row of chunks empty, planes 2 and 3 are empty throughout.
+    assert skipped == 2 * 2 + 2 * 6
+    np.testing.assert_array_equal(zarr.open_array(key, mode='r')[0, 0], data)
+
+
+def test_async_writes_share_one_pool_per_process(tmp_path, data):
+    output_path = str(tmp_path / 'out')
+    keys = [os.path.join(output_path, f'image{i}.zarr', '0') for i in range(2)]
+    store_arrays({key: da.from_array(data[None, None], chunks=(1, 1, 2, 30, 40)) for key in keys}, output_path,
+                 axes={key: 'tczyx' for key in keys}, scales={key: (1, 1, 1, 1, 1) for key in keys},
+                 units={key: ['second', 'micrometer', 'micrometer', 'micrometer'] for key in keys},
+                 auto_chunk=False, output_chunks={key: (1, 1, 1, 10, 20) for key in keys},
+                 output_shard_coefficients={key: (1, 1, 1, 1, 1) for key in keys},
+                 channel_meta={key: 'auto' for key in keys},
+                 compute=True, overwrite=True, zarr_format=3, async_writes=True, max_inflight_writes=3)
+    for key in keys:
+        np.testing.assert_array_equal(zarr.open_array(key, mode='r')[0, 0], data)
+    pool = _get_write_pool(3)
+    assert pool is _get_write_pool(3)
+    assert pool._max_workers == 3
+
+
+CANDIDATES = [('blosc', dict(cname='lz4', clevel=1, shuffle=1)), ('zstd', dict(level=9))]
+
+
+@pytest.fixture
+def timed_candidates(monkeypatch):
+    """Benchmark two candidates only, the blosc one taking 1 s and the zstd one 0.5 s."""
+    monkeypatch.setattr(writers, 'get_compressor_candidates', lambda allow_pcodec: CANDIDATES)
+    clock = itertools.chain.from_iterable(itertools.repeat([0.0, 1.0, 0.0, 0.5]))
+    monkeypatch.setattr(writers.time, 'perf_counter', lambda: next(clock))
+
+
+def _ratio(name, params, samples):
+    codec = get_compressor(name, zarr_format=2, **params)
+    return sum(sample.nbytes for sample in samples) / sum(len(codec.encode(sample)) for sample in samples)
+
+
+def test_tune_compressor(timed_candidates, data):
+    samples = [data[:2], np.cumsum(data[2:], axis=-1, dtype='uint16')]
+    ratios = {name: _ratio(name, params, samples) for name, params in CANDIDATES}
+    name, params, ratio, throughput = tune_compressor(samples, min_throughput=0, tolerance=0)
+    assert ratio == max(ratios.values()) == ratios[name]
+    # Faster candidates within the tolerance of the best ratio win.
+    assert tune_compressor(samples, min_throughput=0, tolerance=1)[0] == 'zstd'
+    # Without any candidate fast enough, the fastest one is chosen.
+    name, params, ratio, throughput = tune_compressor(samples, min_throughput=float('inf'))
+    assert (name, params) == ('zstd', dict(level=9))
+    assert throughput == pytest.approx(sum(sample.nbytes for sample in samples) / 1e6 / 0.5)
+
+
+def test_compressor_params_per_format():
+    params = dict(cname='zstd', clevel=5, shuffle=2)
+    assert format_compressor_params('blosc', params, zarr_format=2) == params
+    assert format_compressor_params('blosc', params, zarr_format=3) == dict(cname='zstd', clevel=5, shuffle='bitshuffle')
+    assert format_compressor_params('zstd', dict(level=3), zarr_format=3) == dict(level=3)
+
+
+@pytest.mark.parametrize('blocks', [(1, 5, 10), (2, 10, 20), (3, 7, 15)], ids=['inner', 'shard', 'misaligned'])
+def test_write_with_shards_writes_each_shard_once(tmp_path, data, blocks, monkeypatch):
+    regions = []
+    write_shard = writers.write_shard
+
+    def recording(zarr_array, region, *args, **kwargs):
+        regions.append(tuple((sl.start, sl.stop) for sl in region))
+        return write_shard(zarr_array, region, *args, **kwargs)
+    monkeypatch.setattr(writers, 'write_shard', recording)
+    store_path = str(tmp_path / 'array')
+    dask.compute(write_with_shards(da.from_array(data, chunks=blocks), store_path, chunks=(1, 5, 10),
+                                   shards=(2, 10, 20)))
+    assert len(regions) == len(set(regions)) == 2 * 3 * 2
+    np.testing.assert_array_equal(zarr.open_array(store_path, mode='r')[:], data)
+
+
+@pytest.mark.parametrize('block_shape, cell_shape, budget_bytes, expected', [
+    ((1, 512, 512), (1, 64, 64), 1e9, (1, 512, 512)),              # a buffer spans a whole block
+    ((1, 512, 512), (1, 64, 64), 4 * 64 * 64 * 2, (1, 128, 128)), # halved to fit the budget
+    ((1, 1, 512), (4, 64, 64), 1e9, (4, 64, 512)),                 # planes accumulate into whole cells
+    ((1, 512, 512), (1, 64, 64), 1, (1, 64, 64)),                  # never below one cell
+])
+def test_plan_buffer_shape(block_shape, cell_shape, budget_bytes, expected):
+    assert _plan_buffer_shape(block_shape, cell_shape, itemsize=2, budget_bytes=budget_bytes) == expected
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float64'])
+def test_nan_blocks_are_constant(dtype):
+    block = np.full((4, 5), np.nan, dtype=dtype)
+    value = np.dtype(dtype).type(np.nan)
+    assert is_constant_block(block, value)
+    block[2, 3] = 1
+    assert not is_constant_block(block, value)
+    assert not is_constant_block(np.zeros((4, 5), dtype=dtype), value)